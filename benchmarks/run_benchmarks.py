@@ -0,0 +1,217 @@
+"""
+Benchmark Suite
+
+This module times the main pipeline steps on a synthetic dataset (see
+`benchmarks.synthetic`) and compares them against stored baselines:
+
+    startup    `main.py status` and `main.py --help`, the CLI's startup time
+    audit      auditor.run_deputy_audit for every deputy
+    report     reporter.generate_period_reports (mensal)
+    docx       doc_reporter.generate_word_report (mensal)
+    pipeline   the full `main.py` flow, as a subprocess
+
+Each benchmark runs in its own Python process, so its wall time and peak
+memory (max RSS) are measured in isolation. The pipeline reads the synthetic
+tree through the OPEN_EXPENSE_TRACKER_ROOT environment variable.
+
+A benchmark regresses when its time or peak memory exceeds the baseline by
+more than the tolerance; the suite then exits with status 1. Baselines are
+machine-specific: record them on the machine that runs the comparison with
+--update-baseline.
+
+Usage:
+    python -m benchmarks.run_benchmarks --scale small
+    python -m benchmarks.run_benchmarks --scale small --update-baseline
+    python main.py bench --scale small
+"""
+import argparse
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).parent.parent
+BASELINE_FILE = Path(__file__).parent / "baselines.json"
+ROOT_ENV_VAR = "OPEN_EXPENSE_TRACKER_ROOT"
+
+# Dataset sizes. 'full' is roughly the whole Chamber over 15 years.
+SCALES = {
+    "tiny": {"n_deputies": 1, "start_year": 2024, "end_year": 2024},
+    "small": {"n_deputies": 20, "start_year": 2023, "end_year": 2024},
+    "medium": {"n_deputies": 100, "start_year": 2021, "end_year": 2024},
+    "full": {"n_deputies": 513, "start_year": 2010, "end_year": 2024},
+}
+BENCHMARKS = ["startup", "audit", "report", "docx", "pipeline"]
+# Outputs a benchmark needs. Missing prerequisites are run first, untimed.
+BENCHMARK_DEPENDENCIES = {"report": ["audit"], "docx": ["audit", "report"]}
+PERIOD = "mensal"
+# Startup commands are timed as the best of this many runs.
+STARTUP_RUNS = 5
+
+# --- Single Benchmark (child process) ---
+
+def _peak_rss_mb(who=resource.RUSAGE_SELF) -> float:
+    """Returns the peak resident memory in MB (ru_maxrss is in KB on Linux)."""
+    return resource.getrusage(who).ru_maxrss / 1024
+
+def _time_startup() -> float:
+    """Returns the best wall time of the slower of `main.py status` and `main.py --help`."""
+    from src import config
+
+    best = {}
+    for command in (["status"], ["--help"]):
+        runs = []
+        for _ in range(STARTUP_RUNS):
+            started = time.perf_counter()
+            subprocess.run([sys.executable, str(PROJECT_DIR / "main.py"), *command],
+                           cwd=config.ROOT_DIR, check=True, stdout=subprocess.DEVNULL)
+            runs.append(time.perf_counter() - started)
+        best[command[0]] = min(runs)
+    return max(best.values())
+
+def _run_one(name: str, ref_date: datetime) -> dict:
+    """Runs one benchmark in this process and returns its measurements."""
+    if name == "startup":
+        # Measured before this process imports the pipeline, like a cold CLI call.
+        seconds = _time_startup()
+        return {"seconds": round(seconds, 3), "peak_rss_mb": round(_peak_rss_mb(resource.RUSAGE_CHILDREN), 1)}
+
+    import pandas as pd
+    from src import auditor, config, doc_reporter, reporter
+
+    config.ensure_directories()
+    deputies_df = pd.read_csv(config.RAW_DATA_DIR / "deputados.csv")
+    started = time.perf_counter()
+    if name == "audit":
+        for deputy_id in deputies_df['id']:
+            auditor.run_deputy_audit(deputy_id)
+    elif name == "report":
+        reporter.generate_period_reports(deputies_df, ref_date, PERIOD)
+    elif name == "docx":
+        report_data = doc_reporter.get_report_data(ref_date, PERIOD)
+        if doc_reporter.generate_word_report(ref_date, PERIOD, report_data) is None:
+            raise RuntimeError("No report data: run the 'report' benchmark first.")
+    elif name == "pipeline":
+        log_file = config.ROOT_DIR / "benchmark_pipeline.log"
+        subprocess.run(
+            [sys.executable, str(PROJECT_DIR / "main.py"), "run", "--date", ref_date.strftime('%Y-%m-%d'),
+             "--period", PERIOD, "--restart", "--log-file", str(log_file)],
+            cwd=config.ROOT_DIR, check=True, stdout=subprocess.DEVNULL,
+        )
+    else:
+        raise ValueError(f"Unknown benchmark '{name}'.")
+    seconds = time.perf_counter() - started
+    peak = _peak_rss_mb(resource.RUSAGE_CHILDREN if name == "pipeline" else resource.RUSAGE_SELF)
+    return {"seconds": round(seconds, 3), "peak_rss_mb": round(peak, 1)}
+
+# --- Suite ---
+
+def run_benchmark(name: str, root: Path, ref_date: datetime) -> dict:
+    """Runs a benchmark in a fresh Python process pointed at `root`."""
+    env = dict(os.environ, **{ROOT_ENV_VAR: str(root)})
+    result = subprocess.run(
+        [sys.executable, "-m", "benchmarks.run_benchmarks", "--run-one", name,
+         "--ref-date", ref_date.strftime('%Y-%m-%d')],
+        cwd=PROJECT_DIR, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Benchmark '{name}' failed:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def compare(results: dict, baselines: dict, tolerance: float) -> list:
+    """Returns a description of every metric that regressed beyond the tolerance."""
+    regressions = []
+    for name, measured in results.items():
+        baseline = baselines.get(name)
+        if not baseline:
+            continue
+        for metric in ("seconds", "peak_rss_mb"):
+            limit = baseline[metric] * (1 + tolerance)
+            if measured[metric] > limit:
+                regressions.append(
+                    f"{name}.{metric}: {measured[metric]} > {baseline[metric]} (+{tolerance:.0%} = {limit:.2f})"
+                )
+    return regressions
+
+def run_suite(scale: str, root: Path, benchmarks: list, tolerance: float, update_baseline: bool) -> int:
+    """Generates the dataset, runs the benchmarks and compares them with the baselines."""
+    from benchmarks import synthetic
+
+    dataset = synthetic.generate(root, **SCALES[scale])
+    ref_date = datetime(dataset["years"][-1], 12, 15)
+    needed = set(benchmarks).union(*(BENCHMARK_DEPENDENCIES.get(name, []) for name in benchmarks))
+    results = {}
+    for name in [name for name in BENCHMARKS if name in needed]:
+        if name not in benchmarks:
+            logging.info(f"Running '{name}' to prepare the data (not recorded)...")
+            run_benchmark(name, root, ref_date)
+            continue
+        logging.info(f"Running benchmark '{name}' ({scale})...")
+        results[name] = run_benchmark(name, root, ref_date)
+        if name in ("audit", "pipeline"):
+            results[name]["rows_per_s"] = round(dataset["rows"] / results[name]["seconds"], 1)
+        logging.info(f"{name}: {results[name]}")
+
+    all_baselines = json.loads(BASELINE_FILE.read_text()) if BASELINE_FILE.exists() else {}
+    baselines = all_baselines.get(scale, {})
+
+    print(f"\nScale '{scale}': {dataset['deputies']} deputies, {dataset['rows']} expenses")
+    print(f"{'benchmark':<10} {'seconds':>10} {'baseline':>10} {'peak MB':>10} {'baseline':>10} {'rows/s':>10}")
+    for name, measured in results.items():
+        baseline = baselines.get(name, {})
+        print(f"{name:<10} {measured['seconds']:>10} {baseline.get('seconds', '-'):>10} "
+              f"{measured['peak_rss_mb']:>10} {baseline.get('peak_rss_mb', '-'):>10} "
+              f"{measured.get('rows_per_s', '-'):>10}")
+
+    if update_baseline:
+        all_baselines[scale] = {**baselines, **results}
+        BASELINE_FILE.write_text(json.dumps(all_baselines, indent=4) + "\n")
+        print(f"\nBaselines for '{scale}' saved to {BASELINE_FILE}.")
+        return 0
+
+    regressions = compare(results, baselines, tolerance)
+    if not baselines:
+        print(f"\nNo baselines for '{scale}'. Record them with --update-baseline.")
+    elif regressions:
+        print("\nRegressions:\n  " + "\n  ".join(regressions))
+        return 1
+    else:
+        print("\nNo regressions.")
+    return 0
+
+def main(argv: list = None) -> int:
+    """Parses the command line and runs the suite (or one benchmark, in a child process)."""
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline on synthetic data.")
+    parser.add_argument("--scale", choices=list(SCALES), default="small")
+    parser.add_argument("--benchmarks", default=",".join(BENCHMARKS),
+                        help=f"Comma-separated subset of {','.join(BENCHMARKS)}.")
+    parser.add_argument("--root", default=None,
+                        help="Where to write the synthetic dataset (a temporary directory by default).")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed slowdown or memory growth over the baseline (0.25 = 25%%).")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="Store the results as the new baselines instead of comparing.")
+    parser.add_argument("--run-one", help=argparse.SUPPRESS)
+    parser.add_argument("--ref-date", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_one:
+        logging.basicConfig(level=logging.WARNING)
+        print(json.dumps(_run_one(args.run_one, datetime.strptime(args.ref_date, '%Y-%m-%d'))))
+        return 0
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    benchmarks = [name.strip() for name in args.benchmarks.split(",") if name.strip()]
+    if args.root:
+        return run_suite(args.scale, Path(args.root), benchmarks, args.tolerance, args.update_baseline)
+    with tempfile.TemporaryDirectory(prefix="oet-bench-") as tmp:
+        return run_suite(args.scale, Path(tmp), benchmarks, args.tolerance, args.update_baseline)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+"""
+Shard Check
+
+This module checks on one machine that a sharded run gives the same results
+as a single-node run. It writes a synthetic dataset (see
+`benchmarks.synthetic`) and runs, each in its own data tree:
+
+    single     the whole pipeline, sequentially
+    shard-i    `--shard i/N` for i = 1..N, as N parallel processes: first the
+               download stage of every shard, then the audit and report stages
+    merge      `--merge-shards N` over the shards' outputs
+
+Each shard tree only holds its own deputies' raw files, like a machine that
+downloaded its slice. The check then compares the period reports, the flagged
+expenses files and the shared datastore tables (and their search indexes) of
+the merged tree with those of the single-node tree, and exits with status 1 on
+any difference.
+
+Usage:
+    python -m benchmarks.shard_check --shards 3
+    python -m benchmarks.shard_check --shards 4 --deputies 40 --root /tmp/shard-check
+"""
+import argparse
+import filecmp
+import logging
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+import pandas as pd
+
+PROJECT_DIR = Path(__file__).parent.parent
+ROOT_ENV_VAR = "OPEN_EXPENSE_TRACKER_ROOT"
+PERIOD = "mensal"
+
+# --- Runs ---
+
+def _start(root: Path, args: list) -> subprocess.Popen:
+    """Starts `main.py` on the data tree at `root`."""
+    env = dict(os.environ, **{ROOT_ENV_VAR: str(root)})
+    return subprocess.Popen(
+        [sys.executable, str(PROJECT_DIR / "main.py"), *args, "--log-file", str(root / "pipeline.log")],
+        cwd=root, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+    )
+
+def _wait(processes: dict):
+    """Waits for the named processes and raises if any of them failed."""
+    failed = []
+    for name, process in processes.items():
+        _, stderr = process.communicate()
+        if process.returncode != 0:
+            failed.append(f"{name} (exit {process.returncode}):\n{stderr[-2000:]}")
+    if failed:
+        raise RuntimeError("Pipeline runs failed:\n" + "\n".join(failed))
+
+def _make_shard_tree(source: Path, target: Path, deputy_ids: list):
+    """Lays out a shard's data tree with only its deputies' raw files."""
+    raw_dir = target / "data" / "raw"
+    (raw_dir / "expenses").mkdir(parents=True)
+    for name in ("deputados.csv", "download_summary.json"):
+        shutil.copyfile(source / "data" / "raw" / name, raw_dir / name)
+    for deputy_id in deputy_ids:
+        shutil.copytree(source / "data" / "raw" / "expenses" / str(deputy_id), raw_dir / "expenses" / str(deputy_id))
+
+def run_trees(root: Path, n_shards: int, ref_date: datetime):
+    """Runs the single-node pipeline, the shards and the merge under `root`."""
+    from src import sharding
+
+    source = root / "source"
+    deputy_ids = pd.read_csv(source / "data" / "raw" / "deputados.csv")['id']
+    shutil.copytree(source, root / "single")
+    for index in range(1, n_shards + 1):
+        _make_shard_tree(source, root / f"shard-{index}",
+                         [deputy_id for deputy_id in deputy_ids if sharding.shard_of(deputy_id, n_shards) == index])
+    (root / "merge" / "data" / "raw").mkdir(parents=True)
+    shutil.copyfile(source / "data" / "raw" / "deputados.csv", root / "merge" / "data" / "raw" / "deputados.csv")
+
+    common = ["--date", ref_date.strftime('%Y-%m-%d'), "--period", PERIOD]
+    shard_dir = str(root / "shards")
+    logging.info(f"Running the single-node pipeline and the download stage of {n_shards} shards...")
+    processes = {"single": _start(root / "single", ["run", *common, "--sequential"])}
+    for index in range(1, n_shards + 1):
+        processes[f"shard {index}"] = _start(
+            root / f"shard-{index}", ["download", *common, "--shard", f"{index}/{n_shards}", "--shard-dir", shard_dir]
+        )
+    _wait(processes)
+    logging.info(f"Running the audit and report stages of {n_shards} shards...")
+    _wait({
+        f"shard {index}": _start(root / f"shard-{index}", [
+            "run", *common, "--stages", "audit,report", "--shard", f"{index}/{n_shards}", "--shard-dir", shard_dir
+        ])
+        for index in range(1, n_shards + 1)
+    })
+    logging.info("Merging the shards...")
+    _wait({"merge": _start(root / "merge", ["run", *common, "--merge-shards", str(n_shards), "--shard-dir", shard_dir])})
+
+# --- Comparison ---
+
+def _read_table(datastore_file: Path, table: str) -> pd.DataFrame:
+    """Reads a table in a deterministic order: by deputy, then as inserted."""
+    with sqlite3.connect(datastore_file) as conn:
+        columns = [row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')]
+        if not columns:
+            return pd.DataFrame()
+        order = "deputy_id, rowid" if "deputy_id" in columns else "rowid"
+        return pd.read_sql_query(f'SELECT * FROM "{table}" ORDER BY {order}', conn)
+
+def _read_search_index(datastore_file: Path, table: str, search_table: str) -> pd.DataFrame:
+    """Reads the indexed text of each row of a table, in the order of `_read_table`."""
+    with sqlite3.connect(datastore_file) as conn:
+        return pd.read_sql_query(
+            f'SELECT s.* FROM "{search_table}" s JOIN "{table}" t ON t.rowid = s.rowid '
+            f'ORDER BY t.deputy_id, t.rowid', conn
+        )
+
+def compare_trees(single: Path, merged: Path) -> list:
+    """Returns a description of every output of the merged tree that differs from the single-node one."""
+    from src import datastore, sharding
+
+    differences = []
+    reports = sorted(path.name for path in (single / "reports").glob("*.csv"))
+    if not reports:
+        differences.append("the single-node run wrote no reports")
+    for name in reports:
+        if not filecmp.cmp(single / "reports" / name, merged / "reports" / name, shallow=False):
+            differences.append(f"report {name}")
+
+    flagged_dir = Path("data") / "processed" / "flags_and_scores"
+    single_flagged = sorted(path.relative_to(single) for path in (single / flagged_dir).glob("*/flagged_expenses.csv"))
+    merged_flagged = sorted(path.relative_to(merged) for path in (merged / flagged_dir).glob("*/flagged_expenses.csv"))
+    if single_flagged != merged_flagged:
+        differences.append(f"flagged expenses files: {len(single_flagged)} vs {len(merged_flagged)}")
+    for path in single_flagged:
+        if path in merged_flagged and not filecmp.cmp(single / path, merged / path, shallow=False):
+            differences.append(f"flagged expenses file {path}")
+
+    datastore_file = Path("data") / "processed" / "expenses.db"
+    for table in sharding.SHARED_TABLES:
+        expected, actual = _read_table(single / datastore_file, table), _read_table(merged / datastore_file, table)
+        if not expected.equals(actual):
+            differences.append(f"datastore table {table}: {len(expected)} vs {len(actual)} rows")
+    for table, search_table in datastore.SEARCH_TABLES.items():
+        expected = _read_search_index(single / datastore_file, table, search_table)
+        actual = _read_search_index(merged / datastore_file, table, search_table)
+        if not expected.equals(actual):
+            differences.append(f"search index {search_table}: {len(expected)} vs {len(actual)} rows")
+    return differences
+
+# --- Entry Point ---
+
+def run_check(root: Path, n_shards: int, n_deputies: int, start_year: int, end_year: int) -> int:
+    """Generates the dataset, runs the trees and compares them."""
+    from benchmarks import synthetic
+
+    dataset = synthetic.generate(root / "source", n_deputies, start_year, end_year)
+    run_trees(root, n_shards, datetime(dataset["years"][-1], 12, 15))
+    differences = compare_trees(root / "single", root / "merge")
+    if differences:
+        print(f"\nThe merge of {n_shards} shards differs from the single-node run:\n  " + "\n  ".join(differences))
+        return 1
+    print(f"\nThe merge of {n_shards} shards is identical to the single-node run.")
+    return 0
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Check that a sharded run matches a single-node run.")
+    parser.add_argument("--shards", type=int, default=3)
+    parser.add_argument("--deputies", type=int, default=12)
+    parser.add_argument("--start-year", type=int, default=2023)
+    parser.add_argument("--end-year", type=int, default=2024)
+    parser.add_argument("--root", default=None,
+                        help="Where to write the data trees (a temporary directory by default). Must not exist.")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if args.root:
+        return run_check(Path(args.root), args.shards, args.deputies, args.start_year, args.end_year)
+    with tempfile.TemporaryDirectory(prefix="oet-shards-") as tmp:
+        return run_check(Path(tmp), args.shards, args.deputies, args.start_year, args.end_year)
+
+if __name__ == "__main__":
+    sys.exit(main())
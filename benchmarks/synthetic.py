@@ -0,0 +1,192 @@
+"""
+Synthetic Data Generator
+
+This module writes a realistic, reproducible dataset in the same layout the
+downloader produces (deputados.csv, expenses/{id}/{year}-{month}.csv and the
+download summary), with the columns the Câmara API returns. It is used by the
+benchmark suite and for development without network access or production data.
+
+The generated expenses carry the patterns the auditor looks for: weekend
+expenses, round values, outliers, duplicated transactions, formatted,
+float-shaped and missing supplier documents, so every flag has work to do.
+
+Usage:
+    python -m benchmarks.synthetic --root /tmp/oet --deputies 513 --start-year 2010 --end-year 2024
+"""
+import argparse
+import json
+import logging
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+PARTIES = ["PL", "PT", "UNIÃO", "PP", "MDB", "PSD", "REPUBLICANOS", "PDT", "PSB", "PSDB", "PSOL", "NOVO"]
+UFS = ["SP", "MG", "RJ", "BA", "RS", "PR", "PE", "CE", "PA", "MA", "GO", "SC", "PB", "ES", "AM", "DF"]
+
+# Expense types with their share of expenses and the median and spread of
+# their values (log-normal).
+EXPENSE_TYPES = {
+    "COMBUSTÍVEIS E LUBRIFICANTES.": (0.30, 250.0, 0.6),
+    "DIVULGAÇÃO DA ATIVIDADE PARLAMENTAR.": (0.10, 4000.0, 0.9),
+    "LOCAÇÃO OU FRETAMENTO DE VEÍCULOS AUTOMOTORES": (0.08, 6000.0, 0.5),
+    "TELEFONIA": (0.10, 150.0, 0.7),
+    "FORNECIMENTO DE ALIMENTAÇÃO DO PARLAMENTAR": (0.12, 80.0, 0.7),
+    "HOSPEDAGEM ,EXCETO DO PARLAMENTAR NO DISTRITO FEDERAL.": (0.06, 400.0, 0.6),
+    "PASSAGEM AÉREA - SIGEPA": (0.10, 1200.0, 0.5),
+    "MANUTENÇÃO DE ESCRITÓRIO DE APOIO À ATIVIDADE PARLAMENTAR": (0.08, 1500.0, 0.8),
+    "CONSULTORIAS, PESQUISAS E TRABALHOS TÉCNICOS.": (0.04, 8000.0, 0.7),
+    "SERVIÇO DE TÁXI, PEDÁGIO E ESTACIONAMENTO": (0.02, 60.0, 0.6),
+}
+
+EXPENSE_COLUMNS = [
+    "ano", "mes", "tipoDespesa", "codDocumento", "tipoDocumento", "codTipoDocumento",
+    "dataDocumento", "numDocumento", "valorDocumento", "urlDocumento", "nomeFornecedor",
+    "cnpjCpfFornecedor", "cnpjCpfFornecedorFormatado", "valorLiquido", "valorGlosa",
+    "numRessarcimento", "codLote", "parcela",
+]
+
+# --- Suppliers ---
+
+def _check_digits(base: np.ndarray, weights: list) -> np.ndarray:
+    remainder = (base @ np.array(weights)) % 11
+    return np.where(remainder < 2, 0, 11 - remainder)
+
+def _make_cnpjs(rng: np.random.Generator, n: int) -> list:
+    base = np.column_stack([rng.integers(0, 10, size=(n, 8)), np.tile([0, 0, 0, 1], (n, 1))])
+    dv1 = _check_digits(base, [5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2])
+    dv2 = _check_digits(np.column_stack([base, dv1]), [6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2])
+    digits = np.column_stack([base, dv1, dv2])
+    return ["".join(map(str, row)) for row in digits]
+
+def _make_cpfs(rng: np.random.Generator, n: int) -> list:
+    base = rng.integers(0, 10, size=(n, 9))
+    dv1 = _check_digits(base, list(range(10, 1, -1)))
+    dv2 = _check_digits(np.column_stack([base, dv1]), list(range(11, 1, -1)))
+    digits = np.column_stack([base, dv1, dv2])
+    return ["".join(map(str, row)) for row in digits]
+
+def make_suppliers(rng: np.random.Generator, n_suppliers: int) -> pd.DataFrame:
+    """Generates suppliers, each specialized in one expense type. About 5% are people (CPF)."""
+    n_cpf = max(n_suppliers // 20, 1)
+    documents = _make_cnpjs(rng, n_suppliers - n_cpf) + _make_cpfs(rng, n_cpf)
+    expense_types = list(EXPENSE_TYPES)
+    weights = np.array([share for share, _, _ in EXPENSE_TYPES.values()])
+    suppliers = pd.DataFrame({
+        "cnpjCpfFornecedor": documents,
+        "nomeFornecedor": [f"FORNECEDOR {i:06d} LTDA" for i in range(n_suppliers)],
+        "tipoDespesa": rng.choice(expense_types, size=n_suppliers, p=weights / weights.sum()),
+    })
+    # A few suppliers with missing or mistyped documents.
+    broken = rng.random(n_suppliers) < 0.02
+    suppliers.loc[broken, "cnpjCpfFornecedor"] = rng.choice(["", "00000000000000", "12345678000100"], size=broken.sum())
+    return suppliers
+
+# --- Deputies & Expenses ---
+
+def make_deputies(rng: np.random.Generator, n_deputies: int) -> pd.DataFrame:
+    """Generates the deputies list with the columns of the /deputados endpoint."""
+    ids = np.arange(n_deputies) + 200000
+    return pd.DataFrame({
+        "id": ids,
+        "uri": [f"https://dadosabertos.camara.leg.br/api/v2/deputados/{i}" for i in ids],
+        "nome": [f"Deputado Sintético {i:03d}" for i in range(n_deputies)],
+        "siglaPartido": rng.choice(PARTIES, size=n_deputies),
+        "uriPartido": "",
+        "siglaUf": rng.choice(UFS, size=n_deputies),
+        "idLegislatura": 57,
+        "urlFoto": "",
+        "email": "",
+    })
+
+def make_deputy_expenses(rng: np.random.Generator, deputy_id: int, suppliers: pd.DataFrame,
+                         years: list, expenses_per_month: int) -> pd.DataFrame:
+    """Generates every expense of a deputy for the given years."""
+    months = pd.period_range(f"{years[0]}-01", f"{years[-1]}-12", freq="M")
+    counts = rng.poisson(expenses_per_month, size=len(months))
+    n = int(counts.sum())
+    month_of_row = np.repeat(months, counts)
+
+    # Each deputy works with a limited set of regular suppliers.
+    regulars = suppliers.sample(n=min(len(suppliers), 40), random_state=int(rng.integers(1 << 31)))
+    chosen = regulars.iloc[rng.integers(0, len(regulars), size=n)].reset_index(drop=True)
+    medians = chosen["tipoDespesa"].map({t: median for t, (_, median, _) in EXPENSE_TYPES.items()})
+    spreads = chosen["tipoDespesa"].map({t: spread for t, (_, _, spread) in EXPENSE_TYPES.items()})
+    values = np.round(medians.to_numpy() * np.exp(rng.normal(0, spreads.to_numpy())), 2)
+    round_values = rng.random(n) < 0.05
+    values[round_values] = np.round(values[round_values], -2).clip(min=100)
+
+    days = rng.integers(1, 29, size=n)
+    dates = pd.to_datetime({"year": month_of_row.year, "month": month_of_row.month, "day": days})
+    df = pd.DataFrame({
+        "ano": month_of_row.year,
+        "mes": month_of_row.month,
+        "tipoDespesa": chosen["tipoDespesa"],
+        "codDocumento": rng.integers(1_000_000, 9_999_999, size=n),
+        "tipoDocumento": "Nota Fiscal Eletrônica",
+        "codTipoDocumento": 4,
+        "dataDocumento": dates.dt.strftime("%Y-%m-%dT00:00:00"),
+        "numDocumento": rng.integers(1, 999_999, size=n).astype(str),
+        "valorDocumento": values,
+        "urlDocumento": "https://www.camara.leg.br/cota-parlamentar/nota-fiscal-eletronica",
+        "nomeFornecedor": chosen["nomeFornecedor"],
+        "cnpjCpfFornecedor": chosen["cnpjCpfFornecedor"],
+        "cnpjCpfFornecedorFormatado": chosen["cnpjCpfFornecedor"],
+        "valorLiquido": values,
+        "valorGlosa": 0.0,
+        "numRessarcimento": "",
+        "codLote": rng.integers(1_000_000, 9_999_999, size=n),
+        "parcela": 0,
+    }, columns=EXPENSE_COLUMNS)
+
+    # About 1% of the expenses are submitted twice.
+    duplicates = df.sample(frac=0.01, random_state=int(rng.integers(1 << 31)))
+    return pd.concat([df, duplicates], ignore_index=True)
+
+# --- Writing ---
+
+def generate(root: Path, n_deputies: int = 20, start_year: int = 2023, end_year: int = 2024,
+             expenses_per_month: int = 30, n_suppliers: int = None, seed: int = 42) -> dict:
+    """
+    Writes a synthetic dataset under `root` (laid out like the project root) and
+    returns a summary with the number of deputies and expense rows written.
+    """
+    rng = np.random.default_rng(seed)
+    raw_dir = Path(root) / "data" / "raw"
+    expenses_dir = raw_dir / "expenses"
+    expenses_dir.mkdir(parents=True, exist_ok=True)
+    years = list(range(start_year, end_year + 1))
+
+    suppliers = make_suppliers(rng, n_suppliers or max(200, n_deputies * 20))
+    deputies = make_deputies(rng, n_deputies)
+    deputies.to_csv(raw_dir / "deputados.csv", index=False)
+
+    total_rows = 0
+    summary = {}
+    for deputy_id in deputies["id"]:
+        expenses = make_deputy_expenses(rng, deputy_id, suppliers, years, expenses_per_month)
+        deputy_dir = expenses_dir / str(deputy_id)
+        deputy_dir.mkdir(exist_ok=True)
+        for (year, month), month_df in expenses.groupby(["ano", "mes"]):
+            month_df.to_csv(deputy_dir / f"{year}-{month:02d}.csv", index=False)
+        summary[str(deputy_id)] = years
+        total_rows += len(expenses)
+
+    # Mark every generated year as downloaded so the pipeline does not call the API.
+    with open(raw_dir / "download_summary.json", "w") as f:
+        json.dump(summary, f, indent=4)
+    logging.info(f"Synthetic dataset written to {root}: {n_deputies} deputies, {total_rows} expenses.")
+    return {"deputies": n_deputies, "rows": total_rows, "years": years}
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Generate a synthetic expenses dataset.")
+    parser.add_argument("--root", required=True, help="Directory laid out like the project root.")
+    parser.add_argument("--deputies", type=int, default=20)
+    parser.add_argument("--start-year", type=int, default=2023)
+    parser.add_argument("--end-year", type=int, default=2024)
+    parser.add_argument("--expenses-per-month", type=int, default=30)
+    parser.add_argument("--suppliers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    generate(Path(args.root), args.deputies, args.start_year, args.end_year,
+             args.expenses_per_month, args.suppliers, args.seed)
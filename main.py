@@ -1,20 +1,33 @@
 """
 Main Orchestrator
 
-This script serves as the main entry point to run the data pipeline.
-It orchestrates the process of downloading, auditing, and generating CSV reports.
-The DOCX report is now generated on-demand via the Streamlit interface.
+This script is the command-line entry point of the pipeline:
+
+    python main.py run        download, audit and report (the default command)
+    python main.py download   only the download stage
+    python main.py audit      only the audit stage
+    python main.py report     only the CSV report stage
+    python main.py status     pipeline process, jobs, stage progress and latest reports
+    python main.py bench      the benchmark suite (see benchmarks.run_benchmarks)
+
+Options given without a command run the full pipeline, as before commands
+existed. Only the standard library and the configuration are imported at
+startup: the pipeline (pandas, requests, scipy...) is imported by the commands
+that run it, so `status` and `--help` answer immediately. The DOCX report is
+generated on-demand via the Streamlit interface.
 """
 import argparse
-import pandas as pd
 import logging
 import sys
+from collections import Counter
 from datetime import datetime
-from dateutil.relativedelta import relativedelta
-from src import downloader, config, auditor, reporter, summary_manager
+from src import config
+
+PIPELINE_STAGES = ['download', 'audit', 'report']
+COMMANDS = ['run'] + PIPELINE_STAGES + ['status', 'bench']
 
 # --- Logger Configuration ---
-def setup_logger():
+def setup_logger(log_file: str = "pipeline.log"):
     """Configures the logger to stream INFO to console and file."""
     logger = logging.getLogger()
     logger.setLevel(logging.INFO)
@@ -28,9 +41,9 @@ def setup_logger():
     stream_handler.setLevel(logging.INFO)
     stream_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
     stream_handler.setFormatter(stream_formatter)
-    
+
     # File handler for log file
-    file_handler = logging.FileHandler("pipeline.log", mode='w')
+    file_handler = logging.FileHandler(log_file, mode='w')
     file_handler.setLevel(logging.INFO)
     file_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(filename)s:%(lineno)d - %(message)s')
     file_handler.setFormatter(file_formatter)
@@ -38,51 +51,139 @@ def setup_logger():
     logger.addHandler(stream_handler)
     logger.addHandler(file_handler)
 
-def get_deputies(limit: int = None) -> pd.DataFrame:
-    """Loads the deputies dataframe from the local CSV file."""
-    downloader.download_deputies()
-    deputies_df = pd.read_csv(config.RAW_DATA_DIR / "deputados.csv")
-    if limit:
-        return deputies_df.head(limit)
-    return deputies_df
-
-def run_download_pipeline(processing_date: datetime, limit: int = None) -> pd.DataFrame:
-    """Runs the data download pipeline using the summary file for efficiency."""
-    logging.info("--- Starting Download Pipeline ---")
-    deputies_df = get_deputies(limit)
-    logging.info(f"Processing {len(deputies_df)} deputies.")
-    summary_data = summary_manager.load_summary()
-    years_to_check = set(
-        (processing_date - relativedelta(months=i)).year
-        for i in range(config.MONTHS_OF_HISTORY)
-    )
-    for _, deputy in deputies_df.iterrows():
-        deputy_id = deputy['id']
-        for year in sorted(list(years_to_check)):
-            if summary_manager.check_if_downloaded(summary_data, deputy_id, year):
-                continue
-            downloader.download_deputy_expenses(deputy_id, year)
-    logging.info("--- Download Pipeline Finished ---")
-    return deputies_df
-
-def run_audit_pipeline(deputies_df: pd.DataFrame):
-    """Runs the data auditing pipeline."""
-    logging.info("--- Starting Audit Pipeline ---")
-    for _, deputy in deputies_df.iterrows():
-        auditor.run_deputy_audit(deputy['id'])
-    logging.info("--- Audit Pipeline Finished ---")
-
-def run_report_pipeline(deputies_df: pd.DataFrame, processing_date: datetime, period: str):
-    """Runs the CSV report generation pipeline for the specified period."""
-    logging.info(f"--- Starting CSV Report Pipeline for period: {period} ---")
-    reporter.generate_period_reports(deputies_df, processing_date, period)
-    logging.info("--- CSV Report Pipeline Finished ---")
-
-def main():
-    """Main function to run the pipeline."""
-    setup_logger()
-    
-    parser = argparse.ArgumentParser(description="Run the Open Expense Tracker pipeline.")
+# --- Pipeline Commands ---
+
+def run_pipeline_command(args: argparse.Namespace, stages: list):
+    """Runs the given pipeline stages, the daemon or a shard merge with the parsed options."""
+    from src import aggregates, checkpoint, daemon, pipeline, progress, shared_dataset, sharding
+
+    setup_logger(args.log_file)
+    config.ensure_directories()
+
+    if args.daemon:
+        daemon.run_daemon(args.interval, args.limit)
+        return
+
+    try:
+        processing_date = datetime.strptime(args.date, '%Y-%m-%d')
+    except ValueError:
+        logging.error("Invalid date format. Please use YYYY-MM-DD.")
+        sys.exit(1)
+
+    invalid_stages = set(stages) - set(PIPELINE_STAGES)
+    if invalid_stages:
+        logging.error(f"Invalid stages: {sorted(invalid_stages)}. Choose from {PIPELINE_STAGES}.")
+        sys.exit(1)
+
+    if args.merge_shards:
+        aggregates.refresh_deputies(pipeline.get_deputies(args.limit, args.full_history))
+        try:
+            sharding.merge_shards(args.merge_shards, processing_date, args.period, args.shard_dir)
+        except sharding.ShardError as e:
+            logging.error(str(e))
+            sys.exit(1)
+        shared_dataset.publish()
+        return
+
+    shard = None
+    if args.shard:
+        try:
+            shard = sharding.parse_shard(args.shard)
+        except sharding.ShardError as e:
+            logging.error(str(e))
+            sys.exit(1)
+
+    logging.info(f"Starting the audit pipeline for date: {args.date}, period: {args.period}, stages: {stages}")
+    # Scheduler jobs share the progress file with other running stages.
+    if not args.job_id:
+        progress.reset()
+
+    deputies_df = pipeline.get_deputies(args.limit, args.full_history)
+    if shard:
+        deputies_df = sharding.select_deputies(deputies_df, *shard)
+        logging.info(f"Shard {args.shard}: {len(deputies_df)} deputies.")
+    # The out-of-core audit needs every deputy downloaded before it starts, so
+    # it cannot overlap with the downloads.
+    out_of_core_limit_mb = args.memory_limit if args.out_of_core or args.full_history else None
+    run_checkpoint = checkpoint.RunCheckpoint(args.date, args.period, args.limit, args.shard)
+    if args.restart:
+        for stage in stages:
+            run_checkpoint.complete_stage(stage)
+    try:
+        if shard:
+            pipeline.run_shard_pipeline(stages, deputies_df, processing_date, args.period, run_checkpoint,
+                                        shard, args.shard_dir, args.full_history, out_of_core_limit_mb)
+        elif 'download' in stages and 'audit' in stages and not args.sequential and not out_of_core_limit_mb:
+            report_period = args.period if 'report' in stages else None
+            pipeline.run_streaming_pipeline(deputies_df, processing_date, run_checkpoint, report_period)
+        else:
+            if 'download' in stages:
+                pipeline.run_download_pipeline(processing_date, deputies_df, run_checkpoint, args.full_history)
+            if 'audit' in stages:
+                pipeline.run_audit_pipeline(deputies_df, run_checkpoint, out_of_core_limit_mb, args.full_history)
+            if 'report' in stages:
+                pipeline.run_report_pipeline(deputies_df, processing_date, args.period)
+    except sharding.ShardError as e:
+        logging.error(str(e))
+        sys.exit(1)
+    except checkpoint.PipelinePaused:
+        logging.info("Pause requested. Progress saved to checkpoint; run the same command again to resume.")
+        sys.exit(checkpoint.PAUSED_EXIT_CODE)
+
+    # Shard trees are not served; the merged tree is published after --merge-shards.
+    if not shard:
+        shared_dataset.publish()
+    logging.info("Pipeline finished.")
+
+# --- Status Command ---
+
+def get_status() -> dict:
+    """
+    Collects the pipeline state from its state files (process, jobs, progress
+    events, checkpoints and reports), without importing the pipeline.
+    """
+    from src import checkpoint, process_manager, progress
+
+    jobs = process_manager.list_jobs() if process_manager.JOBS_FILE.exists() else []
+    stages = progress.latest_by_stage(progress.read_events())
+    return {
+        "process": process_manager.get_process_info(),
+        "pause_requested": checkpoint.pause_requested(),
+        "jobs": dict(Counter(job["status"] for job in jobs)),
+        "stages": {
+            stage: {key: event[key] for key in ("status", "completed", "total", "errors", "eta_s")}
+            for stage, event in stages.items()
+        },
+        "interrupted_runs": checkpoint.list_checkpoints(),
+        "latest_reports": [path.name for path in sorted(config.REPORTS_DIR.glob("*.csv"), reverse=True)[:3]],
+    }
+
+def print_status(as_json: bool = False):
+    """Prints the pipeline state, as text or JSON."""
+    import json
+
+    status = get_status()
+    if as_json:
+        print(json.dumps(status, indent=4, ensure_ascii=False))
+        return
+    process = status["process"]
+    print(f"Pipeline: {process['status']} (PID {process['pid']})" if process else "Pipeline: not running")
+    print(f"Pause requested: {'yes' if status['pause_requested'] else 'no'}")
+    jobs = ", ".join(f"{state} {count}" for state, count in status["jobs"].items())
+    print(f"Jobs: {jobs or 'none'}")
+    for stage, event in status["stages"].items():
+        eta = f", ETA {event['eta_s']}s" if event["eta_s"] is not None else ""
+        print(f"  {stage:<9} {event['status']:<9} {event['completed']}/{event['total']}, "
+              f"{event['errors']} errors{eta}")
+    for run in status["interrupted_runs"]:
+        completed = ", ".join(f"{stage} {count}" for stage, count in run["completed"].items())
+        print(f"Interrupted run: {run['date']} {run['period']} ({completed or 'nothing completed'})")
+    print(f"Latest reports: {', '.join(status['latest_reports']) or 'none'}")
+
+# --- Argument Parsing ---
+
+def _add_pipeline_arguments(parser: argparse.ArgumentParser):
+    """Adds the options shared by the commands that run pipeline stages."""
     parser.add_argument(
         '--date', type=str, default=datetime.now().strftime('%Y-%m-%d'),
         help="The reference date for the analysis in YYYY-MM-DD format."
@@ -94,21 +195,97 @@ def main():
     parser.add_argument(
         '--limit', type=int, help="Limit the number of deputies to process."
     )
-    args = parser.parse_args()
+    parser.add_argument(
+        '--full-history', action='store_true',
+        help=f"Process every deputy and expense since {config.HISTORY_START_YEAR} (implies --out-of-core)."
+    )
+    parser.add_argument(
+        '--out-of-core', action='store_true',
+        help="Audit each deputy's history in chunks under a memory ceiling (see --memory-limit)."
+    )
+    parser.add_argument(
+        '--memory-limit', type=int, default=config.OUT_OF_CORE_MEMORY_MB,
+        help="Memory ceiling of the out-of-core audit, in MB."
+    )
+    parser.add_argument(
+        '--shard', type=str,
+        help="Process only the i-th of N disjoint slices of the deputies, e.g. 1/4 (see --merge-shards)."
+    )
+    parser.add_argument(
+        '--shard-dir', type=str, default=None,
+        help="Directory where shards exchange their outputs. Defaults to data/shards."
+    )
+    parser.add_argument(
+        '--restart', action='store_true',
+        help="Ignore the checkpoint of a previously interrupted run and start from scratch."
+    )
+    parser.add_argument(
+        '--job-id', type=str, help="ID of the scheduler job this run belongs to, if any."
+    )
+    parser.add_argument(
+        '--log-file', type=str, default="pipeline.log", help="File the run's log is written to."
+    )
 
-    try:
-        processing_date = datetime.strptime(args.date, '%Y-%m-%d')
-    except ValueError:
-        logging.error("Invalid date format. Please use YYYY-MM-DD.")
-        return
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Run the Open Expense Tracker pipeline.")
+    commands = parser.add_subparsers(dest='command', metavar='command')
 
-    logging.info(f"Starting the audit pipeline for date: {args.date}, period: {args.period}")
-    
-    processed_deputies_df = run_download_pipeline(processing_date, args.limit)
-    run_audit_pipeline(processed_deputies_df)
-    run_report_pipeline(processed_deputies_df, processing_date, args.period)
-    
-    logging.info("Pipeline finished.")
+    run_parser = commands.add_parser('run', help="Run the pipeline stages (all of them by default).")
+    _add_pipeline_arguments(run_parser)
+    run_parser.add_argument(
+        '--stages', type=str, default=','.join(PIPELINE_STAGES),
+        help="Comma-separated stages to run, in order: download, audit, report."
+    )
+    run_parser.add_argument(
+        '--sequential', action='store_true',
+        help="Run download, audit and report one after the other instead of overlapping them."
+    )
+    run_parser.add_argument(
+        '--merge-shards', type=int, metavar='N',
+        help="Merge the outputs of N shards into the global reports and dashboard tables."
+    )
+    run_parser.add_argument(
+        '--daemon', action='store_true',
+        help="Stay resident and refresh the current month on a schedule (see --interval)."
+    )
+    run_parser.add_argument(
+        '--interval', type=int, default=config.DAEMON_REFRESH_INTERVAL,
+        help="Seconds between scheduled refreshes in daemon mode."
+    )
+
+    stage_help = {
+        'download': "Download the deputies' expenses.",
+        'audit': "Audit the downloaded expenses.",
+        'report': "Generate the CSV reports of the period.",
+    }
+    for stage in PIPELINE_STAGES:
+        stage_parser = commands.add_parser(stage, help=stage_help[stage])
+        _add_pipeline_arguments(stage_parser)
+        stage_parser.set_defaults(stages=stage, sequential=False, merge_shards=None, daemon=False)
+
+    status_parser = commands.add_parser('status', help="Show the pipeline process, jobs, progress and latest reports.")
+    status_parser.add_argument('--json', action='store_true', help="Print the status as JSON.")
+    commands.add_parser('bench', add_help=False,
+                        help="Run the benchmark suite (options of benchmarks.run_benchmarks; see 'bench --help').")
+    return parser
+
+def main(argv: list = None) -> int:
+    """Main function to run the pipeline."""
+    argv = sys.argv[1:] if argv is None else argv
+    # Options without a command run the full pipeline, as before commands existed.
+    if not argv or argv[0] not in COMMANDS + ['-h', '--help']:
+        argv = ['run'] + argv
+    if argv[0] == 'bench':
+        from benchmarks import run_benchmarks
+        return run_benchmarks.main(argv[1:])
+
+    args = build_parser().parse_args(argv)
+    if args.command == 'status':
+        print_status(args.json)
+        return 0
+    stages = [stage.strip() for stage in args.stages.split(',') if stage.strip()]
+    run_pipeline_command(args, stages)
+    return 0
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -1,38 +1,20 @@
 import streamlit as st
 import time
 import os
-import signal
 import pandas as pd
-from pathlib import Path
 from datetime import date
-from src import process_manager
+from src import checkpoint, config, data_access, process_manager, progress
 
 # Constants
 LOG_FILE = "pipeline.log"
-REPORTS_DIR = Path("reports")
-DEPUTIES_FILE = Path("data/raw/deputados.csv")
+STAGE_LABELS = {"download": "Download", "audit": "Auditoria", "report": "Relatórios"}
+STATUS_LABELS = {
+    "queued": "Na fila", "pending": "Aguardando", "running": "Em execução", "done": "Concluído",
+    "failed": "Falhou", "skipped": "Ignorado", "cancelled": "Cancelado", "paused": "Pausado",
+}
 
 # --- Helper Functions ---
 
-@st.cache_data
-def get_total_deputies():
-    """Gets the total number of deputies from the local file."""
-    if not DEPUTIES_FILE.exists():
-        return 0
-    if DEPUTIES_FILE.exists():
-        df = pd.read_csv(DEPUTIES_FILE)
-        return len(df)
-    return 0
-
-def get_reports(limit=None):
-    """Returns a list of generated DOCX report files."""
-    if not REPORTS_DIR.exists():
-        return []
-    all_reports = sorted(list(REPORTS_DIR.glob("*.docx")), reverse=True)
-    if limit:
-        return all_reports[:limit]
-    return all_reports
-
 def read_log_file_reversed():
     """Reads the log file and returns its content with lines reversed."""
     try:
@@ -42,6 +24,71 @@ def read_log_file_reversed():
     except FileNotFoundError:
         return "Arquivo de log não encontrado. Inicie o pipeline para gerá-lo."
 
+def format_eta(seconds):
+    """Formats an ETA in seconds as a short human-readable string."""
+    if seconds is None:
+        return "-"
+    minutes, secs = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m{secs:02d}s"
+
+def render_progress(events):
+    """Renders progress bars, metrics and throughput charts from pipeline events."""
+    latest = progress.latest_by_stage(events)
+    for stage, event in latest.items():
+        label = STAGE_LABELS.get(stage, stage)
+        total = event["total"] or 1
+        st.progress(
+            min(event["completed"] / total, 1.0),
+            text=f"{label}: {event['completed']}/{event['total']} deputados"
+        )
+        m1, m2, m3, m4 = st.columns(4)
+        m1.metric("Linhas/s", event["rows_per_s"])
+        m2.metric("Requisições/s", event["requests_per_s"])
+        m3.metric("Erros", event["errors"])
+        m4.metric("ETA", format_eta(event["eta_s"]) if event["status"] != "finished" else "Concluído")
+
+    history = pd.DataFrame(events)
+    if not history.empty:
+        history["ts"] = pd.to_datetime(history["ts"], unit="s")
+        throughput = history.pivot_table(
+            index="ts", columns="stage", values=["rows_per_s", "requests_per_s"], aggfunc="last"
+        )
+        throughput.columns = [f"{metric} ({STAGE_LABELS.get(stage, stage)})" for metric, stage in throughput.columns]
+        st.line_chart(throughput.ffill())
+
+def build_jobs_table(jobs):
+    """Builds one row per job with the status and duration of each stage."""
+    rows = []
+    for job in reversed(jobs):
+        row = {
+            "Job": job["id"],
+            "Data": job["params"]["date"],
+            "Período": job["params"]["period"],
+            "Limite": str(job["params"]["limit"] or "Todos"),
+            "Status": STATUS_LABELS.get(job["status"], job["status"]),
+        }
+        for stage in job["stages"]:
+            label = STAGE_LABELS.get(stage["name"], stage["name"])
+            duration = ""
+            if stage["started_at"]:
+                end = stage["finished_at"] or time.time()
+                duration = f" ({end - stage['started_at']:.0f}s)"
+            row[label] = STATUS_LABELS.get(stage["status"], stage["status"]) + duration
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+def build_stage_timings(jobs):
+    """Builds a job x stage table with the duration in seconds of finished stages."""
+    timings = {
+        job["id"]: {
+            STAGE_LABELS.get(stage["name"], stage["name"]): stage["finished_at"] - stage["started_at"]
+            for stage in job["stages"] if stage["started_at"] and stage["finished_at"]
+        }
+        for job in jobs
+    }
+    return pd.DataFrame.from_dict(timings, orient="index").dropna(how="all")
+
 # --- App UI ---
 
 st.set_page_config(page_title="Painel de Controle", layout="wide")
@@ -49,51 +96,88 @@ st.title("Open Expense Tracker")
 st.subheader("Painel de Controle")
 st.caption("Esta é a página principal para iniciar e acompanhar o pipeline de análise.")
 
-total_deputies = get_total_deputies()
+total_deputies = data_access.get_total_deputies()
+# Restart the scheduler if it died (crash, reboot) with unfinished jobs.
+process_manager.recover_jobs()
 process_info = process_manager.get_process_info()
+is_paused = process_manager.is_paused()
+
+# Warm the shared data cache as soon as a run we were watching finishes.
+if st.session_state.get('pipeline_was_running') and not process_info:
+    data_access.warm_up()
+st.session_state['pipeline_was_running'] = bool(process_info)
 
 # --- Sidebar (Controls and Configuration) ---
 st.sidebar.header("Configuração da Execução")
 
-st.sidebar.selectbox("Período de Análise", ['diário', 'semanal', 'mensal'], key='period', disabled=bool(process_info))
-st.sidebar.date_input("Data de Referência", value=date.today(), key='processing_date', disabled=bool(process_info))
+st.sidebar.selectbox("Período de Análise", ['diário', 'semanal', 'mensal'], key='period')
+st.sidebar.date_input("Data de Referência", value=date.today(), key='processing_date')
 st.sidebar.number_input(
     f"Processar quantos deputados? (Total: {total_deputies})", 
     min_value=0, 
     max_value=total_deputies, 
     value=total_deputies, 
     key='limit_input',
-    help="Use 0 para processar todos os deputados.",
+    help="Use 0 para processar todos os deputados."
+)
+st.sidebar.multiselect(
+    "Etapas",
+    options=process_manager.STAGES,
+    default=process_manager.STAGES,
+    format_func=lambda stage: STAGE_LABELS.get(stage, stage),
+    key='stages',
+    help="Um job só com 'Relatórios' não espera downloads de outros jobs."
+)
+st.sidebar.number_input(
+    "Etapas simultâneas",
+    min_value=1,
+    max_value=4,
+    value=config.JOB_CONCURRENCY,
+    key='concurrency',
+    help="Vale para o próximo início do agendador.",
     disabled=bool(process_info)
 )
 
 st.sidebar.header("Controles do Pipeline")
 
-if st.sidebar.button("Iniciar Pipeline", disabled=bool(process_info), type="primary"):
+if st.sidebar.button("Adicionar à Fila", disabled=not st.session_state.get('stages'), type="primary"):
     limit_value = st.session_state.get('limit_input', total_deputies)
     date_value = st.session_state.get('processing_date').strftime('%Y-%m-%d')
     period_value = st.session_state.get('period', 'diário')
-    
-    command = ["python", "main.py", "--date", date_value, "--period", period_value]
-    if limit_value > 0:
-        command.extend(["--limit", str(limit_value)])
-    
-    process_manager.start_process(command)
+
+    process_manager.submit_job(
+        date_value, period_value,
+        limit=limit_value if limit_value > 0 else None,
+        stages=st.session_state.get('stages'),
+        concurrency=st.session_state.get('concurrency')
+    )
     st.rerun()
 
-if process_info:
-    is_paused = process_info.get("status") == "paused"
+if process_info or is_paused:
     col1, col2 = st.sidebar.columns(2)
     
     if not is_paused:
-        if col1.button("Pausar", use_container_width=True):
-            process_manager.send_signal_to_process(signal.SIGSTOP)
-            process_manager.update_process_status("paused")
+        if col1.button("Pausar", use_container_width=True, help="As etapas param no próximo ponto seguro e salvam o progresso."):
+            process_manager.pause_jobs()
             st.rerun()
     else:
         if col1.button("Continuar", use_container_width=True):
-            process_manager.send_signal_to_process(signal.SIGCONT)
-            process_manager.update_process_status("running")
+            process_manager.resume_jobs(st.session_state.get('concurrency'))
+            st.rerun()
+
+# Sharded runs are resumed from the command line of their machine.
+interrupted_runs = [run for run in checkpoint.list_checkpoints() if not run.get("shard")]
+if interrupted_runs and not process_info and not is_paused:
+    st.sidebar.header("Execuções Interrompidas")
+    for run in interrupted_runs:
+        completed = ", ".join(f"{STAGE_LABELS.get(stage, stage)}: {count}" for stage, count in run["completed"].items())
+        st.sidebar.caption(f"{run['date']} · {run['period']} · limite {run['limit'] or 'todos'} — {completed}")
+        if st.sidebar.button("Retomar", key=f"resume_{run['date']}_{run['period']}_{run['limit']}"):
+            process_manager.submit_job(
+                run["date"], run["period"], limit=run["limit"],
+                stages=process_manager.STAGES[min(process_manager.STAGES.index(stage) for stage in run["completed"]):],
+                concurrency=st.session_state.get('concurrency')
+            )
             st.rerun()
 
 st.sidebar.header("Logs")
@@ -107,16 +191,15 @@ col1, col2 = st.columns([3, 1])
 
 with col2:
     st.subheader("Status")
-    if process_info:
-        if process_info.get("status") == "paused":
-            st.warning("Pausado")
-        else:
-            st.info("Em execução...")
+    if is_paused:
+        st.warning("Pausado" if not process_info else "Pausando no próximo ponto seguro...")
+    elif process_info:
+        st.info("Em execução...")
     else:
         st.success("Ocioso / Concluído")
 
     st.subheader("Relatórios Recentes")
-    recent_reports = get_reports(limit=3)
+    recent_reports = data_access.get_docx_reports(limit=3)
     if recent_reports:
         for report in recent_reports:
             with open(report, "rb") as file:
@@ -132,12 +215,30 @@ with col2:
         st.info("Nenhum relatório .docx encontrado.")
 
 with col1:
+    st.subheader("Fila de Jobs")
+    jobs = process_manager.list_jobs()
+    if jobs:
+        st.dataframe(build_jobs_table(jobs), hide_index=True)
+        timings_df = build_stage_timings(jobs)
+        if not timings_df.empty:
+            st.caption("Duração das etapas por job (segundos)")
+            st.bar_chart(timings_df, horizontal=True)
+    else:
+        st.info("Nenhum job na fila. Use 'Adicionar à Fila' para iniciar o pipeline.")
+
+    st.subheader("Progresso")
+    events = progress.read_events()
+    if events:
+        render_progress(events)
+    else:
+        st.info("Nenhum evento de progresso registrado. Inicie o pipeline para acompanhá-lo.")
+
     st.subheader("Logs em Tempo Real")
     log_content = read_log_file_reversed() if process_info else "Nenhum log para exibir."
     st.text_area("Logs", value=log_content, height=600, key="log_area", disabled=True)
 
 # --- UI Auto-Refresh Logic ---
 if process_info:
-    # If a process is running, this script will rerun every second to update logs.
+    # If a process is running, this script will rerun every second to update progress and logs.
     time.sleep(1)
     st.rerun()
@@ -0,0 +1,120 @@
+import streamlit as st
+import pandas as pd
+from src import aggregates, config, data_access, flag_masks
+
+# Constants
+GROUP_LABELS = {"Deputado": "deputy", "Partido": "party", "UF": "uf"}
+GROUP_NAME_COLUMN = {"deputy": "nome", "party": "siglaPartido", "uf": "siglaUf"}
+
+def list_periods(first, last):
+    """Lists every YYYYMM period between two periods, inclusive."""
+    months = pd.period_range(
+        pd.Period(year=first // 100, month=first % 100, freq='M'),
+        pd.Period(year=last // 100, month=last % 100, freq='M'),
+        freq='M'
+    )
+    return [month.year * 100 + month.month for month in months]
+
+def format_period(period):
+    """Formats a YYYYMM period as MM/YYYY."""
+    return f"{period % 100:02d}/{period // 100}"
+
+def format_flag(flag_name):
+    """Turns a flag column name into a readable label."""
+    return flag_name.removeprefix("flag_").replace("_", " ").capitalize()
+
+def cached(name, *params):
+    """Runs an aggregate query through the shared, data-version-aware cache."""
+    query = getattr(aggregates, name)
+    return data_access.query_datastore((name,) + params, lambda: query(*params))
+
+st.set_page_config(page_title="Painel Comparativo", layout="wide")
+st.title("📊 Painel Comparativo")
+st.markdown("Compare deputados, partidos e estados a partir dos agregados mantidos pelo pipeline.")
+
+first_period, last_period = data_access.query_datastore(("period_bounds",), aggregates.get_period_bounds)
+
+if first_period is None:
+    st.warning("Nenhum agregado encontrado. Execute o pipeline de auditoria primeiro.")
+else:
+    # --- User Selection ---
+    periods = list_periods(first_period, last_period)
+    col1, col2 = st.columns([2, 1])
+    start_period, end_period = col1.select_slider(
+        "Intervalo de meses",
+        options=periods,
+        value=(periods[max(len(periods) - 12, 0)], periods[-1]),
+        format_func=format_period
+    )
+    group_label = col2.radio("Agrupar por", list(GROUP_LABELS.keys()), horizontal=True)
+    group_by = GROUP_LABELS[group_label]
+    name_column = GROUP_NAME_COLUMN[group_by]
+
+    # --- Ranking ---
+    st.header("Ranking de Despesas Críticas")
+    ranking_df = cached("ranking", start_period, end_period, group_by)
+    if ranking_df.empty:
+        st.info("Nenhuma despesa no intervalo selecionado.")
+    else:
+        st.bar_chart(ranking_df.head(20), x=name_column, y="critical_expense_count", horizontal=True)
+        st.dataframe(ranking_df, hide_index=True)
+
+    # --- What-If Weights ---
+    st.header("Simulação de Pesos")
+    st.markdown("Ajuste os pesos das flags e o limiar de score crítico para reordenar o ranking sem reexecutar a auditoria.")
+    masks_df = data_access.query_datastore(
+        ("flag_masks", start_period, end_period), lambda: flag_masks.load_masks(start_period, end_period)
+    )
+    if masks_df.empty:
+        st.info("Nenhuma máscara de flags armazenada no intervalo. Execute a auditoria para habilitar a simulação.")
+    else:
+        with st.expander("Pesos das flags", expanded=True):
+            weight_columns = st.columns(3)
+            weights = {
+                flag_name: weight_columns[i % 3].slider(
+                    format_flag(flag_name), 0, 10, config.FLAG_WEIGHTS.get(flag_name, 0), key=f"peso_{flag_name}"
+                )
+                for i, flag_name in enumerate(flag_masks.FLAG_BITS)
+            }
+            threshold = st.slider("Limiar de score crítico", 1, 30, config.SCORE_THRESHOLD)
+
+        deputy_labels = data_access.query_datastore(("deputy_labels",), aggregates.get_deputy_labels)
+        what_if_df = flag_masks.rescore_ranking(masks_df, deputy_labels, weights, threshold, group_by)
+        current_df = flag_masks.rescore_ranking(masks_df, deputy_labels, config.FLAG_WEIGHTS, config.SCORE_THRESHOLD, group_by)
+        key_column = "id" if group_by == "deputy" else name_column
+        current_position = pd.Series(range(1, len(current_df) + 1), index=current_df[key_column])
+        what_if_df.insert(0, "posicao", range(1, len(what_if_df) + 1))
+        what_if_df.insert(1, "variacao", what_if_df[key_column].map(current_position) - what_if_df["posicao"])
+        st.bar_chart(what_if_df.head(20), x=name_column, y="critical_expense_count", horizontal=True)
+        st.dataframe(what_if_df, hide_index=True)
+
+    # --- Party / UF Breakdown ---
+    st.header("Distribuição por Partido e UF")
+    col_party, col_uf = st.columns(2)
+    party_df = cached("ranking", start_period, end_period, "party")
+    uf_df = cached("ranking", start_period, end_period, "uf")
+    if not party_df.empty:
+        col_party.bar_chart(party_df, x="siglaPartido", y=["total_critical_value", "total_suspicious_value"])
+        col_uf.bar_chart(uf_df, x="siglaUf", y=["total_critical_value", "total_suspicious_value"])
+
+    # --- Category Spend ---
+    st.header("Gastos por Tipo de Despesa")
+    category_group = group_by if group_by != "deputy" else "party"
+    category_df = cached("category_spend", start_period, end_period, category_group)
+    if not category_df.empty:
+        category_name = GROUP_NAME_COLUMN[category_group]
+        pivot = category_df.pivot_table(
+            index="tipoDespesa", columns=category_name, values="total_value", aggfunc="sum", fill_value=0
+        )
+        top_categories = pivot.sum(axis=1).nlargest(15).index
+        st.bar_chart(pivot.loc[top_categories], horizontal=True)
+        st.dataframe(pivot.loc[top_categories])
+
+    # --- Supplier Overlap ---
+    st.header("Fornecedores Compartilhados entre Deputados")
+    min_deputies = st.number_input("Mínimo de deputados atendidos", min_value=2, value=3, step=1)
+    overlap_df = cached("supplier_overlap", start_period, end_period, int(min_deputies))
+    if overlap_df.empty:
+        st.info("Nenhum fornecedor compartilhado pelo número mínimo de deputados no intervalo.")
+    else:
+        st.dataframe(overlap_df, hide_index=True)
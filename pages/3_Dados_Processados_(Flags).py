@@ -1,30 +1,14 @@
 import streamlit as st
-import pandas as pd
-from pathlib import Path
+from src import cnpj_registry, data_access, datastore
 
 # Constants
-PROCESSED_DIR = Path("data/processed/flags_and_scores")
-DEPUTIES_FILE = Path("data/raw/deputados.csv")
-
-@st.cache_data
-def get_deputies_list():
-    """Loads the deputies list for the selector."""
-    if not DEPUTIES_FILE.exists():
-        return pd.DataFrame({'nome': [], 'id': []})
-    return pd.read_csv(DEPUTIES_FILE)
-
-def load_processed_data(deputy_id):
-    """Loads the flagged expenses for a given deputy."""
-    file_path = PROCESSED_DIR / str(deputy_id) / "flagged_expenses.csv"
-    if not file_path.exists():
-        return None
-    return pd.read_csv(file_path, parse_dates=['dataDocumento'])
+PAGE_SIZES = [50, 100, 250, 500]
 
 st.set_page_config(page_title="Dados Processados", layout="wide")
 st.title("🔎 Explorador de Dados Processados (com Flags)")
 st.markdown("Navegue pelas despesas que receberam pelo menos uma flag de suspeita.")
 
-deputies_df = get_deputies_list()
+deputies_df = data_access.get_deputies_list()
 
 if deputies_df.empty:
     st.warning("A lista de deputados (`deputados.csv`) não foi encontrada. Execute o pipeline primeiro.")
@@ -37,37 +21,68 @@ else:
         index=None,
         placeholder="Digite o nome para buscar..."
     )
-    
+
     if selected_deputy_name:
         deputy_id = deputies_df[deputies_df['nome'] == selected_deputy_name]['id'].iloc[0]
-        df = load_processed_data(deputy_id)
-        
-        if df is not None:
-            # Date range filter
-            min_date = df['dataDocumento'].min().date()
-            max_date = df['dataDocumento'].max().date()
-            
+        min_date, max_date = datastore.get_date_bounds(datastore.FLAGGED_TABLE, deputy_id)
+
+        if min_date is not None:
             date_range = col2.date_input(
                 "Filtrar por data do documento",
                 value=(min_date, max_date),
                 min_value=min_date,
                 max_value=max_date,
             )
-            
+
+            # --- Filters pushed down to the datastore ---
+            f1, f2, f3, f4, f5 = st.columns(5)
+            selected_flag = f1.selectbox("Flag", options=datastore.get_flag_columns(), index=None, placeholder="Todas")
+            supplier = f2.text_input("Fornecedor ou CNPJ/CPF")
+            min_score = f3.number_input("Score mínimo", min_value=0, value=0, step=1)
+            min_value = f4.number_input("Valor mínimo (R$)", min_value=0.0, value=0.0, step=100.0)
+            max_value = f5.number_input("Valor máximo (R$)", min_value=0.0, value=0.0, step=100.0,
+                                        help="Use 0 para não limitar.")
+
             if len(date_range) == 2:
                 start_date, end_date = date_range
-                mask = (df['dataDocumento'].dt.date >= start_date) & (df['dataDocumento'].dt.date <= end_date)
-                filtered_df = df[mask]
-                
-                st.dataframe(filtered_df)
-                
-                csv = filtered_df.to_csv(index=False).encode('utf-8')
-                st.download_button(
-                    label="Baixar Tabela como CSV",
-                    data=csv,
-                    file_name=f"dados_processados_{deputy_id}_{start_date}_a_{end_date}.csv",
-                    mime="text/csv",
+                filters = {
+                    'deputy_id': deputy_id,
+                    'start_date': start_date,
+                    'end_date': end_date,
+                    'flag': selected_flag,
+                    'supplier': supplier.strip() or None,
+                    'min_score': min_score or None,
+                    'min_value': min_value or None,
+                    'max_value': max_value or None,
+                }
+
+                p1, p2 = st.columns([1, 3])
+                page_size = p1.selectbox("Linhas por página", PAGE_SIZES, index=1)
+                total = datastore.count_expenses(datastore.FLAGGED_TABLE, filters)
+                total_pages = max((total - 1) // page_size + 1, 1)
+                page = p2.number_input(f"Página (de {total_pages})", min_value=1, max_value=total_pages, value=1)
+
+                page_df = datastore.query_expenses(
+                    datastore.FLAGGED_TABLE, filters,
+                    limit=page_size, offset=(page - 1) * page_size
                 )
+                first_row = (page - 1) * page_size + 1 if total else 0
+                st.caption(f"Mostrando {first_row}–{(page - 1) * page_size + len(page_df)} de {total} despesas.")
+                st.dataframe(page_df)
+
+                if cnpj_registry.registry_exists() and not page_df.empty:
+                    with st.expander("Dados cadastrais dos fornecedores desta página (Receita Federal)"):
+                        suppliers_df = page_df[['nomeFornecedor', 'cnpjCpfFornecedor']].drop_duplicates()
+                        st.dataframe(cnpj_registry.enrich_suppliers(suppliers_df), hide_index=True)
+
+                # The CSV is only generated when the user asks for it.
+                if st.button("Gerar CSV com todos os resultados"):
+                    st.download_button(
+                        label="Baixar Tabela como CSV",
+                        data=datastore.export_csv(datastore.FLAGGED_TABLE, filters),
+                        file_name=f"dados_processados_{deputy_id}_{start_date}_a_{end_date}.csv",
+                        mime="text/csv",
+                    )
             else:
                 st.warning("Por favor, selecione um intervalo de datas válido.")
         else:
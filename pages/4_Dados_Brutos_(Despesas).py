@@ -1,39 +1,14 @@
 import streamlit as st
-import pandas as pd
-from pathlib import Path
-import os
+from src import data_access, datastore
 
 # Constants
-RAW_EXPENSES_DIR = Path("data/raw/expenses")
-DEPUTIES_FILE = Path("data/raw/deputados.csv")
-
-@st.cache_data
-def get_deputies_list():
-    """Loads the deputies list for the selector."""
-    if not DEPUTIES_FILE.exists():
-        return pd.DataFrame({'nome': [], 'id': []})
-    return pd.read_csv(DEPUTIES_FILE)
-
-def get_available_months(deputy_id):
-    """Gets a list of available year-month CSVs for a deputy."""
-    deputy_dir = RAW_EXPENSES_DIR / str(deputy_id)
-    if not deputy_dir.exists():
-        return []
-    files = [f.stem for f in deputy_dir.glob("*.csv")]
-    return sorted(files, reverse=True)
-
-def load_raw_data(deputy_id, month_file):
-    """Loads a specific month of raw expenses."""
-    file_path = RAW_EXPENSES_DIR / str(deputy_id) / f"{month_file}.csv"
-    if not file_path.exists():
-        return None
-    return pd.read_csv(file_path)
+PAGE_SIZES = [50, 100, 250, 500]
 
 st.set_page_config(page_title="Dados Brutos", layout="wide")
 st.title("🗂️ Explorador de Dados Brutos (Despesas)")
-st.markdown("Navegue pelos arquivos de despesas baixados da API.")
+st.markdown("Navegue pelas despesas baixadas da API.")
 
-deputies_df = get_deputies_list()
+deputies_df = data_access.get_deputies_list()
 
 if deputies_df.empty:
     st.warning("A lista de deputados (`deputados.csv`) não foi encontrada. Execute o pipeline primeiro.")
@@ -46,29 +21,61 @@ else:
         index=None,
         placeholder="Digite o nome para buscar..."
     )
-    
+
     if selected_deputy_name:
         deputy_id = deputies_df[deputies_df['nome'] == selected_deputy_name]['id'].iloc[0]
-        available_months = get_available_months(deputy_id)
-        
-        if available_months:
-            selected_month = col2.selectbox(
-                "Selecione o Mês/Ano",
-                options=available_months
+        min_date, max_date = datastore.get_date_bounds(datastore.RAW_TABLE, deputy_id)
+
+        if min_date is not None:
+            date_range = col2.date_input(
+                "Filtrar por data do documento",
+                value=(min_date, max_date),
+                min_value=min_date,
+                max_value=max_date,
             )
-            
-            df = load_raw_data(deputy_id, selected_month)
-            
-            if df is not None:
-                st.dataframe(df)
-                
-                csv = df.to_csv(index=False).encode('utf-8')
-                st.download_button(
-                    label="Baixar Tabela como CSV",
-                    data=csv,
-                    file_name=f"dados_brutos_{deputy_id}_{selected_month}.csv",
-                    mime="text/csv",
-                    key=f"download_{deputy_id}_{selected_month}"
+
+            # --- Filters pushed down to the datastore ---
+            f1, f2, f3 = st.columns(3)
+            supplier = f1.text_input("Fornecedor ou CNPJ/CPF")
+            min_value = f2.number_input("Valor mínimo (R$)", min_value=0.0, value=0.0, step=100.0)
+            max_value = f3.number_input("Valor máximo (R$)", min_value=0.0, value=0.0, step=100.0,
+                                        help="Use 0 para não limitar.")
+
+            if len(date_range) == 2:
+                start_date, end_date = date_range
+                filters = {
+                    'deputy_id': deputy_id,
+                    'start_date': start_date,
+                    'end_date': end_date,
+                    'supplier': supplier.strip() or None,
+                    'min_value': min_value or None,
+                    'max_value': max_value or None,
+                }
+
+                p1, p2 = st.columns([1, 3])
+                page_size = p1.selectbox("Linhas por página", PAGE_SIZES, index=1)
+                total = datastore.count_expenses(datastore.RAW_TABLE, filters)
+                total_pages = max((total - 1) // page_size + 1, 1)
+                page = p2.number_input(f"Página (de {total_pages})", min_value=1, max_value=total_pages, value=1)
+
+                page_df = datastore.query_expenses(
+                    datastore.RAW_TABLE, filters,
+                    limit=page_size, offset=(page - 1) * page_size
                 )
+                first_row = (page - 1) * page_size + 1 if total else 0
+                st.caption(f"Mostrando {first_row}–{(page - 1) * page_size + len(page_df)} de {total} despesas.")
+                st.dataframe(page_df)
+
+                # The CSV is only generated when the user asks for it.
+                if st.button("Gerar CSV com todos os resultados"):
+                    st.download_button(
+                        label="Baixar Tabela como CSV",
+                        data=datastore.export_csv(datastore.RAW_TABLE, filters),
+                        file_name=f"dados_brutos_{deputy_id}_{start_date}_a_{end_date}.csv",
+                        mime="text/csv",
+                        key=f"download_{deputy_id}_{start_date}_{end_date}"
+                    )
+            else:
+                st.warning("Por favor, selecione um intervalo de datas válido.")
         else:
-            st.info("Nenhum dado bruto encontrado para este deputado. Execute o pipeline de download.")
+            st.info("Nenhum dado bruto encontrado para este deputado. Execute o pipeline de download e auditoria.")
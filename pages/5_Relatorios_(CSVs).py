@@ -1,19 +1,6 @@
 import streamlit as st
-import pandas as pd
-from pathlib import Path
 from datetime import date
-
-# Constants
-REPORTS_DIR = Path("reports")
-
-def find_report_file(ref_date, period, report_type):
-    """Finds the correct report CSV file based on user selection."""
-    date_str = ref_date.strftime('%Y-%m-%d')
-    file_name = f"{date_str}_{period}_{report_type}.csv"
-    file_path = REPORTS_DIR / file_name
-    if file_path.exists():
-        return file_path
-    return None
+from src import data_access
 
 st.set_page_config(page_title="Relatórios (CSVs)", layout="wide")
 st.title("📄 Explorador de Relatórios (CSVs)")
@@ -25,22 +12,22 @@ selected_date = col1.date_input("Selecione a Data de Referência", value=date.to
 selected_period = col2.selectbox("Selecione o Período", ['diário', 'semanal', 'mensal'])
 report_type_map = {
     "Ranking de Deputados": "deputy_scores",
-    "Despesas Críticas": "critical_expenses"
+    "Despesas Críticas": "critical_expenses",
+    "Quebras e Meses Atípicos de Gasto": "spend_events",
 }
 selected_report_name = col3.selectbox("Selecione o Tipo de Relatório", list(report_type_map.keys()))
 
 if selected_date and selected_period and selected_report_name:
     report_type = report_type_map[selected_report_name]
-    report_file = find_report_file(selected_date, selected_period, report_type)
+    report_file = data_access.find_report_file(selected_date, selected_period, report_type)
     
     if report_file:
-        df = pd.read_csv(report_file)
+        df = data_access.load_report(selected_date, selected_period, report_type)
         st.dataframe(df)
         
-        csv = df.to_csv(index=False).encode('utf-8')
         st.download_button(
             label=f"Baixar {report_file.name}",
-            data=csv,
+            data=report_file.read_bytes(),
             file_name=report_file.name,
             mime="text/csv",
         )
@@ -0,0 +1,36 @@
+import streamlit as st
+import time
+from src import data_access, datastore
+
+# Constants
+SOURCE_MAP = {
+    "Despesas Brutas": datastore.RAW_TABLE,
+    "Despesas com Flags": datastore.FLAGGED_TABLE,
+}
+
+st.set_page_config(page_title="Busca Global", layout="wide")
+st.title("🔍 Busca Global de Despesas")
+st.markdown(
+    "Busque em todas as despesas de todos os deputados por nome do fornecedor, CNPJ/CPF, "
+    "tipo de despesa ou número do documento. A busca ignora acentos e aceita prefixos "
+    "(ex.: `locad` encontra `LOCADORA ÁVILA`)."
+)
+
+col1, col2, col3 = st.columns([3, 1, 1])
+query = col1.text_input("Termos da busca", placeholder="Ex.: posto sao joao, 11222333, combustiveis")
+source_name = col2.selectbox("Base", list(SOURCE_MAP.keys()))
+limit = col3.number_input("Máximo de resultados", min_value=10, max_value=5000, value=200, step=50)
+
+if query.strip():
+    start = time.perf_counter()
+    results_df = datastore.search_expenses(query, SOURCE_MAP[source_name], limit=limit)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    if results_df.empty:
+        st.info("Nenhuma despesa encontrada. Verifique se o pipeline de auditoria já foi executado.")
+    else:
+        deputies_df = data_access.get_deputies_list()[['id', 'nome']].rename(columns={'id': 'deputy_id', 'nome': 'deputy_name'})
+        results_df = results_df.merge(deputies_df, on='deputy_id', how='left')
+        results_df.insert(1, 'deputy_name', results_df.pop('deputy_name'))
+        st.caption(f"{len(results_df)} resultados em {elapsed_ms:.0f} ms.")
+        st.dataframe(results_df)
@@ -37,6 +37,10 @@ if selected_date and selected_period:
         
         st.header("Top 10 Tipos de Despesa em Despesas Críticas")
         st.dataframe(report_data["top_expense_types"])
+
+        st.header("Quebras e Meses Atípicos de Gasto no Período")
+        st.caption("Mudanças de patamar e meses muito acima do histórico do deputado, já descontada a sazonalidade.")
+        st.dataframe(report_data["top_spend_events"])
         
         st.header("Análise Individual dos Top Deputados")
         for _, deputy in report_data["top_10_deputies"].iterrows():
@@ -0,0 +1,236 @@
+"""
+Aggregates Module
+
+This module maintains materialized aggregate tables in the datastore that power
+the cross-deputy comparative dashboard. The auditor refreshes a deputy's rows
+every time it audits that deputy, so the dashboard never has to scan the raw
+expenses. All tables are keyed by month ('periodo' = YYYYMM), which lets any
+month range be answered with a single indexed GROUP BY.
+"""
+import pandas as pd
+from src import config, datastore
+
+# --- Refreshing ---
+
+def _add_period(df: pd.DataFrame) -> pd.DataFrame:
+    """Adds the integer YYYYMM period derived from the document date."""
+    df = df.copy()
+    df['periodo'] = df['dataDocumento'].dt.year * 100 + df['dataDocumento'].dt.month
+    return df
+
+def refresh_deputies(deputies_df: pd.DataFrame):
+    """Stores the deputies' names, parties and states used to label the aggregates."""
+    columns = [col for col in ['id', 'nome', 'siglaPartido', 'siglaUf'] if col in deputies_df.columns]
+    datastore.replace_table(datastore.DEPUTIES_TABLE, deputies_df[columns])
+
+# How each aggregate column is combined when partial aggregates (e.g. from
+# different chunks of a deputy's history) are merged.
+MERGE_RULES = {
+    datastore.DEPUTY_MONTH_TABLE: (['periodo'], {
+        'n_expenses': 'sum', 'total_value': 'sum', 'n_flagged': 'sum', 'flagged_value': 'sum',
+        'n_critical': 'sum', 'critical_value': 'sum', 'score_sum': 'sum', 'max_score': 'max',
+    }),
+    datastore.CATEGORY_MONTH_TABLE: (['periodo', 'tipoDespesa'], {'n_expenses': 'sum', 'total_value': 'sum'}),
+    datastore.SUPPLIER_MONTH_TABLE: (['periodo', 'supplier_key'], {
+        'nomeFornecedor': 'first', 'n_expenses': 'sum', 'total_value': 'sum',
+    }),
+}
+
+def compute_deputy_aggregates(scored_df: pd.DataFrame) -> dict:
+    """
+    Computes the aggregates of a deputy's prepared and scored expenses (every
+    expense, not only the flagged ones). Returns a dataframe per aggregate table.
+    """
+    if scored_df.empty:
+        return {table: pd.DataFrame() for table in datastore.AGGREGATE_TABLES}
+
+    df = _add_period(scored_df)
+    flag_names = [col for col in df.columns if col.startswith("flag_")]
+    df['is_flagged'] = df[flag_names].any(axis=1)
+    df['is_critical'] = df['score_fraude'] >= config.SCORE_THRESHOLD
+    df['flagged_value'] = df['valorLiquido'].where(df['is_flagged'], 0)
+    df['critical_value'] = df['valorLiquido'].where(df['is_critical'], 0)
+    df['flagged_score'] = df['score_fraude'].where(df['is_flagged'], 0)
+
+    deputy_month = df.groupby('periodo').agg(
+        n_expenses=('valorLiquido', 'size'),
+        total_value=('valorLiquido', 'sum'),
+        n_flagged=('is_flagged', 'sum'),
+        flagged_value=('flagged_value', 'sum'),
+        n_critical=('is_critical', 'sum'),
+        critical_value=('critical_value', 'sum'),
+        score_sum=('flagged_score', 'sum'),
+        max_score=('score_fraude', 'max'),
+    ).reset_index()
+
+    category_month = df.groupby(['periodo', 'tipoDespesa']).agg(
+        n_expenses=('valorLiquido', 'size'),
+        total_value=('valorLiquido', 'sum'),
+    ).reset_index()
+
+    supplier_month = df.groupby(['periodo', 'supplier_key']).agg(
+        nomeFornecedor=('nomeFornecedor', 'first'),
+        n_expenses=('valorLiquido', 'size'),
+        total_value=('valorLiquido', 'sum'),
+    ).reset_index()
+
+    return {
+        datastore.DEPUTY_MONTH_TABLE: deputy_month,
+        datastore.CATEGORY_MONTH_TABLE: category_month,
+        datastore.SUPPLIER_MONTH_TABLE: supplier_month,
+    }
+
+def merge_aggregates(partials: list) -> dict:
+    """
+    Merges partial aggregates computed over disjoint sets of expenses into the
+    aggregates of their union. A month may appear in several partials.
+    """
+    merged = {}
+    for table, (keys, rules) in MERGE_RULES.items():
+        frames = [partial[table] for partial in partials if not partial[table].empty]
+        if not frames:
+            merged[table] = pd.DataFrame()
+            continue
+        merged[table] = pd.concat(frames, ignore_index=True).groupby(keys).agg(rules).reset_index()
+    return merged
+
+def write_deputy_aggregates(deputy_id: int, aggregates: dict):
+    """Replaces a deputy's rows in every aggregate table."""
+    for table in datastore.AGGREGATE_TABLES:
+        datastore.replace_deputy_rows(table, deputy_id, aggregates[table])
+
+def refresh_deputy(deputy_id: int, scored_df: pd.DataFrame):
+    """
+    Recomputes all aggregates of a deputy from their prepared and scored
+    expenses (every expense, not only the flagged ones).
+    """
+    write_deputy_aggregates(deputy_id, compute_deputy_aggregates(scored_df))
+
+# --- Querying ---
+
+GROUP_COLUMNS = {
+    'deputy': ['d.id', 'd.nome', 'd.siglaPartido', 'd.siglaUf'],
+    'party': ['d.siglaPartido'],
+    'uf': ['d.siglaUf'],
+}
+
+def _group_sql(group_by: str) -> tuple:
+    """Returns the SELECT and GROUP BY fragments of a grouping level."""
+    columns = GROUP_COLUMNS[group_by]
+    select = ", ".join(f"{col} AS {col.split('.')[1]}" for col in columns)
+    return select, ", ".join(columns)
+
+def _read(sql: str, params: list) -> pd.DataFrame:
+    if not config.DATASTORE_FILE.exists():
+        return pd.DataFrame()
+    with datastore.connect() as conn:
+        required = [datastore.DEPUTIES_TABLE] + list(datastore.AGGREGATE_TABLES)
+        if not all(datastore.get_table_columns(conn, table) for table in required):
+            return pd.DataFrame()
+        return pd.read_sql_query(sql, conn, params=params)
+
+def ranking(start_period: int, end_period: int, group_by: str = 'deputy') -> pd.DataFrame:
+    """
+    Ranks deputies, parties or states by critical expenses over a month range,
+    using the same ordering as the period reports.
+    """
+    select, group = _group_sql(group_by)
+    sql = f"""
+        SELECT {select},
+               COUNT(DISTINCT a.deputy_id) AS n_deputies,
+               SUM(a.n_critical) AS critical_expense_count,
+               SUM(a.n_flagged) AS total_suspicious_expenses,
+               SUM(a.flagged_value) AS total_suspicious_value,
+               SUM(a.critical_value) AS total_critical_value,
+               SUM(a.total_value) AS total_value,
+               MAX(a.max_score) AS max_suspicion_score,
+               SUM(a.score_sum) * 1.0 / NULLIF(SUM(a.n_flagged), 0) AS average_suspicion_score
+        FROM {datastore.DEPUTY_MONTH_TABLE} a
+        JOIN {datastore.DEPUTIES_TABLE} d ON d.id = a.deputy_id
+        WHERE a.periodo BETWEEN ? AND ?
+        GROUP BY {group}
+        ORDER BY critical_expense_count DESC, average_suspicion_score DESC
+    """
+    return _read(sql, [start_period, end_period])
+
+def category_spend(start_period: int, end_period: int, group_by: str = 'party') -> pd.DataFrame:
+    """Returns total spend per expense type and group over a month range."""
+    select, group = _group_sql(group_by)
+    sql = f"""
+        SELECT {select}, c.tipoDespesa,
+               SUM(c.n_expenses) AS n_expenses,
+               SUM(c.total_value) AS total_value
+        FROM {datastore.CATEGORY_MONTH_TABLE} c
+        JOIN {datastore.DEPUTIES_TABLE} d ON d.id = c.deputy_id
+        WHERE c.periodo BETWEEN ? AND ?
+        GROUP BY {group}, c.tipoDespesa
+        ORDER BY total_value DESC
+    """
+    return _read(sql, [start_period, end_period])
+
+def supplier_overlap(start_period: int, end_period: int, min_deputies: int = 2) -> pd.DataFrame:
+    """Lists suppliers paid by at least `min_deputies` different deputies over a month range."""
+    sql = f"""
+        SELECT s.supplier_key AS cnpjCpfFornecedor,
+               MAX(s.nomeFornecedor) AS nomeFornecedor,
+               COUNT(DISTINCT s.deputy_id) AS n_deputies,
+               COUNT(DISTINCT d.siglaPartido) AS n_parties,
+               SUM(s.n_expenses) AS n_expenses,
+               SUM(s.total_value) AS total_value
+        FROM {datastore.SUPPLIER_MONTH_TABLE} s
+        JOIN {datastore.DEPUTIES_TABLE} d ON d.id = s.deputy_id
+        WHERE s.periodo BETWEEN ? AND ? AND s.supplier_key != ''
+        GROUP BY s.supplier_key
+        HAVING COUNT(DISTINCT s.deputy_id) >= ?
+        ORDER BY n_deputies DESC, total_value DESC
+    """
+    return _read(sql, [start_period, end_period, int(min_deputies)])
+
+def find_suppliers(text: str, limit: int = 1000) -> pd.DataFrame:
+    """
+    Looks suppliers up by name (substring) or CNPJ/CPF (prefix of its digits),
+    with the deputies that paid them and their totals, largest first.
+    """
+    digits = "".join(char for char in text if char.isdigit())
+    sql = f"""
+        SELECT s.supplier_key AS cnpjCpfFornecedor,
+               MAX(s.nomeFornecedor) AS nomeFornecedor,
+               COUNT(DISTINCT s.deputy_id) AS n_deputies,
+               SUM(s.n_expenses) AS n_expenses,
+               SUM(s.total_value) AS total_value,
+               MIN(s.periodo) AS first_period,
+               MAX(s.periodo) AS last_period
+        FROM {datastore.SUPPLIER_MONTH_TABLE} s
+        WHERE s.supplier_key != '' AND (s.nomeFornecedor LIKE ? OR s.supplier_key LIKE ?)
+        GROUP BY s.supplier_key
+        ORDER BY total_value DESC
+        LIMIT ?
+    """
+    return _read(sql, [f"%{text.strip()}%", f"{digits}%" if digits else None, int(limit)])
+
+def supplier_deputies(supplier_key: str) -> pd.DataFrame:
+    """Lists the deputies that paid a supplier, with their totals, largest first."""
+    sql = f"""
+        SELECT d.id, d.nome, d.siglaPartido, d.siglaUf,
+               SUM(s.n_expenses) AS n_expenses,
+               SUM(s.total_value) AS total_value,
+               MIN(s.periodo) AS first_period,
+               MAX(s.periodo) AS last_period
+        FROM {datastore.SUPPLIER_MONTH_TABLE} s
+        JOIN {datastore.DEPUTIES_TABLE} d ON d.id = s.deputy_id
+        WHERE s.supplier_key = ?
+        GROUP BY d.id, d.nome, d.siglaPartido, d.siglaUf
+        ORDER BY total_value DESC
+    """
+    return _read(sql, [supplier_key])
+
+def get_deputy_labels() -> pd.DataFrame:
+    """Returns the names, parties and states of the deputies."""
+    return _read(f"SELECT id, nome, siglaPartido, siglaUf FROM {datastore.DEPUTIES_TABLE}", [])
+
+def get_period_bounds() -> tuple:
+    """Returns the first and last months (YYYYMM) covered by the aggregates."""
+    bounds = _read(f"SELECT MIN(periodo) AS first, MAX(periodo) AS last FROM {datastore.DEPUTY_MONTH_TABLE}", [])
+    if bounds.empty or pd.isna(bounds.loc[0, 'first']):
+        return None, None
+    return int(bounds.loc[0, 'first']), int(bounds.loc[0, 'last'])
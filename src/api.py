@@ -0,0 +1,247 @@
+"""
+API Module
+
+This module serves the pipeline outputs through a read-only HTTP API, so
+other local consumers (alerting, newsroom tools) do not have to parse the
+report CSVs or scrape the Streamlit pages:
+
+    GET /deputies                                   deputies with party and UF
+    GET /rankings?start=YYYYMM&end=YYYYMM&group_by=deputy|party|uf
+    GET /reports/{YYYY-MM-DD}/{period}/deputy-scores
+    GET /reports/{YYYY-MM-DD}/{period}/critical-expenses
+    GET /reports/{YYYY-MM-DD}/{period}/spend-events
+    GET /deputies/{id}/flagged-expenses
+    GET /suppliers?q=name-or-cnpj                   supplier lookup
+    GET /suppliers/{cnpj}/deputies                  deputies that paid a supplier
+    GET /changes?deputy_id=ID                       expenses retroactively modified or removed
+
+Every list is paginated with `page` (from 1) and `page_size`. Responses are
+JSON objects with the items of the page and the total number of items.
+
+Each resource has a version: the data version of the datastore, or the
+signature of the CSV file it is read from. The ETag of a response is derived
+from that version and the request, so a client revalidating with
+If-None-Match gets a 304 without the data being loaded. Response bodies are
+kept in the process-wide cache of `src.data_access`, keyed on the same
+version, so they are invalidated by the next pipeline write. Requests are
+handled concurrently, one thread per connection.
+
+Usage:
+    python -m src.api --port 8766
+"""
+import argparse
+import hashlib
+import json
+import logging
+import re
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+import pandas as pd
+from src import aggregates, config, data_access, datastore, snapshots
+
+# Accepted spellings of the report periods in URLs.
+PERIODS = {'diário': 'diário', 'diario': 'diário', 'semanal': 'semanal', 'mensal': 'mensal'}
+REPORT_TYPES = {
+    'deputy-scores': 'deputy_scores',
+    'critical-expenses': 'critical_expenses',
+    'spend-events': 'spend_events',
+}
+
+class ApiError(Exception):
+    """Raised to answer a request with an HTTP error status."""
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+# --- Parameters ---
+
+def _param(params: dict, name: str, default=None):
+    values = params.get(name)
+    return values[-1] if values else default
+
+def _int_param(params: dict, name: str, default=None) -> int:
+    value = _param(params, name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ApiError(400, f"Parameter '{name}' must be an integer.")
+
+def _page_params(params: dict) -> tuple:
+    page = _int_param(params, 'page', 1)
+    page_size = _int_param(params, 'page_size', config.API_PAGE_SIZE)
+    if page < 1 or not 1 <= page_size <= config.API_MAX_PAGE_SIZE:
+        raise ApiError(400, f"'page' must be >= 1 and 'page_size' between 1 and {config.API_MAX_PAGE_SIZE}.")
+    return page, page_size
+
+# --- Resources ---
+# Each resource returns (version, loader): the version of the data it reads,
+# checked before anything is loaded, and a function that loads its items.
+
+def _datastore_resource(loader) -> tuple:
+    return ("datastore", datastore.get_data_version()), loader
+
+def _file_resource(path, loader, missing: str) -> tuple:
+    signature = data_access.file_signature(path)
+    if signature is None:
+        raise ApiError(404, missing)
+    return ("file", path.name, signature), loader
+
+def _deputies(params: dict) -> tuple:
+    return _datastore_resource(aggregates.get_deputy_labels)
+
+def _rankings(params: dict) -> tuple:
+    group_by = _param(params, 'group_by', 'deputy')
+    if group_by not in aggregates.GROUP_COLUMNS:
+        raise ApiError(400, f"'group_by' must be one of {list(aggregates.GROUP_COLUMNS)}.")
+    start, end = _int_param(params, 'start'), _int_param(params, 'end')
+
+    def loader():
+        first, last = aggregates.get_period_bounds()
+        if first is None:
+            return pd.DataFrame()
+        return aggregates.ranking(start or first, end or last, group_by)
+    return _datastore_resource(loader)
+
+def _report(params: dict, date_text: str, period: str, report_type: str) -> tuple:
+    try:
+        ref_date = datetime.strptime(date_text, '%Y-%m-%d')
+    except ValueError:
+        raise ApiError(400, f"Invalid date '{date_text}'. Use YYYY-MM-DD.")
+    if period not in PERIODS:
+        raise ApiError(404, f"Unknown period '{period}'.")
+    if report_type not in REPORT_TYPES:
+        raise ApiError(404, f"Unknown report '{report_type}'.")
+    period, report_type = PERIODS[period], REPORT_TYPES[report_type]
+    path = config.REPORTS_DIR / f"{date_text}_{period}_{report_type}.csv"
+    return _file_resource(path, lambda: data_access.load_report(ref_date, period, report_type),
+                          f"The report {path.name} was not generated.")
+
+def _flagged_expenses(params: dict, deputy_id: str) -> tuple:
+    path = config.flagged_expenses_path(deputy_id)
+    return _file_resource(path, lambda: data_access.load_processed_data(int(deputy_id)),
+                          f"No audit results for deputy {deputy_id}.")
+
+def _suppliers(params: dict) -> tuple:
+    text = (_param(params, 'q') or "").strip()
+    if len(text) < 3:
+        raise ApiError(400, "Parameter 'q' must have at least 3 characters.")
+    return _datastore_resource(lambda: aggregates.find_suppliers(text))
+
+def _supplier_deputies(params: dict, supplier_key: str) -> tuple:
+    return _datastore_resource(lambda: aggregates.supplier_deputies(supplier_key))
+
+def _changes(params: dict) -> tuple:
+    deputy_id = _int_param(params, 'deputy_id')
+    return _datastore_resource(lambda: snapshots.get_retroactive_changes(deputy_id))
+
+ROUTES = [
+    (re.compile(r"/deputies"), _deputies),
+    (re.compile(r"/rankings"), _rankings),
+    (re.compile(r"/reports/([^/]+)/([^/]+)/([^/]+)"), _report),
+    (re.compile(r"/deputies/(\d+)/flagged-expenses"), _flagged_expenses),
+    (re.compile(r"/suppliers"), _suppliers),
+    (re.compile(r"/suppliers/([^/]+)/deputies"), _supplier_deputies),
+    (re.compile(r"/changes"), _changes),
+]
+
+# --- Responses ---
+
+def resolve(path: str, params: dict) -> tuple:
+    """Returns the (version, loader) of the resource a request path points to."""
+    for pattern, resource in ROUTES:
+        match = pattern.fullmatch(path)
+        if match:
+            return resource(params, *match.groups())
+    raise ApiError(404, f"Unknown resource '{path}'.")
+
+def make_etag(version: tuple, path: str, params: dict) -> str:
+    request = json.dumps([version, path, sorted(params.items())], default=str)
+    return '"' + hashlib.sha1(request.encode("utf-8")).hexdigest()[:20] + '"'
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+def render_page(items: pd.DataFrame, page: int, page_size: int) -> bytes:
+    """Serializes one page of items with the pagination fields."""
+    items = pd.DataFrame() if items is None else items
+    total = len(items)
+    page_items = items.iloc[(page - 1) * page_size:page * page_size]
+    dates = page_items.select_dtypes(include='datetime').columns
+    if len(dates):
+        # Same date format as the report CSVs.
+        page_items = page_items.assign(**{col: page_items[col].dt.strftime('%Y-%m-%d') for col in dates})
+    records = page_items.to_json(orient='records', force_ascii=False) if total else "[]"
+    header = json.dumps({
+        "total": total,
+        "page": page,
+        "page_size": page_size,
+        "pages": -(-total // page_size),
+    })
+    return f'{header[:-1]}, "items": {records}}}'.encode("utf-8")
+
+class ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _send(self, status: int, body: bytes = b"", etag: str = None):
+        self.send_response(status)
+        if etag:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+        if status != 304:
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if status != 304:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        path = unquote(url.path).rstrip("/") or "/"
+        params = parse_qs(url.query)
+        try:
+            page, page_size = _page_params(params)
+            version, loader = resolve(path, params)
+            etag = make_etag(version, path, params)
+            if etag_matches(self.headers.get("If-None-Match"), etag):
+                self._send(304, etag=etag)
+                return
+            key = ("api", path, tuple(sorted((name, tuple(values)) for name, values in params.items())))
+            body = data_access.cached_load(key, version, lambda: render_page(loader(), page, page_size))
+            self._send(200, body, etag)
+        except ApiError as e:
+            self._send(e.status, json.dumps({"error": str(e)}).encode("utf-8"))
+        except Exception:
+            logging.exception(f"API request failed: {self.path}")
+            self._send(500, json.dumps({"error": "internal error"}).encode("utf-8"))
+
+    def log_message(self, format, *args):
+        logging.debug(f"API: {format % args}")
+
+def serve(host: str = None, port: int = None):
+    """Serves the API until interrupted."""
+    host, port = host or config.API_HOST, port or config.API_PORT
+    server = ThreadingHTTPServer((host, port), ApiHandler)
+    server.daemon_threads = True
+    logging.info(f"Query API listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        logging.info("Query API stopped.")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Serve the pipeline outputs through a read-only HTTP API.")
+    parser.add_argument("--host", default=config.API_HOST,
+                        help="Interface to bind. Defaults to localhost only.")
+    parser.add_argument("--port", type=int, default=config.API_PORT)
+    args = parser.parse_args()
+    serve(args.host, args.port)
@@ -5,10 +5,11 @@ This module is the core of the fraud detection system. It loads raw data,
 applies business rules to flag suspicious activities, and calculates
 fraud scores.
 """
+import numpy as np
 import pandas as pd
 import logging
 from pathlib import Path
-from src import config
+from src import aggregates, config, datastore, documents, flag_masks, peer_baselines, progress, shared_invoices, snapshots, spend_series, supplier_network, supplier_profiles
 
 # --- Data Loading and Preparation ---
 
@@ -29,16 +30,100 @@ def _load_raw_deputy_expenses(deputy_id: int) -> pd.DataFrame:
 
     return pd.concat(all_months_df, ignore_index=True)
 
-def _prepare_expense_data(df: pd.DataFrame) -> pd.DataFrame:
-    """Prepares the expense dataframe for analysis."""
+def prepare_expense_data(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Prepares raw expenses for the flags: parses dates and values, drops the
+    rows without them and adds the supplier key. Every audit mode uses it
+    (see `src.out_of_core`).
+    """
     if df.empty:
         return df
     
     df['dataDocumento'] = pd.to_datetime(df['dataDocumento'], errors='coerce')
     df['valorLiquido'] = pd.to_numeric(df['valorLiquido'], errors='coerce')
     df['dia_semana'] = df['dataDocumento'].dt.dayofweek
-    return df.dropna(subset=['dataDocumento', 'valorLiquido'])
+    df = df.dropna(subset=['dataDocumento', 'valorLiquido'])
+    # Canonical supplier key and document validity, computed for the whole column at once.
+    return df.join(documents.normalize_documents(df['cnpjCpfFornecedor']))
+
+def _join_supplier_profiles(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Adds the registry profile of each supplier company ('empresa_*' columns)
+    with a single batched join. The columns are empty when no CNPJ registry
+    has been built, which leaves the company-profile flags unset.
+    """
+    profiles = supplier_profiles.get_profiles(df['supplier_key'])
+    profiles = profiles.set_index('supplier_key').add_prefix('empresa_')
+    return df.join(profiles, on='supplier_key')
+
+def _join_peer_baselines(df: pd.DataFrame, deputy_id: int) -> pd.DataFrame:
+    """
+    Adds the statistics of the deputy's peers for the expense type and month
+    of each expense ('pares_*' columns). The columns are empty for months
+    without baselines, which leaves the peer flag unset.
+    """
+    df = df.assign(periodo=df['ano'] * 100 + df['mes'])
+    baselines = peer_baselines.get_baselines(df['periodo'], deputy_id)
+    baselines = baselines.drop(columns='siglaUf').set_index(['periodo', 'tipoDespesa']).add_prefix('pares_')
+    return df.join(baselines, on=['periodo', 'tipoDespesa']).drop(columns='periodo')
 
+def _join_supplier_network(df: pd.DataFrame, deputy_id: int) -> pd.DataFrame:
+    """
+    Adds the position of each supplier in the deputy's supplier network
+    ('rede_*' columns): its share of the deputy's spending, the deputy's HHI
+    and whether it is shared by unusually many deputies. The columns are empty
+    before the network is analysed, which leaves the network flags unset.
+    """
+    network = supplier_network.get_deputy_suppliers(deputy_id).set_index('supplier_key').add_prefix('rede_')
+    return df.join(network, on='supplier_key')
+
+def _join_spend_series(df: pd.DataFrame, deputy_id: int) -> pd.DataFrame:
+    """
+    Adds whether the deputy's spend on the expense type broke upwards shortly
+    before the expense's month, or was anomalous in it ('serie_*' columns).
+    The columns are empty before the series are analysed, which leaves the
+    spend series flags unset.
+    """
+    df = df.assign(periodo=df['ano'] * 100 + df['mes'])
+    events = spend_series.get_deputy_events(deputy_id).set_index(['periodo', 'tipoDespesa']).add_prefix('serie_')
+    return df.join(events, on=['periodo', 'tipoDespesa']).drop(columns='periodo')
+
+def _join_snapshot_changes(df: pd.DataFrame, deputy_id: int) -> pd.DataFrame:
+    """
+    Adds whether each expense was modified after being published, as found
+    by comparing the versions of the raw monthly files ('versao_modificada').
+    """
+    modified = snapshots.get_modified_documents(deputy_id)
+    if not modified or 'codDocumento' not in df.columns:
+        return df.assign(versao_modificada=False)
+    codes = df['codDocumento'].astype(str).str.replace(r'\.0$', '', regex=True)
+    return df.assign(versao_modificada=codes.isin(modified))
+
+def _join_shared_invoices(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Adds whether each expense's invoice was also submitted by another deputy
+    ('nota_compartilhada'). The column is False before the invoice keys are
+    refreshed, which leaves the cross-deputy duplicate flag unset.
+    """
+    hashes, valid = shared_invoices.invoice_key_hashes(df)
+    return df.assign(nota_compartilhada=valid & np.isin(hashes, shared_invoices.get_shared_hashes()))
+
+
+# --- Deputy-Wide Statistics ---
+
+# Columns that identify the same transaction submitted twice.
+DUPLICATE_KEY_COLUMNS = ['dataDocumento', 'supplier_key', 'valorLiquido']
+
+def compute_value_stats(values: pd.Series) -> dict:
+    """Computes the value thresholds used by the outlier and percentile flags."""
+    q1, q3, p95 = np.quantile(values.to_numpy(dtype=float), [0.25, 0.75, 0.95])
+    return {'iqr_upper_bound': q3 + 1.5 * (q3 - q1), 'p95': p95}
+
+def duplicate_key_hashes(df: pd.DataFrame) -> np.ndarray:
+    """Hashes the duplicate key of every row, so duplicates can be counted across chunks."""
+    # Chunks may have parsed the dates or values with other dtypes.
+    keys = df[DUPLICATE_KEY_COLUMNS].astype({'dataDocumento': 'datetime64[ns]', 'valorLiquido': float})
+    return pd.util.hash_pandas_object(keys, index=False).to_numpy()
 
 # --- Flagging Functions ---
 
@@ -50,26 +135,113 @@ def flag_round_number_expense(df: pd.DataFrame) -> pd.Series:
     """Flags expenses with suspicious round numbers."""
     return df['valorLiquido'].apply(lambda x: x > 0 and (x % 100 == 0 or x % 500 == 0 or x % 1000 == 0))
 
-def flag_high_value_outlier(df: pd.DataFrame) -> pd.Series:
-    """Flags expenses that are outliers based on the IQR method."""
+def flag_high_value_outlier(df: pd.DataFrame, stats: dict = None) -> pd.Series:
+    """
+    Flags expenses that are outliers based on the IQR method. `stats` holds
+    the bound computed over the deputy's whole history when the expenses are
+    audited in chunks (see `compute_value_stats`).
+    """
     if df.empty:
         return pd.Series([False] * len(df))
-    Q1 = df['valorLiquido'].quantile(0.25)
-    Q3 = df['valorLiquido'].quantile(0.75)
-    IQR = Q3 - Q1
-    upper_bound = Q3 + 1.5 * IQR
+    upper_bound = stats['iqr_upper_bound'] if stats else compute_value_stats(df['valorLiquido'])['iqr_upper_bound']
     return df['valorLiquido'] > upper_bound
 
-def flag_duplicated_transaction(df: pd.DataFrame) -> pd.Series:
-    """Flags transactions that are exact duplicates based on key columns."""
-    key_columns = ['dataDocumento', 'cnpjCpfFornecedor', 'valorLiquido']
-    return df.duplicated(subset=key_columns, keep=False)
+def flag_duplicated_transaction(df: pd.DataFrame, stats: dict = None) -> pd.Series:
+    """
+    Flags transactions that are exact duplicates based on key columns. With
+    `stats`, duplicates are those whose key hash occurs more than once in the
+    deputy's whole history.
+    """
+    if stats is None:
+        return df.duplicated(subset=DUPLICATE_KEY_COLUMNS, keep=False)
+    return pd.Series(np.isin(duplicate_key_hashes(df), stats['duplicate_hashes']), index=df.index)
 
-def flag_high_value_percentile(df: pd.DataFrame) -> pd.Series:
+def flag_high_value_percentile(df: pd.DataFrame, stats: dict = None) -> pd.Series:
     """Flags expenses in the top 5% of all expenses for that deputy."""
     if df.empty:
         return pd.Series([False] * len(df))
-    return df['valorLiquido'] > df['valorLiquido'].quantile(0.95)
+    threshold = stats['p95'] if stats else compute_value_stats(df['valorLiquido'])['p95']
+    return df['valorLiquido'] > threshold
+
+def flag_invalid_document(df: pd.DataFrame) -> pd.Series:
+    """Flags suppliers without a CNPJ/CPF or whose document fails the check-digit validation."""
+    return ~df['documento_valido']
+
+# --- Supplier Profile Flags ---
+
+def flag_recent_company(df: pd.DataFrame) -> pd.Series:
+    """Flags payments to companies opened shortly before (or after) the expense."""
+    opened = pd.to_datetime(df['empresa_data_inicio_atividade'], errors='coerce')
+    return (df['dataDocumento'] - opened).dt.days < config.SUPPLIER_MIN_AGE_DAYS
+
+def flag_irregular_status(df: pd.DataFrame) -> pd.Series:
+    """Flags payments to companies whose situação cadastral was already not ATIVA."""
+    since = pd.to_datetime(df['empresa_data_situacao_cadastral'], errors='coerce')
+    status = pd.to_numeric(df['empresa_situacao_cadastral'], errors='coerce')
+    return status.notna() & (status != 2) & (since <= df['dataDocumento'])
+
+def flag_unrelated_activity(df: pd.DataFrame) -> pd.Series:
+    """Flags companies whose main CNAE is not expected for the expense type."""
+    division = df['empresa_cnae_fiscal_principal'].astype('string').str.zfill(7).str[:2]
+    expected = {
+        f"{expense_type}|{div}"
+        for expense_type, divisions in config.EXPENSE_TYPE_CNAE_DIVISIONS.items()
+        for div in divisions
+    }
+    checked = df['tipoDespesa'].isin(list(config.EXPENSE_TYPE_CNAE_DIVISIONS)) & division.notna()
+    return (checked & ~(df['tipoDespesa'] + "|" + division).isin(list(expected))).fillna(False).astype(bool)
+
+def flag_small_capital(df: pd.DataFrame) -> pd.Series:
+    """Flags large payments to companies with a tiny capital social."""
+    capital = pd.to_numeric(df['empresa_capital_social'], errors='coerce')
+    return (df['valorLiquido'] >= config.SUPPLIER_LARGE_PAYMENT) & (capital < config.SUPPLIER_SMALL_CAPITAL)
+
+# --- Peer Baseline Flag ---
+
+def flag_peer_outlier(df: pd.DataFrame) -> pd.Series:
+    """
+    Flags expenses far above what all deputies paid for the same expense type
+    in the same month (robust z-score over the peers' median and MAD).
+    """
+    robust_z = (df['valorLiquido'] - df['pares_mediana']) / (1.4826 * df['pares_mad'])
+    return (
+        (df['pares_n'] >= config.PEER_MIN_GROUP_SIZE)
+        & (df['pares_mad'] > 0)
+        & (robust_z > config.PEER_Z_THRESHOLD)
+        & (df['valorLiquido'] > df['pares_p95'])
+    ).fillna(False).astype(bool)
+
+# --- Supplier Network Flags ---
+
+def flag_concentrated_supplier(df: pd.DataFrame) -> pd.Series:
+    """
+    Flags payments to a supplier holding a large share of the deputy's
+    spending when that spending is highly concentrated (HHI).
+    """
+    return (
+        (df['rede_hhi'] >= config.NETWORK_HHI_THRESHOLD)
+        & (df['rede_participacao'] >= config.NETWORK_MIN_SUPPLIER_SHARE)
+    ).fillna(False).astype(bool)
+
+def flag_shared_supplier(df: pd.DataFrame) -> pd.Series:
+    """Flags payments to suppliers paid by unusually many deputies."""
+    return df['rede_compartilhado'].fillna(False).astype(bool)
+
+def flag_spend_break(df: pd.DataFrame) -> pd.Series:
+    """Flags expenses of a type whose monthly spend recently jumped to a higher level."""
+    return df['serie_quebra'].fillna(False).astype(bool)
+
+def flag_anomalous_month(df: pd.DataFrame) -> pd.Series:
+    """Flags expenses of a type whose spend in the month was far above the deputy's history."""
+    return df['serie_atipico'].fillna(False).astype(bool)
+
+def flag_retroactive_edit(df: pd.DataFrame) -> pd.Series:
+    """Flags expenses that were modified after being published."""
+    return df['versao_modificada'].astype(bool)
+
+def flag_cross_deputy_duplicate(df: pd.DataFrame) -> pd.Series:
+    """Flags invoices (same supplier, number, date and value) submitted by more than one deputy."""
+    return df['nota_compartilhada'].astype(bool)
 
 # --- Score Calculation ---
 
@@ -89,52 +261,99 @@ FLAG_FUNCTIONS = {
     "flag_valor_atipico": flag_high_value_outlier,
     "flag_transacao_duplicada": flag_duplicated_transaction,
     "flag_valor_alto_percentil": flag_high_value_percentile,
+    "flag_documento_invalido": flag_invalid_document,
+    "flag_empresa_recente": flag_recent_company,
+    "flag_situacao_irregular": flag_irregular_status,
+    "flag_cnae_incompativel": flag_unrelated_activity,
+    "flag_capital_incompativel": flag_small_capital,
+    "flag_duplicada_entre_deputados": flag_cross_deputy_duplicate,
+    "flag_acima_dos_pares": flag_peer_outlier,
+    "flag_fornecedor_concentrado": flag_concentrated_supplier,
+    "flag_fornecedor_compartilhado": flag_shared_supplier,
+    "flag_quebra_de_gasto": flag_spend_break,
+    "flag_mes_atipico": flag_anomalous_month,
+    "flag_alterada_retroativamente": flag_retroactive_edit,
 }
 
+# Flags that depend on statistics over all of a deputy's expenses.
+DEPUTY_STAT_FLAGS = {"flag_valor_atipico", "flag_transacao_duplicada", "flag_valor_alto_percentil"}
+
+# The document ids are kept so the global search finds flagged expenses by them too.
 KEY_COLUMNS = [
     'ano', 'mes', 'dataDocumento', 'tipoDespesa', 
-    'valorLiquido', 'nomeFornecedor', 'cnpjCpfFornecedor', 'urlDocumento'
+    'valorLiquido', 'nomeFornecedor', 'cnpjCpfFornecedor', 'supplier_key', 'urlDocumento',
+    'codDocumento', 'numDocumento'
 ]
 
 
 # --- Main Auditor Runner ---
 
-def run_deputy_audit(deputy_id: int):
+def apply_flags(df: pd.DataFrame, deputy_id: int, stats: dict = None) -> pd.DataFrame:
+    """
+    Joins the supplier profiles, peer baselines, supplier network, spend
+    series events, snapshot changes and shared invoices, evaluates every
+    registered flag and scores the expenses.
+    `stats` are deputy-wide statistics for flags evaluated on a chunk of the
+    deputy's expenses; without them the dataframe is the whole history.
+    """
+    df = _join_supplier_profiles(df)
+    df = _join_peer_baselines(df, deputy_id)
+    df = _join_supplier_network(df, deputy_id)
+    df = _join_spend_series(df, deputy_id)
+    df = _join_snapshot_changes(df, deputy_id)
+    df = _join_shared_invoices(df)
+    for flag_name, flag_func in FLAG_FUNCTIONS.items():
+        if stats is not None and flag_name in DEPUTY_STAT_FLAGS:
+            df[flag_name] = flag_func(df, stats)
+        else:
+            df[flag_name] = flag_func(df)
+    return calculate_fraud_score(df)
+
+def select_flagged(df_with_scores: pd.DataFrame) -> pd.DataFrame:
+    """Keeps the flagged expenses and the columns saved for them."""
+    flag_names = [col for col in df_with_scores.columns if col.startswith("flag_")]
+    flagged_df = df_with_scores[df_with_scores[flag_names].any(axis=1)]
+    columns_to_keep = KEY_COLUMNS + ['score_fraude'] + flag_names
+    return flagged_df[[col for col in columns_to_keep if col in flagged_df.columns]].copy()
+
+def get_flagged_output_path(deputy_id: int) -> Path:
+    """Returns the path of a deputy's flagged expenses CSV, creating its directory."""
+    path = config.flagged_expenses_path(deputy_id)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return path
+
+def run_deputy_audit(deputy_id: int) -> pd.DataFrame:
     """
     Loads, processes, and saves the audited expense data for a single deputy.
+    Returns the flagged expenses that were saved (empty if there are none).
     """
     logging.info(f"Running audit for deputy ID: {deputy_id}")
     
     raw_df = _load_raw_deputy_expenses(deputy_id)
     if raw_df.empty:
         logging.warning(f"Skipping audit for deputy {deputy_id} due to no raw data.")
-        return
+        return pd.DataFrame()
+    progress.count("audit", "rows", len(raw_df))
+    datastore.replace_deputy_rows(datastore.RAW_TABLE, deputy_id, raw_df)
         
-    df = _prepare_expense_data(raw_df)
+    df = prepare_expense_data(raw_df)
     if df.empty:
         logging.warning(f"Skipping audit for deputy {deputy_id} after data preparation (no valid data).")
-        return
+        return pd.DataFrame()
     
-    flag_names = list(FLAG_FUNCTIONS.keys())
-    for flag_name, flag_func in FLAG_FUNCTIONS.items():
-        df[flag_name] = flag_func(df)
-
-    df_with_scores = calculate_fraud_score(df)
+    df_with_scores = apply_flags(df, deputy_id)
+    aggregates.refresh_deputy(deputy_id, df_with_scores)
+    flag_masks.store_deputy_masks(deputy_id, df_with_scores)
 
-    flagged_df = df_with_scores[df_with_scores[flag_names].any(axis=1)].copy()
+    final_df = select_flagged(df_with_scores)
     
-    if flagged_df.empty:
+    if final_df.empty:
         logging.info(f"No suspicious transactions found for deputy {deputy_id}.")
-        return
+        datastore.replace_deputy_rows(datastore.FLAGGED_TABLE, deputy_id, final_df)
+        return final_df
 
-    columns_to_keep = KEY_COLUMNS + ['score_fraude'] + flag_names
-    final_columns = [col for col in columns_to_keep if col in flagged_df.columns]
-    final_df = flagged_df[final_columns]
-
-    processed_dir = config.PROCESSED_DATA_DIR / "flags_and_scores" / str(deputy_id)
-    processed_dir.mkdir(parents=True, exist_ok=True)
-    output_path = processed_dir / "flagged_expenses.csv"
-    
-    final_df.to_csv(output_path, index=False)
+    final_df.to_csv(get_flagged_output_path(deputy_id), index=False)
+    datastore.replace_deputy_rows(datastore.FLAGGED_TABLE, deputy_id, final_df)
     
     logging.info(f"Finished audit for deputy ID: {deputy_id}, found {len(final_df)} flagged expenses.")
+    return final_df
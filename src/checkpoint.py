@@ -0,0 +1,126 @@
+"""
+Checkpoint Module
+
+This module persists the progress of a pipeline run, per stage and per deputy,
+so that a run can stop cleanly at a safe point and later resume without redoing
+completed downloads or audits. The same mechanism recovers from crashes and
+machine reboots: re-running the same command picks up from the checkpoint.
+
+A run is identified by its parameters (date, period, limit and shard, if any). Each stage keeps
+its own list of completed deputies, and a stage's entry is removed once the
+stage completes, so a later run with the same parameters starts fresh.
+
+Pausing is cooperative: `request_pause()` writes a control file that the
+pipeline checks between deputies. When it sees the request, it stops and exits
+with PAUSED_EXIT_CODE.
+"""
+import fcntl
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from src import config
+
+# Exit code of a pipeline run that stopped because a pause was requested.
+PAUSED_EXIT_CODE = 75
+
+class PipelinePaused(Exception):
+    """Raised at a safe point when a pause was requested."""
+
+# --- Pause Control ---
+
+def request_pause():
+    """Asks running pipelines to stop at their next safe point."""
+    config.CONTROL_FILE.write_text(json.dumps({"pause_requested": True}), encoding="utf-8")
+
+def clear_pause_request():
+    """Removes a pending pause request."""
+    if config.CONTROL_FILE.exists():
+        os.remove(config.CONTROL_FILE)
+
+def pause_requested() -> bool:
+    """Returns True if a pause was requested."""
+    if not config.CONTROL_FILE.exists():
+        return False
+    try:
+        return json.loads(config.CONTROL_FILE.read_text(encoding="utf-8")).get("pause_requested", False)
+    except (json.JSONDecodeError, IOError):
+        return False
+
+def check_pause():
+    """Raises PipelinePaused if a pause was requested. Call it only at safe points."""
+    if pause_requested():
+        raise PipelinePaused()
+
+# --- Run Checkpoints ---
+
+class RunCheckpoint:
+    """Completed work of a run, persisted after every deputy."""
+
+    def __init__(self, date: str, period: str, limit: int = None, shard: str = None):
+        self.params = {"date": date, "period": period, "limit": limit}
+        name = f"{date}_{period}_{limit or 'all'}"
+        if shard:
+            self.params["shard"] = shard
+            name += f"_shard-{shard.replace('/', '-of-')}"
+        self.path = config.CHECKPOINT_DIR / f"{name}.json"
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _locked_state(self):
+        """Loads the checkpoint under a file lock (shared with other processes) and saves it on exit."""
+        config.CHECKPOINT_DIR.mkdir(parents=True, exist_ok=True)
+        with self._lock, open(self.path.with_suffix(".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                state = self._read()
+                yield state
+                if state["stages"]:
+                    tmp_path = self.path.with_suffix(".tmp")
+                    tmp_path.write_text(json.dumps(state, indent=4), encoding="utf-8")
+                    os.replace(tmp_path, self.path)
+                elif self.path.exists():
+                    os.remove(self.path)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read(self) -> dict:
+        if self.path.exists():
+            try:
+                return json.loads(self.path.read_text(encoding="utf-8"))
+            except (json.JSONDecodeError, IOError) as e:
+                logging.warning(f"Could not read checkpoint {self.path} ({e}). Starting fresh.")
+        return {"params": self.params, "stages": {}}
+
+    def completed(self, stage: str) -> set:
+        """Returns the IDs of the deputies already completed in a stage."""
+        return set(self._read()["stages"].get(stage, []))
+
+    def mark_done(self, stage: str, deputy_id: int):
+        """Records that a deputy completed a stage."""
+        with self._locked_state() as state:
+            done = state["stages"].setdefault(stage, [])
+            if int(deputy_id) not in done:
+                done.append(int(deputy_id))
+
+    def complete_stage(self, stage: str):
+        """Forgets a stage once it has fully completed."""
+        with self._locked_state() as state:
+            state["stages"].pop(stage, None)
+
+def list_checkpoints() -> list:
+    """Returns the parameters and completed counts of every interrupted run."""
+    if not config.CHECKPOINT_DIR.exists():
+        return []
+    interrupted = []
+    for path in sorted(config.CHECKPOINT_DIR.glob("*.json")):
+        try:
+            state = json.loads(path.read_text(encoding="utf-8"))
+        except (json.JSONDecodeError, IOError):
+            continue
+        interrupted.append({
+            **state["params"],
+            "completed": {stage: len(ids) for stage, ids in state["stages"].items()},
+        })
+    return interrupted
@@ -0,0 +1,275 @@
+"""
+CNPJ Registry Module
+
+This module builds and queries a local index of the Receita Federal CNPJ open
+data, used to enrich suppliers with their registration data (situação
+cadastral, data de início de atividade, CNAE, capital social).
+
+The public dumps are split into multi-GB, headerless, ';'-separated latin-1
+CSVs ("Estabelecimentos" and "Empresas"). They are streamed once, in chunks,
+into a compact SQLite file whose tables are keyed by the numeric CNPJ (the
+B-tree primary key, so each lookup is O(log n)). Only the columns the auditor
+uses are kept. The index is rebuilt into a temporary file and swapped in
+atomically, so readers never see a half-built registry.
+
+Suppliers are looked up in batches through a temporary key table joined
+against the index, with a small in-process LRU cache for hot CNPJs.
+
+Usage:
+    python -m src.cnpj_registry --establishments Estabelecimentos*.csv --companies Empresas*.csv
+"""
+import argparse
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+import pandas as pd
+from src import config, documents
+
+ESTABLISHMENTS_TABLE = "establishments"
+COMPANIES_TABLE = "companies"
+
+# Column positions of the headerless Receita Federal layouts that are kept.
+ESTABLISHMENT_COLUMNS = {
+    0: "cnpj_basico", 1: "cnpj_ordem", 2: "cnpj_dv", 3: "identificador_matriz_filial",
+    4: "nome_fantasia", 5: "situacao_cadastral", 6: "data_situacao_cadastral",
+    10: "data_inicio_atividade", 11: "cnae_fiscal_principal", 19: "uf", 20: "municipio",
+}
+COMPANY_COLUMNS = {
+    0: "cnpj_basico", 1: "razao_social", 2: "natureza_juridica", 4: "capital_social", 5: "porte",
+}
+
+SITUACAO_LABELS = {1: "NULA", 2: "ATIVA", 3: "SUSPENSA", 4: "INAPTA", 8: "BAIXADA"}
+
+# Columns returned by lookups, in order.
+PROFILE_COLUMNS = [
+    "cnpj", "nome_fantasia", "identificador_matriz_filial", "situacao_cadastral",
+    "data_situacao_cadastral", "data_inicio_atividade", "cnae_fiscal_principal",
+    "uf", "municipio", "razao_social", "natureza_juridica", "capital_social", "porte",
+]
+
+_cache_lock = threading.Lock()
+_cache = OrderedDict()
+_cache_snapshot = None
+
+# --- Building ---
+
+def _snapshot_id(paths: list) -> str:
+    """Identifies a registry snapshot by the names, sizes and mtimes of its source files."""
+    digest = hashlib.sha1()
+    for path in sorted(Path(p) for p in paths):
+        stat = path.stat()
+        digest.update(f"{path.name}:{stat.st_size}:{stat.st_mtime_ns};".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+def _read_dump(path: Path, columns: dict):
+    """Streams a headerless Receita Federal CSV in chunks, keeping only `columns`."""
+    return pd.read_csv(
+        path, sep=";", header=None, encoding="latin-1", dtype=str,
+        usecols=list(columns), chunksize=config.CNPJ_IMPORT_CHUNK_ROWS,
+        keep_default_na=False, on_bad_lines="warn",
+    )
+
+def _to_iso_date(series: pd.Series) -> pd.Series:
+    """Converts YYYYMMDD strings to YYYY-MM-DD, with '0' and blanks as missing."""
+    return pd.to_datetime(series, format="%Y%m%d", errors="coerce").dt.strftime("%Y-%m-%d")
+
+def _prepare_establishments(chunk: pd.DataFrame) -> pd.DataFrame:
+    chunk = chunk.rename(columns=ESTABLISHMENT_COLUMNS)
+    cnpj = chunk["cnpj_basico"].str.zfill(8) + chunk["cnpj_ordem"].str.zfill(4) + chunk["cnpj_dv"].str.zfill(2)
+    return pd.DataFrame({
+        "cnpj": pd.to_numeric(cnpj, errors="coerce"),
+        "cnpj_basico": pd.to_numeric(chunk["cnpj_basico"], errors="coerce"),
+        "nome_fantasia": chunk["nome_fantasia"].str.strip(),
+        "identificador_matriz_filial": pd.to_numeric(chunk["identificador_matriz_filial"], errors="coerce"),
+        "situacao_cadastral": pd.to_numeric(chunk["situacao_cadastral"], errors="coerce"),
+        "data_situacao_cadastral": _to_iso_date(chunk["data_situacao_cadastral"]),
+        "data_inicio_atividade": _to_iso_date(chunk["data_inicio_atividade"]),
+        "cnae_fiscal_principal": chunk["cnae_fiscal_principal"],
+        "uf": chunk["uf"],
+        "municipio": chunk["municipio"],
+    }).dropna(subset=["cnpj"])
+
+def _prepare_companies(chunk: pd.DataFrame) -> pd.DataFrame:
+    chunk = chunk.rename(columns=COMPANY_COLUMNS)
+    return pd.DataFrame({
+        "cnpj_basico": pd.to_numeric(chunk["cnpj_basico"], errors="coerce"),
+        "razao_social": chunk["razao_social"].str.strip(),
+        "natureza_juridica": chunk["natureza_juridica"],
+        "capital_social": pd.to_numeric(chunk["capital_social"].str.replace(",", ".", regex=False), errors="coerce"),
+        "porte": pd.to_numeric(chunk["porte"], errors="coerce"),
+    }).dropna(subset=["cnpj_basico"])
+
+def _import_files(conn, table: str, paths: list, columns: dict, prepare) -> int:
+    """Streams dump files into `table` chunk by chunk. Returns the number of rows imported."""
+    total = 0
+    for path in paths:
+        logging.info(f"Importing {path} into the CNPJ registry.")
+        for chunk in _read_dump(path, columns):
+            rows = prepare(chunk)
+            placeholders = ", ".join("?" for _ in rows.columns)
+            conn.executemany(
+                f"INSERT OR REPLACE INTO {table} ({', '.join(rows.columns)}) VALUES ({placeholders})",
+                rows.astype(object).where(rows.notna(), None).itertuples(index=False, name=None),
+            )
+            total += len(rows)
+            logging.info(f"{table}: {total} rows imported.")
+    return total
+
+def build_registry(establishment_files: list, company_files: list = ()) -> str:
+    """
+    Builds the registry from Receita Federal dumps and atomically replaces the
+    current one. Returns the snapshot ID of the new registry.
+    """
+    establishment_files = [Path(p) for p in establishment_files]
+    company_files = [Path(p) for p in company_files]
+    snapshot = _snapshot_id(establishment_files + company_files)
+    config.CNPJ_REGISTRY_FILE.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = config.CNPJ_REGISTRY_FILE.with_suffix(".building")
+    if tmp_path.exists():
+        os.remove(tmp_path)
+
+    started = time.time()
+    conn = sqlite3.connect(tmp_path)
+    try:
+        # The file is rebuilt from scratch and swapped in afterwards, so
+        # durability during the import is not needed.
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute(f"""
+            CREATE TABLE {ESTABLISHMENTS_TABLE} (
+                cnpj INTEGER PRIMARY KEY, cnpj_basico INTEGER, nome_fantasia TEXT,
+                identificador_matriz_filial INTEGER, situacao_cadastral INTEGER,
+                data_situacao_cadastral TEXT, data_inicio_atividade TEXT,
+                cnae_fiscal_principal TEXT, uf TEXT, municipio TEXT
+            )""")
+        conn.execute(f"""
+            CREATE TABLE {COMPANIES_TABLE} (
+                cnpj_basico INTEGER PRIMARY KEY, razao_social TEXT, natureza_juridica TEXT,
+                capital_social REAL, porte INTEGER
+            )""")
+        conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+        n_establishments = _import_files(conn, ESTABLISHMENTS_TABLE, establishment_files,
+                                         ESTABLISHMENT_COLUMNS, _prepare_establishments)
+        n_companies = _import_files(conn, COMPANIES_TABLE, company_files, COMPANY_COLUMNS, _prepare_companies)
+        conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", [
+            ("snapshot", snapshot),
+            ("built_at", time.strftime("%Y-%m-%dT%H:%M:%S")),
+            ("establishments", str(n_establishments)),
+            ("companies", str(n_companies)),
+        ])
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_path, config.CNPJ_REGISTRY_FILE)
+    clear_cache()
+    logging.info(
+        f"CNPJ registry {snapshot} built in {time.time() - started:.0f}s "
+        f"({n_establishments} establishments, {n_companies} companies)."
+    )
+    return snapshot
+
+# --- Querying ---
+
+@contextmanager
+def _connect():
+    conn = sqlite3.connect(f"file:{config.CNPJ_REGISTRY_FILE}?mode=ro", uri=True)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+def registry_exists() -> bool:
+    """Returns True if a registry has been built."""
+    return config.CNPJ_REGISTRY_FILE.exists()
+
+def get_registry_info() -> dict:
+    """Returns the metadata (snapshot, build time, row counts) of the registry, or {}."""
+    if not registry_exists():
+        return {}
+    with _connect() as conn:
+        return dict(conn.execute("SELECT key, value FROM meta").fetchall())
+
+def get_snapshot_id() -> str:
+    """Returns the snapshot ID of the current registry, or None if there is none."""
+    return get_registry_info().get("snapshot")
+
+def clear_cache():
+    """Empties the hot CNPJ cache."""
+    with _cache_lock:
+        _cache.clear()
+
+def lookup_cnpjs(cnpjs) -> pd.DataFrame:
+    """
+    Looks up a batch of 14-digit CNPJs (strings or integers) and returns one row
+    per CNPJ found, with PROFILE_COLUMNS. CNPJs are cached, including misses.
+    """
+    global _cache_snapshot
+    keys = pd.to_numeric(pd.Series(cnpjs, dtype=object), errors="coerce").dropna().astype("int64").unique()
+    if not registry_exists() or len(keys) == 0:
+        return pd.DataFrame(columns=PROFILE_COLUMNS)
+
+    snapshot = get_snapshot_id()
+    with _cache_lock:
+        if _cache_snapshot != snapshot:
+            _cache.clear()
+            _cache_snapshot = snapshot
+        hits = {}
+        for key in keys:
+            if key in _cache:
+                _cache.move_to_end(key)
+                hits[key] = _cache[key]
+    misses = [int(key) for key in keys if key not in hits]
+
+    if misses:
+        select = ", ".join(f"e.{col}" for col in PROFILE_COLUMNS[:9]) + ", " + \
+                 ", ".join(f"c.{col}" for col in PROFILE_COLUMNS[9:])
+        with _connect() as conn:
+            conn.execute("CREATE TEMP TABLE lookup_keys (cnpj INTEGER PRIMARY KEY)")
+            conn.executemany("INSERT OR IGNORE INTO lookup_keys (cnpj) VALUES (?)", ((key,) for key in misses))
+            rows = conn.execute(f"""
+                SELECT {select}
+                FROM lookup_keys k
+                JOIN {ESTABLISHMENTS_TABLE} e ON e.cnpj = k.cnpj
+                LEFT JOIN {COMPANIES_TABLE} c ON c.cnpj_basico = e.cnpj_basico
+            """).fetchall()
+        found = {row[0]: row for row in rows}
+        with _cache_lock:
+            for key in misses:
+                _cache[key] = found.get(key)
+                hits[key] = found.get(key)
+            while len(_cache) > config.CNPJ_CACHE_SIZE:
+                _cache.popitem(last=False)
+
+    records = [row for row in hits.values() if row is not None]
+    return pd.DataFrame.from_records(records, columns=PROFILE_COLUMNS)
+
+def enrich_suppliers(df: pd.DataFrame, column: str = "cnpjCpfFornecedor") -> pd.DataFrame:
+    """
+    Left-joins the registry data of every supplier CNPJ in `column` onto `df`.
+    CPFs and unknown CNPJs get empty registry columns.
+    """
+    if df.empty or column not in df.columns:
+        return df
+    normalized = documents.normalize_documents(df[column])
+    keys = pd.to_numeric(normalized['supplier_key'].where(normalized['documento_tipo'] == "CNPJ"), errors="coerce")
+    profiles = lookup_cnpjs(keys.dropna())
+    profiles["situacao_cadastral"] = profiles["situacao_cadastral"].map(SITUACAO_LABELS)
+    enriched = df.assign(_cnpj_key=keys.astype("Int64"))
+    profiles = profiles.rename(columns={"cnpj": "_cnpj_key"}).astype({"_cnpj_key": "Int64"})
+    return enriched.merge(profiles, on="_cnpj_key", how="left").drop(columns="_cnpj_key")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Build the local CNPJ registry from Receita Federal dumps.")
+    parser.add_argument("--establishments", nargs="+", required=True,
+                        help="'Estabelecimentos' CSV files of the Receita Federal CNPJ dump.")
+    parser.add_argument("--companies", nargs="*", default=[],
+                        help="'Empresas' CSV files (adds razão social and capital social).")
+    args = parser.parse_args()
+    build_registry(args.establishments, args.companies)
@@ -13,6 +13,11 @@ BASE_URL = "https://dadosabertos.camara.leg.br/api/v2"
 # Number of months of expense history to download for each deputy.
 MONTHS_OF_HISTORY = 12
 
+# First year and legislatures downloaded in full-history mode (--full-history):
+# every deputy who served since 2008, with all of their expenses.
+HISTORY_START_YEAR = 2008
+HISTORY_LEGISLATURES = [53, 54, 55, 56, 57]
+
 # --- Auditor & Reporter Configuration ---
 
 # The score above which an expense is considered "critical" for reporting.
@@ -25,11 +30,169 @@ FLAG_WEIGHTS = {
     "flag_valor_redondo": 2,
     "flag_valor_alto_percentil": 2,
     "flag_fim_de_semana": 1,
+    "flag_documento_invalido": 2,
+    "flag_empresa_recente": 3,
+    "flag_situacao_irregular": 4,
+    "flag_cnae_incompativel": 2,
+    "flag_capital_incompativel": 2,
+    "flag_duplicada_entre_deputados": 3,
+    "flag_acima_dos_pares": 3,
+    "flag_fornecedor_concentrado": 2,
+    "flag_fornecedor_compartilhado": 2,
+    "flag_quebra_de_gasto": 2,
+    "flag_mes_atipico": 1,
+    "flag_alterada_retroativamente": 2,
+}
+
+# --- Supplier Profile Flags ---
+# Evaluated only when the CNPJ registry has been built (see src/cnpj_registry.py).
+
+# A supplier is "recent" when it opened less than this many days before being paid.
+SUPPLIER_MIN_AGE_DAYS = 180
+
+# Payments at least this large to a company whose capital social is below
+# SUPPLIER_SMALL_CAPITAL are flagged.
+SUPPLIER_LARGE_PAYMENT = 5000
+SUPPLIER_SMALL_CAPITAL = 10000
+
+# CNAE divisions (first two digits of the main CNAE) expected for each expense
+# type. Expense types not listed here are not checked.
+EXPENSE_TYPE_CNAE_DIVISIONS = {
+    "COMBUSTÍVEIS E LUBRIFICANTES.": ["19", "46", "47"],
+    "TELEFONIA": ["61"],
+    "SERVIÇOS POSTAIS": ["53"],
+    "PASSAGEM AÉREA - SIGEPA": ["51", "79"],
+    "PASSAGEM AÉREA - RPA": ["51", "79"],
+    "PASSAGEM AÉREA - REEMBOLSO": ["51", "79"],
+    "PASSAGENS TERRESTRES, MARÍTIMAS OU FLUVIAIS": ["49", "50", "79"],
+    "LOCAÇÃO OU FRETAMENTO DE VEÍCULOS AUTOMOTORES": ["49", "77"],
+    "LOCAÇÃO OU FRETAMENTO DE AERONAVES": ["51", "77"],
+    "LOCAÇÃO OU FRETAMENTO DE EMBARCAÇÕES": ["50", "77"],
+    "HOSPEDAGEM ,EXCETO DO PARLAMENTAR NO DISTRITO FEDERAL.": ["55"],
+    "FORNECIMENTO DE ALIMENTAÇÃO DO PARLAMENTAR": ["10", "47", "56"],
+    "SERVIÇO DE TÁXI, PEDÁGIO E ESTACIONAMENTO": ["49", "52"],
+    "SERVIÇO DE SEGURANÇA PRESTADO POR EMPRESA ESPECIALIZADA.": ["80"],
+    "DIVULGAÇÃO DA ATIVIDADE PARLAMENTAR.": ["18", "58", "59", "60", "63", "70", "73", "74", "82"],
+    "CONSULTORIAS, PESQUISAS E TRABALHOS TÉCNICOS.": ["62", "63", "69", "70", "71", "72", "73", "74", "78", "85"],
+    "ASSINATURA DE PUBLICAÇÕES": ["47", "58", "63"],
+    "PARTICIPAÇÃO EM CURSO, PALESTRA OU EVENTO SIMILAR": ["82", "85", "94"],
 }
 
+# --- Peer Baseline Flag ---
+
+# An expense is flagged when its robust z-score against all deputies' expenses
+# of the same type and month ((value - median) / (1.4826 * MAD)) exceeds the
+# threshold and it is above the peers' 95th percentile. Groups with fewer
+# expenses than the minimum are not used.
+PEER_Z_THRESHOLD = 3.5
+PEER_MIN_GROUP_SIZE = 20
+
+# Compare deputies only with the deputies of the same UF.
+PEER_BASELINE_BY_UF = False
+
+# --- Supplier Network Configuration ---
+# See src/supplier_network.py.
+
+# A deputy's spending is "concentrated" when the Herfindahl-Hirschman index of
+# their supplier shares (0 to 1) reaches this value; payments to suppliers
+# holding at least the minimum share of it are then flagged.
+NETWORK_HHI_THRESHOLD = 0.25
+NETWORK_MIN_SUPPLIER_SHARE = 0.10
+
+# A supplier is "shared" when the robust z-score of (the log of) its number of
+# deputies exceeds the threshold, among suppliers paid by two or more deputies.
+# Suppliers paid by more than the ubiquitous share of all deputies (airlines,
+# postal services) are expected to be shared and are never flagged.
+NETWORK_SHARED_Z = 3.5
+NETWORK_MIN_SHARED_DEPUTIES = 5
+NETWORK_UBIQUITOUS_SHARE = 0.25
+
+# Two deputies are linked when they share at least the minimum number of
+# "rare" suppliers, paid by no more than the given number of deputies;
+# communities are the connected groups of linked deputies.
+NETWORK_COMMUNITY_MIN_COMMON = 3
+NETWORK_COMMUNITY_MAX_DEPUTIES = 10
+
+# --- Spend Series Configuration ---
+# See src/spend_series.py.
+
+# A change point is a month where the mean (seasonally adjusted) spend of the
+# following window differs from the mean of the preceding window by at least
+# the given t statistic and ratio. Expenses of the first window after an
+# upward change point are flagged.
+SERIES_BREAK_WINDOW = 6
+SERIES_BREAK_T = 4.0
+SERIES_BREAK_RATIO = 2.0
+
+# A month is anomalous when its seasonally adjusted spend exceeds the median of
+# the trailing window (with at least the minimum history) by the given robust
+# z-score.
+SERIES_ANOMALY_WINDOW = 12
+SERIES_ANOMALY_MIN_HISTORY = 6
+SERIES_ANOMALY_Z = 5.0
+
+# Changes and anomalies smaller than this many reais per month are ignored.
+SERIES_MIN_EXCESS = 1000.0
+
+# --- Streaming Pipeline Configuration ---
+
+# Maximum number of downloaded deputies waiting to be audited. The downloader
+# blocks when the queue is full, which bounds memory and buffered work.
+PIPELINE_QUEUE_SIZE = 8
+
+# Number of threads auditing deputies while downloads are still running.
+AUDIT_WORKERS = 1
+
+# --- Out-of-Core Audit Configuration ---
+
+# Memory ceiling of the out-of-core audit (--out-of-core). A deputy's history
+# is read in chunks of months sized to stay under it.
+OUT_OF_CORE_MEMORY_MB = 1024
+
+# --- Job Scheduler Configuration ---
+
+# Maximum number of pipeline stages (download, audit, report) run at the same time.
+JOB_CONCURRENCY = 2
+
+# --- Daemon Configuration ---
+
+# Seconds between two scheduled refreshes of the current month in daemon mode.
+DAEMON_REFRESH_INTERVAL = 3600
+
+# Localhost port of the daemon's control interface (status and refresh triggers).
+DAEMON_PORT = 8765
+
+# --- Query API Configuration ---
+
+# Address of the read-only HTTP query API (`python -m src.api`). It serves
+# localhost only unless bound to another interface explicitly.
+API_HOST = "127.0.0.1"
+API_PORT = 8766
+
+# Default and maximum number of items per page of an API response.
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 1000
+
+# --- CNPJ Registry Configuration ---
+
+# Rows read per chunk when streaming the Receita Federal dumps into the registry.
+CNPJ_IMPORT_CHUNK_ROWS = 200_000
+
+# Number of CNPJ lookups kept in the in-process hot cache.
+CNPJ_CACHE_SIZE = 50_000
+
+# --- Dashboard Configuration ---
+
+# Memory budget of the process-wide data cache shared by the Streamlit pages.
+DATA_CACHE_BUDGET_MB = 512
+
+# Versions of the memory-mapped shared dataset kept on disk (see `src.shared_dataset`).
+SHARED_DATASET_KEEP_VERSIONS = 2
+
 # Project root directory
-# Assuming this file is in src/
-ROOT_DIR = Path(__file__).parent.parent
+# Assuming this file is in src/. OPEN_EXPENSE_TRACKER_ROOT points the pipeline
+# at another data tree instead (e.g. a synthetic dataset for the benchmarks).
+ROOT_DIR = Path(os.environ.get("OPEN_EXPENSE_TRACKER_ROOT", Path(__file__).parent.parent))
 
 # Data and reports directories
 DATA_DIR = ROOT_DIR / "data"
@@ -37,11 +200,45 @@ RAW_DATA_DIR = DATA_DIR / "raw"
 PROCESSED_DATA_DIR = DATA_DIR / "processed"
 REPORTS_DIR = ROOT_DIR / "reports"
 SUMMARY_FILE = RAW_DATA_DIR / "download_summary.json"
+# Content-addressed versions of the raw monthly files, see `src.snapshots`.
+SNAPSHOTS_DIR = RAW_DATA_DIR / "snapshots"
+
+# Flagged expenses of each deputy, written by the auditor (see `flagged_expenses_path`).
+FLAGGED_EXPENSES_DIR = PROCESSED_DATA_DIR / "flags_and_scores"
+
+# Indexed SQLite copy of raw and flagged expenses used by the explorer pages.
+DATASTORE_FILE = PROCESSED_DATA_DIR / "expenses.db"
+
+# Memory-mapped Arrow copy of the dataset the pages read, see `src.shared_dataset`.
+SHARED_DATASET_DIR = PROCESSED_DATA_DIR / "dataset"
+
+# Local index of the Receita Federal CNPJ dumps used to enrich suppliers.
+CNPJ_REGISTRY_FILE = PROCESSED_DATA_DIR / "cnpjs" / "registry.db"
+
+# Per-run checkpoints used to resume interrupted runs, and the control file
+# through which a cooperative pause is requested.
+CHECKPOINT_DIR = DATA_DIR / "checkpoints"
+# Outputs exchanged between pipeline shards (--shard), see `src.sharding`.
+SHARDS_DIR = DATA_DIR / "shards"
+CONTROL_FILE = ROOT_DIR / "pipeline_control.json"
+
+# Append-only JSONL channel with structured progress events from the pipeline.
+PROGRESS_FILE = ROOT_DIR / "pipeline_progress.jsonl"
+
+# --- Directories ---
+
+def ensure_directories():
+    """
+    Creates the data and reports directories. Called by the commands that write
+    to them, so importing the configuration has no side effects.
+    """
+    RAW_DATA_DIR.mkdir(parents=True, exist_ok=True)
+    (RAW_DATA_DIR / "expenses").mkdir(exist_ok=True)
+    PROCESSED_DATA_DIR.mkdir(parents=True, exist_ok=True)
+    FLAGGED_EXPENSES_DIR.mkdir(exist_ok=True)
+    (PROCESSED_DATA_DIR / "cnpjs").mkdir(exist_ok=True)
+    REPORTS_DIR.mkdir(exist_ok=True)
 
-# Ensure all data directories exist
-RAW_DATA_DIR.mkdir(parents=True, exist_ok=True)
-(RAW_DATA_DIR / "expenses").mkdir(exist_ok=True)
-PROCESSED_DATA_DIR.mkdir(parents=True, exist_ok=True)
-(PROCESSED_DATA_DIR / "flags_and_scores").mkdir(exist_ok=True)
-(PROCESSED_DATA_DIR / "cnpjs").mkdir(exist_ok=True)
-REPORTS_DIR.mkdir(exist_ok=True)
+def flagged_expenses_path(deputy_id: int) -> Path:
+    """Returns the path of a deputy's flagged expenses CSV, whether or not it exists."""
+    return FLAGGED_EXPENSES_DIR / str(int(deputy_id)) / "flagged_expenses.csv"
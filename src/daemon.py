@@ -0,0 +1,199 @@
+"""
+Daemon Module
+
+This module implements a long-running watch mode for the pipeline. The daemon
+loads the deputies list and the latest audit results once and keeps them in
+memory. It then refreshes the current month on a schedule: only months whose
+content changed are re-audited, and only the reports affected by those changes
+are regenerated and published to the shared dataset the pages map.
+
+A small HTTP control interface bound to localhost reports the daemon status and
+accepts on-demand refresh triggers:
+
+    GET  /status    current state, last/next refresh and last refresh summary
+    POST /refresh   runs a refresh as soon as possible
+    POST /stop      finishes the current refresh and exits
+"""
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pandas as pd
+from src import aggregates, auditor, config, downloader, pipeline, progress, reporter, shared_dataset
+
+REPORT_PERIODS = ['diário', 'semanal', 'mensal']
+
+class PipelineDaemon:
+    """Keeps pipeline state warm in memory and refreshes it incrementally."""
+
+    def __init__(self, interval: int, limit: int = None):
+        self.interval = interval
+        self.limit = limit
+        self.deputies_df = None
+        self.flagged_by_deputy = {}
+        self.status = "starting"
+        self.last_refresh = None
+        self.next_refresh = None
+        self.last_summary = {}
+        self._trigger = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    # --- State ---
+
+    def load_state(self):
+        """Loads the deputies list and every deputy's flagged expenses once."""
+        downloader.download_deputies()
+        deputies_df = pd.read_csv(config.RAW_DATA_DIR / "deputados.csv")
+        aggregates.refresh_deputies(deputies_df)
+        self.deputies_df = deputies_df.head(self.limit) if self.limit else deputies_df
+        for deputy_id in self.deputies_df['id']:
+            # Mapped from the shared dataset when published, so the state costs no private memory.
+            shared = shared_dataset.read(auditor.get_flagged_output_path(deputy_id))
+            self.flagged_by_deputy[deputy_id] = (
+                shared if shared is not None else reporter.load_deputy_flagged_expenses(deputy_id)
+            )
+        logging.info(f"Daemon state loaded for {len(self.deputies_df)} deputies.")
+
+    def get_status(self) -> dict:
+        """Returns a JSON-serializable snapshot of the daemon status."""
+        with self._lock:
+            return {
+                "status": self.status,
+                "deputies": 0 if self.deputies_df is None else len(self.deputies_df),
+                "interval_s": self.interval,
+                "last_refresh": self.last_refresh,
+                "next_refresh": self.next_refresh,
+                "last_summary": self.last_summary,
+            }
+
+    def _set_status(self, status: str):
+        with self._lock:
+            self.status = status
+
+    # --- Refresh ---
+
+    def refresh(self, ref_date: datetime = None):
+        """
+        Re-downloads the current month for every deputy, re-audits only the
+        deputies whose data changed and regenerates the reports of the current
+        date when anything changed.
+        """
+        ref_date = ref_date or datetime.now()
+        self._set_status("refreshing")
+        started = time.time()
+        progress.reset()
+        progress.start_stage("download", len(self.deputies_df))
+        changed_ids = []
+        for _, deputy in self.deputies_df.iterrows():
+            if self._stop.is_set():
+                break
+            if downloader.download_deputy_month(deputy['id'], ref_date.year, ref_date.month):
+                changed_ids.append(deputy['id'])
+            progress.advance("download")
+        progress.finish_stage("download")
+
+        if changed_ids:
+            pipeline.refresh_month_tables()
+        progress.start_stage("audit", len(changed_ids))
+        for deputy_id in changed_ids:
+            self.flagged_by_deputy[deputy_id] = auditor.run_deputy_audit(deputy_id)
+            progress.advance("audit")
+        progress.finish_stage("audit")
+
+        if changed_ids:
+            self.regenerate_reports(ref_date)
+            shared_dataset.publish()
+
+        with self._lock:
+            self.status = "idle"
+            self.last_refresh = datetime.now().isoformat(timespec='seconds')
+            self.last_summary = {
+                "reference_month": ref_date.strftime('%Y-%m'),
+                "changed_deputies": [int(deputy_id) for deputy_id in changed_ids],
+                "reports_regenerated": bool(changed_ids),
+                "duration_s": round(time.time() - started, 1),
+            }
+        logging.info(f"Daemon refresh finished: {self.last_summary}")
+
+    def regenerate_reports(self, ref_date: datetime):
+        """Rebuilds the reports of the reference date from the in-memory audit results."""
+        progress.start_stage("report", len(REPORT_PERIODS))
+        for period in REPORT_PERIODS:
+            builder = reporter.PeriodReportBuilder(ref_date, period)
+            for position, (_, deputy) in enumerate(self.deputies_df.iterrows()):
+                builder.add_deputy(position, deputy['id'], deputy['nome'], self.flagged_by_deputy.get(deputy['id']))
+            builder.save()
+            progress.advance("report")
+        progress.finish_stage("report")
+
+    # --- Control ---
+
+    def trigger_refresh(self):
+        """Asks the main loop to refresh as soon as possible."""
+        self._trigger.set()
+
+    def stop(self):
+        """Asks the main loop to exit after the current refresh."""
+        self._stop.set()
+        self._trigger.set()
+
+    def run(self):
+        """Runs refreshes on schedule (or when triggered) until stopped."""
+        self.load_state()
+        server = start_control_server(self)
+        try:
+            while not self._stop.is_set():
+                self.refresh()
+                with self._lock:
+                    self.next_refresh = datetime.fromtimestamp(time.time() + self.interval).isoformat(timespec='seconds')
+                self._trigger.wait(timeout=self.interval)
+                self._trigger.clear()
+        finally:
+            server.shutdown()
+            self._set_status("stopped")
+            logging.info("Daemon stopped.")
+
+# --- Control Interface ---
+
+def start_control_server(daemon: PipelineDaemon) -> ThreadingHTTPServer:
+    """Starts the localhost control interface of a daemon in a background thread."""
+
+    class ControlHandler(BaseHTTPRequestHandler):
+        def _send_json(self, payload: dict, status: int = 200):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/status":
+                self._send_json(daemon.get_status())
+            else:
+                self._send_json({"error": "not found"}, 404)
+
+        def do_POST(self):
+            if self.path == "/refresh":
+                daemon.trigger_refresh()
+                self._send_json({"accepted": True}, 202)
+            elif self.path == "/stop":
+                daemon.stop()
+                self._send_json({"accepted": True}, 202)
+            else:
+                self._send_json({"error": "not found"}, 404)
+
+        def log_message(self, format, *args):
+            logging.debug(f"Control interface: {format % args}")
+
+    server = ThreadingHTTPServer(("127.0.0.1", config.DAEMON_PORT), ControlHandler)
+    threading.Thread(target=server.serve_forever, name="daemon-control", daemon=True).start()
+    logging.info(f"Daemon control interface listening on http://127.0.0.1:{config.DAEMON_PORT}")
+    return server
+
+def run_daemon(interval: int = None, limit: int = None):
+    """Entry point of the daemon mode."""
+    PipelineDaemon(interval or config.DAEMON_REFRESH_INTERVAL, limit).run()
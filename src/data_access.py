@@ -0,0 +1,179 @@
+"""
+Data Access Module
+
+This module is the single place where the Streamlit pages (and the DOCX reporter)
+load pipeline outputs. Results are kept in a process-wide LRU cache shared by all
+sessions. Every entry is keyed on the signature (mtime and size) of the files it
+was parsed from, so a pipeline run invalidates stale entries automatically, and
+the cache evicts the least recently used entries to stay within a memory budget.
+
+When the pipeline has published the current files to the shared dataset (see
+`src.shared_dataset`), they are memory-mapped instead of parsed: their memory
+is shared with every other process reading the same version, and only the
+columns each process converts count towards the cache budget.
+"""
+import logging
+import sys
+import threading
+from collections import OrderedDict
+from datetime import datetime
+import pandas as pd
+from src import config, datastore, reporter, shared_dataset
+
+_lock = threading.Lock()
+_cache = OrderedDict()
+_cache_bytes = 0
+
+# --- File Versions ---
+
+def file_signature(path) -> tuple:
+    """
+    Returns a (mtime_ns, size) tuple identifying a file version, or None if
+    missing. Cache entries and the query API's ETags are keyed on it.
+    """
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+# --- Cache Internals ---
+
+def _estimate_size(value) -> int:
+    """Estimates the memory footprint of a cached value in bytes."""
+    if isinstance(value, pd.DataFrame):
+        usage = value.memory_usage(deep=True)
+        # Mapped columns live in the page cache, shared with other readers.
+        mapped = value.attrs.get('mapped_columns', [])
+        return int(usage.drop(mapped, errors='ignore').sum())
+    return sys.getsizeof(value)
+
+def _evict(budget: int):
+    """Drops least recently used entries until the cache fits the budget."""
+    global _cache_bytes
+    while _cache and _cache_bytes > budget:
+        key, (_, _, size) = _cache.popitem(last=False)
+        _cache_bytes -= size
+        logging.debug(f"Evicted '{key}' from the data cache ({size} bytes).")
+
+def cached_load(key: tuple, signature, loader):
+    """
+    Returns the cached value of `key` if it was built from the same `signature`,
+    otherwise calls `loader()` and caches its result. Cached values are shared
+    across sessions and must be treated as read-only.
+    """
+    global _cache_bytes
+    with _lock:
+        entry = _cache.get(key)
+        if entry is not None and entry[0] == signature:
+            _cache.move_to_end(key)
+            return entry[1]
+
+    value = loader()
+    size = _estimate_size(value)
+    budget = config.DATA_CACHE_BUDGET_MB * 1024 * 1024
+    with _lock:
+        previous = _cache.pop(key, None)
+        if previous is not None:
+            _cache_bytes -= previous[2]
+        if size <= budget:
+            _cache[key] = (signature, value, size)
+            _cache_bytes += size
+            _evict(budget)
+    return value
+
+def clear_cache():
+    """Empties the cache."""
+    global _cache_bytes
+    with _lock:
+        _cache.clear()
+        _cache_bytes = 0
+
+def get_cache_stats() -> dict:
+    """Returns the number of entries and the memory used by the cache."""
+    with _lock:
+        return {
+            "entries": len(_cache),
+            "bytes": _cache_bytes,
+            "budget_bytes": config.DATA_CACHE_BUDGET_MB * 1024 * 1024,
+        }
+
+# --- Deputies ---
+
+def get_deputies_list() -> pd.DataFrame:
+    """Loads the deputies list, or an empty frame with the expected columns."""
+    path = config.RAW_DATA_DIR / "deputados.csv"
+    def loader():
+        if not path.exists():
+            return pd.DataFrame({'nome': [], 'id': []})
+        shared = shared_dataset.read(path)
+        return shared if shared is not None else pd.read_csv(path)
+    return cached_load(("deputies",), file_signature(path), loader)
+
+def get_total_deputies() -> int:
+    """Returns the number of deputies in the local list."""
+    return len(get_deputies_list())
+
+# --- Processed Data ---
+
+def load_processed_data(deputy_id: int) -> pd.DataFrame:
+    """Loads the flagged expenses of a deputy, or None if they were not generated."""
+    path = config.flagged_expenses_path(deputy_id)
+    def loader():
+        if not path.exists():
+            return None
+        shared = shared_dataset.read(path)
+        if shared is not None:
+            return shared
+        return pd.read_csv(path, parse_dates=['dataDocumento'], dtype=reporter.TEXT_COLUMNS)
+    return cached_load(("processed", int(deputy_id)), file_signature(path), loader)
+
+# --- Reports ---
+
+def find_report_file(ref_date: datetime, period: str, report_type: str):
+    """Finds a report CSV ('deputy_scores', 'critical_expenses' or 'spend_events'), or returns None."""
+    file_path = config.REPORTS_DIR / f"{ref_date.strftime('%Y-%m-%d')}_{period}_{report_type}.csv"
+    if file_path.exists():
+        return file_path
+    return None
+
+def load_report(ref_date: datetime, period: str, report_type: str) -> pd.DataFrame:
+    """Loads a report CSV, or returns None if it was not generated."""
+    path = config.REPORTS_DIR / f"{ref_date.strftime('%Y-%m-%d')}_{period}_{report_type}.csv"
+    def loader():
+        if not path.exists():
+            return None
+        shared = shared_dataset.read(path)
+        return shared if shared is not None else pd.read_csv(path, dtype=reporter.TEXT_COLUMNS)
+    return cached_load(("report", path.name), file_signature(path), loader)
+
+def get_docx_reports(limit: int = None) -> list:
+    """Returns the generated DOCX report files, newest first."""
+    if not config.REPORTS_DIR.exists():
+        return []
+    all_reports = sorted(config.REPORTS_DIR.glob("*.docx"), reverse=True)
+    return all_reports[:limit] if limit else all_reports
+
+# --- Datastore Queries ---
+
+def query_datastore(key: tuple, loader):
+    """
+    Caches the result of a datastore query under `key`, invalidated whenever the
+    datastore's data version changes (i.e. after any pipeline write).
+    """
+    return cached_load(("datastore",) + key, datastore.get_data_version(), loader)
+
+# --- Warm-up ---
+
+def warm_up(max_reports: int = 6):
+    """
+    Pre-loads the data most pages need right after a pipeline run, so the first
+    page switch does not pay for parsing the CSVs: the deputies list and the most
+    recent reports.
+    """
+    get_deputies_list()
+    report_files = sorted(config.REPORTS_DIR.glob("*.csv"), reverse=True)[:max_reports]
+    for report_file in report_files:
+        date_str, period, report_type = report_file.stem.split("_", 2)
+        load_report(datetime.strptime(date_str, '%Y-%m-%d'), period, report_type)
+    logging.info(f"Data cache warmed up: {get_cache_stats()}")
@@ -0,0 +1,535 @@
+"""
+Datastore Module
+
+This module keeps an indexed SQLite copy of the raw and flagged expenses so the
+explorer pages can filter and paginate on the storage side instead of loading
+whole CSV files. The CSV files remain the source of truth; the auditor keeps the
+database in sync one deputy at a time.
+"""
+import csv
+import io
+import logging
+import os
+import sqlite3
+from contextlib import contextmanager
+import pandas as pd
+from src import config, documents
+
+RAW_TABLE = "raw_expenses"
+FLAGGED_TABLE = "flagged_expenses"
+DEPUTIES_TABLE = "deputies"
+
+# Materialized aggregates maintained by `src.aggregates`.
+DEPUTY_MONTH_TABLE = "agg_deputy_month"
+CATEGORY_MONTH_TABLE = "agg_category_month"
+SUPPLIER_MONTH_TABLE = "agg_supplier_month"
+AGGREGATE_TABLES = (DEPUTY_MONTH_TABLE, CATEGORY_MONTH_TABLE, SUPPLIER_MONTH_TABLE)
+
+# Flag bitmasks of every audited expense, maintained by `src.flag_masks`.
+FLAG_MASKS_TABLE = "expense_flag_masks"
+
+# Robust per-month, per-expense-type statistics across all deputies and the
+# signature of the raw files each month was computed from, maintained by
+# `src.peer_baselines`.
+PEER_BASELINES_TABLE = "peer_baselines"
+PEER_BASELINE_MONTHS_TABLE = "peer_baseline_months"
+
+# Deputy x supplier spend per month and the signature of the raw files each
+# month was computed from, and the network metrics derived from them,
+# maintained by `src.supplier_network`.
+NETWORK_SPEND_TABLE = "network_spend"
+NETWORK_SPEND_MONTHS_TABLE = "network_spend_months"
+NETWORK_DEPUTIES_TABLE = "network_deputies"
+NETWORK_SUPPLIERS_TABLE = "network_suppliers"
+
+# Deputy x expense type spend per month and the signature of the raw files
+# each month was computed from, and the change points and anomalous months
+# detected in them, maintained by `src.spend_series`.
+SERIES_SPEND_TABLE = "series_spend"
+SERIES_SPEND_MONTHS_TABLE = "series_spend_months"
+SERIES_BREAKS_TABLE = "series_breaks"
+SERIES_ANOMALIES_TABLE = "series_anomalies"
+
+# Invoice key hashes per month and deputy and the signature of the raw files
+# each month was computed from, and the hashes found for more than one deputy,
+# maintained by `src.shared_invoices`.
+INVOICE_KEYS_TABLE = "invoice_keys"
+INVOICE_KEY_MONTHS_TABLE = "invoice_key_months"
+SHARED_INVOICES_TABLE = "shared_invoices"
+
+# Versions of the raw monthly files (content-addressed by SHA-256) and the
+# row-level changes between consecutive versions, maintained by `src.snapshots`.
+RAW_SNAPSHOTS_TABLE = "raw_snapshots"
+RAW_CHANGES_TABLE = "raw_changes"
+
+# Supplier company profiles from the CNPJ registry, maintained by `src.supplier_profiles`.
+SUPPLIER_PROFILES_TABLE = "supplier_profiles"
+
+# Indexes created for each table. Filters from the explorer pages always include
+# the deputy and usually a date range, so that is the leading composite index.
+TABLE_INDEXES = {
+    RAW_TABLE: [
+        ("deputy_id", "dataDocumento"),
+        ("cnpjCpfFornecedor",),
+        ("nomeFornecedor",),
+        ("valorLiquido",),
+    ],
+    FLAGGED_TABLE: [
+        ("deputy_id", "dataDocumento"),
+        ("deputy_id", "score_fraude"),
+        ("cnpjCpfFornecedor",),
+        ("nomeFornecedor",),
+    ],
+    DEPUTIES_TABLE: [("id",)],
+    DEPUTY_MONTH_TABLE: [("periodo", "deputy_id"), ("deputy_id",)],
+    CATEGORY_MONTH_TABLE: [("periodo", "tipoDespesa"), ("deputy_id",)],
+    SUPPLIER_MONTH_TABLE: [("periodo", "supplier_key"), ("deputy_id",)],
+    FLAG_MASKS_TABLE: [("periodo", "deputy_id"), ("deputy_id",)],
+    NETWORK_DEPUTIES_TABLE: [("deputy_id",)],
+    NETWORK_SUPPLIERS_TABLE: [("supplier_key",)],
+    SERIES_BREAKS_TABLE: [("deputy_id",), ("periodo",)],
+    SERIES_ANOMALIES_TABLE: [("deputy_id",), ("periodo",)],
+}
+
+# Full-text (FTS5) inverted indexes over supplier names, CNPJ/CPF, expense
+# types and document ids. Each source table gets its own index whose rowids are
+# the source rowids, so a deputy's entries can be replaced without a full scan.
+# 'remove_diacritics 2' makes matching accent-insensitive ("acao" finds "AÇÃO")
+# and the prefix indexes make prefix queries ("loca*") cheap.
+SEARCH_TABLES = {
+    RAW_TABLE: "raw_expenses_search",
+    FLAGGED_TABLE: "flagged_expenses_search",
+}
+SEARCH_COLUMNS = ["nomeFornecedor", "documentoFornecedor", "tipoDespesa", "documento"]
+
+# --- Connection & Schema ---
+
+@contextmanager
+def connect():
+    """
+    Opens a connection to the datastore, configured for concurrent readers.
+    The transaction is committed on success, rolled back on error, and the
+    connection is always closed.
+    """
+    config.DATASTORE_FILE.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(config.DATASTORE_FILE, timeout=30)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def _sql_type(dtype) -> str:
+    """Maps a pandas dtype to the SQLite column affinity used to store it."""
+    if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+        return "INTEGER"
+    if pd.api.types.is_float_dtype(dtype):
+        return "REAL"
+    return "TEXT"
+
+def get_table_columns(conn: sqlite3.Connection, table: str, schema: str = "main") -> list:
+    """Returns the column names of a table, or an empty list if it does not exist."""
+    return [row[1] for row in conn.execute(f'PRAGMA {schema}.table_info("{table}")')]
+
+def _ensure_table(conn: sqlite3.Connection, table: str, df: pd.DataFrame):
+    """
+    Creates the table and its indexes on first use and adds any new columns
+    (e.g. newly registered flags) to an existing table.
+    """
+    _ensure_columns(conn, table, [(col, _sql_type(df[col].dtype)) for col in df.columns])
+
+def _ensure_columns(conn: sqlite3.Connection, table: str, columns: list):
+    """Like `_ensure_table`, from (name, SQL type) pairs."""
+    existing = get_table_columns(conn, table)
+    if not existing:
+        columns_sql = ", ".join(f'"{col}" {sql_type}' for col, sql_type in columns)
+        conn.execute(f'CREATE TABLE "{table}" ({columns_sql})')
+        names = {col for col, _ in columns}
+        for index_columns in TABLE_INDEXES.get(table, []):
+            if not set(index_columns) <= names:
+                continue
+            index_name = f"idx_{table}_{'_'.join(index_columns)}"
+            quoted = ", ".join(f'"{col}"' for col in index_columns)
+            conn.execute(f'CREATE INDEX IF NOT EXISTS "{index_name}" ON "{table}" ({quoted})')
+        return
+    for col, sql_type in columns:
+        if col not in existing:
+            conn.execute(f'ALTER TABLE "{table}" ADD COLUMN "{col}" {sql_type}')
+
+def mark_data_changed(conn: sqlite3.Connection):
+    """
+    Records that data changed in the open transaction by incrementing the data
+    version, which readers use to invalidate their caches. Modules writing to
+    the datastore directly call it along with their writes.
+    """
+    conn.execute(
+        "INSERT INTO meta (key, value) VALUES ('data_version', '1') "
+        "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+    )
+
+def get_data_version() -> int:
+    """Returns the current data version (0 when the datastore is empty)."""
+    if not config.DATASTORE_FILE.exists():
+        return 0
+    with connect() as conn:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'data_version'").fetchone()
+    return int(row[0]) if row else 0
+
+# --- Writing ---
+
+# Document ids, which pandas parses as integers or (with blanks) floats.
+DOCUMENT_COLUMNS = ['cnpjCpfFornecedor', 'codDocumento', 'numDocumento']
+
+def _normalize_for_storage(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Stores dates as ISO strings so range filters can use the index, and
+    document ids as text, so a column's type does not depend on which deputy
+    was stored first. Rows with a supplier document get its canonical
+    `supplier_key` (see `src.documents`), which restores the leading zeros
+    lost when the document was parsed as a number.
+    """
+    df = df.copy()
+    if 'cnpjCpfFornecedor' in df.columns and 'supplier_key' not in df.columns:
+        df['supplier_key'] = documents.normalize_documents(df['cnpjCpfFornecedor'])['supplier_key']
+    if 'dataDocumento' in df.columns:
+        dates = pd.to_datetime(df['dataDocumento'], errors='coerce')
+        df['dataDocumento'] = dates.dt.strftime('%Y-%m-%d')
+    for col in DOCUMENT_COLUMNS:
+        if col in df.columns and not pd.api.types.is_string_dtype(df[col]):
+            df[col] = df[col].astype(str).str.replace(r'\.0$', '', regex=True).where(df[col].notna())
+    for col in df.columns:
+        if pd.api.types.is_bool_dtype(df[col].dtype):
+            df[col] = df[col].astype(int)
+    return df
+
+def _delete_deputy_rows(conn: sqlite3.Connection, table: str, deputy_id: int):
+    """Removes a deputy's rows from a table and from its search index."""
+    search_table = SEARCH_TABLES.get(table)
+    if search_table and get_table_columns(conn, search_table):
+        conn.execute(
+            f'DELETE FROM "{search_table}" WHERE rowid IN '
+            f'(SELECT rowid FROM "{table}" WHERE deputy_id = ?)', (int(deputy_id),)
+        )
+    conn.execute(f'DELETE FROM "{table}" WHERE deputy_id = ?', (int(deputy_id),))
+
+def replace_deputy_rows(table: str, deputy_id: int, df: pd.DataFrame):
+    """
+    Atomically replaces all rows of a deputy in a table with the given dataframe.
+    An empty dataframe simply removes the deputy's previous rows.
+    """
+    with connect() as conn:
+        if df.empty:
+            if get_table_columns(conn, table):
+                _delete_deputy_rows(conn, table, deputy_id)
+                mark_data_changed(conn)
+            return
+
+        df = _normalize_for_storage(df)
+        df.insert(0, 'deputy_id', int(deputy_id))
+        _ensure_table(conn, table, df)
+        _delete_deputy_rows(conn, table, deputy_id)
+        columns_sql = ", ".join(f'"{col}"' for col in df.columns)
+        placeholders = ", ".join("?" for _ in df.columns)
+        rows = df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+        conn.executemany(f'INSERT INTO "{table}" ({columns_sql}) VALUES ({placeholders})', rows)
+        _index_deputy_rows(conn, table, deputy_id)
+        mark_data_changed(conn)
+    logging.info(f"Datastore table '{table}' updated for deputy {deputy_id} ({len(df)} rows).")
+
+def append_deputy_rows(table: str, deputy_id: int, df: pd.DataFrame):
+    """
+    Appends rows to a deputy's existing rows in a table, for data written in
+    chunks (see `src.out_of_core`). Call `replace_deputy_rows` with an empty
+    dataframe first to start from a clean slate.
+    """
+    if df.empty:
+        return
+    with connect() as conn:
+        df = _normalize_for_storage(df)
+        df.insert(0, 'deputy_id', int(deputy_id))
+        _ensure_table(conn, table, df)
+        last_rowid = conn.execute(f'SELECT COALESCE(MAX(rowid), 0) FROM "{table}"').fetchone()[0]
+        columns_sql = ", ".join(f'"{col}"' for col in df.columns)
+        placeholders = ", ".join("?" for _ in df.columns)
+        rows = df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+        conn.executemany(f'INSERT INTO "{table}" ({columns_sql}) VALUES ({placeholders})', rows)
+        _index_deputy_rows(conn, table, deputy_id, after_rowid=last_rowid)
+        mark_data_changed(conn)
+
+def replace_table(table: str, df: pd.DataFrame):
+    """Atomically replaces the whole content of a (small) table."""
+    with connect() as conn:
+        conn.execute(f'DROP TABLE IF EXISTS "{table}"')
+        _ensure_table(conn, table, df)
+        columns_sql = ", ".join(f'"{col}"' for col in df.columns)
+        placeholders = ", ".join("?" for _ in df.columns)
+        rows = df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+        conn.executemany(f'INSERT INTO "{table}" ({columns_sql}) VALUES ({placeholders})', rows)
+        mark_data_changed(conn)
+
+def export_deputy_tables(path, tables: list, deputy_ids: list):
+    """
+    Copies the given deputies' rows of `tables` into a new SQLite file at
+    `path`, values and all, e.g. to merge the datastores of pipeline shards
+    (see `merge_tables`). Tables that do not exist yet are skipped.
+    """
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.unlink(missing_ok=True)
+    deputy_ids = [int(deputy_id) for deputy_id in deputy_ids]
+    placeholders = ", ".join("?" for _ in deputy_ids)
+    with connect() as conn:
+        conn.execute("ATTACH DATABASE ? AS export", (str(tmp_path),))
+        for table in tables:
+            if not get_table_columns(conn, table):
+                continue
+            conn.execute(
+                f'CREATE TABLE export."{table}" AS SELECT * FROM main."{table}" '
+                f'WHERE deputy_id IN ({placeholders}) ORDER BY rowid', deputy_ids
+            )
+        conn.commit()
+        conn.execute("DETACH DATABASE export")
+    os.replace(tmp_path, path)
+
+def merge_tables(tables: list, paths: list):
+    """
+    Replaces each of `tables` with the union of its rows in the SQLite files
+    written by `export_deputy_tables`, in the order of `paths`, then recreates
+    its indexes and search index.
+    """
+    with connect() as conn:
+        for table in tables:
+            if table in SEARCH_TABLES:
+                conn.execute(f'DROP TABLE IF EXISTS "{SEARCH_TABLES[table]}"')
+            conn.execute(f'DROP TABLE IF EXISTS "{table}"')
+        conn.commit()
+        for path in paths:
+            conn.execute("ATTACH DATABASE ? AS shard", (str(path),))
+            for table in tables:
+                columns = [(row[1], row[2]) for row in conn.execute(f'PRAGMA shard.table_info("{table}")')]
+                if not columns:
+                    continue
+                _ensure_columns(conn, table, columns)
+                columns_sql = ", ".join(f'"{col}"' for col, _ in columns)
+                conn.execute(
+                    f'INSERT INTO main."{table}" ({columns_sql}) SELECT {columns_sql} FROM shard."{table}" ORDER BY rowid'
+                )
+            conn.commit()
+            conn.execute("DETACH DATABASE shard")
+        for table in tables:
+            if table in SEARCH_TABLES and get_table_columns(conn, table):
+                _ensure_search_index(conn, table)
+        mark_data_changed(conn)
+
+# --- Full-Text Search Index ---
+
+def _formatted_document_sql(key: str) -> str:
+    """Formats a canonical supplier key as a CNPJ (11.222.333/0001-81) or CPF (111.444.777-35)."""
+    def part(start, length):
+        return f"substr({key}, {start}, {length})"
+    cnpj = f"{part(1, 2)} || '.' || {part(3, 3)} || '.' || {part(6, 3)} || '/' || {part(9, 4)} || '-' || {part(13, 2)}"
+    cpf = f"{part(1, 3)} || '.' || {part(4, 3)} || '.' || {part(7, 3)} || '-' || {part(10, 2)}"
+    return f"CASE length({key}) WHEN 14 THEN {cnpj} WHEN 11 THEN {cpf} ELSE {key} END"
+
+def _search_select_sql(conn: sqlite3.Connection, table: str) -> str:
+    """
+    Builds the SELECT that extracts the searchable text of a source table.
+    The supplier document is indexed by its canonical key, both formatted and
+    digits-only, so "03597751000125" and "03.597.751/0001-25" find the same
+    supplier even when the published value lost its leading zero. Rows
+    without a key keep the published value.
+    """
+    columns = get_table_columns(conn, table)
+    def text(col):
+        return f'COALESCE(CAST("{col}" AS TEXT), \'\')' if col in columns else "''"
+    document = text("cnpjCpfFornecedor")
+    if "supplier_key" in columns:
+        document = f"COALESCE(NULLIF(\"supplier_key\", ''), {document})"
+    digits_only = document
+    for char in (".", "/", "-", " "):
+        digits_only = f"REPLACE({digits_only}, '{char}', '')"
+    return (
+        f"SELECT rowid, {text('nomeFornecedor')}, "
+        f"{_formatted_document_sql(digits_only)} || ' ' || {digits_only}, "
+        f"{text('tipoDespesa')}, "
+        f"{text('codDocumento')} || ' ' || {text('numDocumento')} "
+        f'FROM "{table}"'
+    )
+
+def _ensure_search_index(conn: sqlite3.Connection, table: str) -> bool:
+    """
+    Creates the search index of a table on first use, backfilling all existing
+    rows. Returns True if the index was created by this call.
+    """
+    search_table = SEARCH_TABLES[table]
+    if get_table_columns(conn, search_table):
+        return False
+    columns_sql = ", ".join(SEARCH_COLUMNS)
+    conn.execute(
+        f'CREATE VIRTUAL TABLE "{search_table}" USING fts5({columns_sql}, '
+        f"tokenize='unicode61 remove_diacritics 2', prefix='2 3 4')"
+    )
+    conn.execute(f'INSERT INTO "{search_table}" (rowid, {columns_sql}) {_search_select_sql(conn, table)}')
+    return True
+
+def _index_deputy_rows(conn: sqlite3.Connection, table: str, deputy_id: int, after_rowid: int = 0):
+    """
+    Adds a deputy's freshly inserted rows to the table's search index. Only
+    rows after `after_rowid` are added, for rows appended to existing ones.
+    """
+    if table not in SEARCH_TABLES or _ensure_search_index(conn, table):
+        return
+    search_table = SEARCH_TABLES[table]
+    columns_sql = ", ".join(SEARCH_COLUMNS)
+    conn.execute(
+        f'INSERT INTO "{search_table}" (rowid, {columns_sql}) '
+        f'{_search_select_sql(conn, table)} WHERE deputy_id = ? AND rowid > ?', (int(deputy_id), int(after_rowid))
+    )
+
+def build_match_query(text: str) -> str:
+    """
+    Turns free text typed by the user into an FTS5 query in which every term
+    must match as a prefix, e.g. 'posto joao' -> '"posto"* AND "joao"*'. Words
+    shaped like a CNPJ/CPF are replaced by their canonical supplier key first,
+    as indexed, e.g. '03.597.751/0001-25' -> '"03597751000125"*'.
+    """
+    words = text.split()
+    keys = documents.normalize_documents(pd.Series(words, dtype=object))['supplier_key']
+    text = " ".join(key or word for word, key in zip(words, keys))
+    terms = "".join(char if char.isalnum() else " " for char in text).split()
+    return " AND ".join(f'"{term}"*' for term in terms)
+
+def search_expenses(text: str, table: str = RAW_TABLE, limit: int = 200) -> pd.DataFrame:
+    """
+    Searches all deputies' expenses of a table by supplier name, CNPJ/CPF,
+    expense type or document id, returning the best-ranked matches.
+    """
+    match_query = build_match_query(text)
+    if not match_query or not config.DATASTORE_FILE.exists():
+        return pd.DataFrame()
+    with connect() as conn:
+        if not get_table_columns(conn, table):
+            return pd.DataFrame()
+        _ensure_search_index(conn, table)
+        search_table = SEARCH_TABLES[table]
+        return pd.read_sql_query(
+            f'SELECT t.* FROM "{search_table}" s JOIN "{table}" t ON t.rowid = s.rowid '
+            f'WHERE "{search_table}" MATCH ? ORDER BY s.rank LIMIT ?',
+            conn, params=[match_query, int(limit)]
+        )
+
+# --- Querying ---
+
+def _build_where(filters: dict) -> tuple:
+    """
+    Translates the explorer filters into a SQL WHERE clause and its parameters.
+    Supported keys: deputy_id, start_date, end_date, flag, supplier, min_score,
+    min_value and max_value. Missing or None values are ignored.
+    """
+    clauses, params = [], []
+    if filters.get('deputy_id') is not None:
+        clauses.append("deputy_id = ?")
+        params.append(int(filters['deputy_id']))
+    if filters.get('start_date') is not None:
+        clauses.append("dataDocumento >= ?")
+        params.append(str(filters['start_date']))
+    if filters.get('end_date') is not None:
+        clauses.append("dataDocumento <= ?")
+        params.append(str(filters['end_date']))
+    if filters.get('flag'):
+        clauses.append(f'"{filters["flag"]}" = 1')
+    if filters.get('supplier'):
+        clauses.append("(nomeFornecedor LIKE ? OR cnpjCpfFornecedor LIKE ?)")
+        pattern = f"%{filters['supplier']}%"
+        params.extend([pattern, pattern])
+    if filters.get('min_score') is not None:
+        clauses.append("score_fraude >= ?")
+        params.append(filters['min_score'])
+    if filters.get('min_value') is not None:
+        clauses.append("valorLiquido >= ?")
+        params.append(filters['min_value'])
+    if filters.get('max_value') is not None:
+        clauses.append("valorLiquido <= ?")
+        params.append(filters['max_value'])
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    return where, params
+
+def _check_filters(conn: sqlite3.Connection, table: str, filters: dict) -> bool:
+    """Validates that the table exists and that a flag filter names a real column."""
+    columns = get_table_columns(conn, table)
+    if not columns:
+        return False
+    if filters.get('flag') and filters['flag'] not in columns:
+        raise ValueError(f"Unknown flag column: {filters['flag']}")
+    return True
+
+def count_expenses(table: str, filters: dict) -> int:
+    """Returns the number of expenses matching the filters."""
+    if not config.DATASTORE_FILE.exists():
+        return 0
+    with connect() as conn:
+        if not _check_filters(conn, table, filters):
+            return 0
+        where, params = _build_where(filters)
+        return conn.execute(f'SELECT COUNT(*) FROM "{table}" {where}', params).fetchone()[0]
+
+def query_expenses(table: str, filters: dict, limit: int = 100, offset: int = 0,
+                   order_by: str = "dataDocumento DESC") -> pd.DataFrame:
+    """Returns one page of expenses matching the filters."""
+    if not config.DATASTORE_FILE.exists():
+        return pd.DataFrame()
+    with connect() as conn:
+        if not _check_filters(conn, table, filters):
+            return pd.DataFrame()
+        where, params = _build_where(filters)
+        return pd.read_sql_query(
+            f'SELECT * FROM "{table}" {where} ORDER BY {order_by} LIMIT ? OFFSET ?',
+            conn, params=params + [int(limit), int(offset)]
+        )
+
+def get_date_bounds(table: str, deputy_id: int) -> tuple:
+    """Returns the (min, max) document dates stored for a deputy, or (None, None)."""
+    if not config.DATASTORE_FILE.exists():
+        return None, None
+    with connect() as conn:
+        if not get_table_columns(conn, table):
+            return None, None
+        row = conn.execute(
+            f'SELECT MIN(dataDocumento), MAX(dataDocumento) FROM "{table}" WHERE deputy_id = ?',
+            (int(deputy_id),)
+        ).fetchone()
+    if row[0] is None:
+        return None, None
+    return pd.to_datetime(row[0]).date(), pd.to_datetime(row[1]).date()
+
+def get_flag_columns(table: str = FLAGGED_TABLE) -> list:
+    """Returns the flag columns currently stored in a table."""
+    if not config.DATASTORE_FILE.exists():
+        return []
+    with connect() as conn:
+        return [col for col in get_table_columns(conn, table) if col.startswith("flag_")]
+
+def export_csv(table: str, filters: dict, order_by: str = "dataDocumento DESC") -> bytes:
+    """
+    Streams every row matching the filters into CSV bytes. It is meant to be
+    called only when the user actually asks for a download.
+    """
+    buffer = io.StringIO()
+    with connect() as conn:
+        if not _check_filters(conn, table, filters):
+            return b""
+        where, params = _build_where(filters)
+        cursor = conn.execute(f'SELECT * FROM "{table}" {where} ORDER BY {order_by}', params)
+        writer = csv.writer(buffer)
+        writer.writerow([description[0] for description in cursor.description])
+        while True:
+            rows = cursor.fetchmany(5000)
+            if not rows:
+                break
+            writer.writerows(rows)
+    return buffer.getvalue().encode('utf-8')
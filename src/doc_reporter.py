@@ -9,26 +9,25 @@ import logging
 import pandas as pd
 from datetime import datetime
 from docx import Document
-from src import config
+from src import data_access
 from io import BytesIO
 
 def get_report_data(processing_date: datetime, period: str) -> dict:
     """
     Fetches and compiles all necessary data for a report into a dictionary of DataFrames.
     """
-    date_str = processing_date.strftime('%Y-%m-%d')
-    file_suffix = f"{date_str}_{period}_deputy_scores.csv"
-    deputy_scores_path = config.REPORTS_DIR / file_suffix
-    critical_expenses_path = config.REPORTS_DIR / f"{date_str}_{period}_critical_expenses.csv"
+    deputy_scores_df = data_access.load_report(processing_date, period, "deputy_scores")
+    critical_expenses_df = data_access.load_report(processing_date, period, "critical_expenses")
 
-    if not deputy_scores_path.exists() or not critical_expenses_path.exists():
+    if deputy_scores_df is None or critical_expenses_df is None:
         logging.warning(f"Report CSVs for period '{period}' not found.")
         return None
-
-    deputy_scores_df = pd.read_csv(deputy_scores_path)
-    critical_expenses_df = pd.read_csv(critical_expenses_path)
     
     top_10_deputies = deputy_scores_df.head(10)
+
+    # Reports generated before the spend series existed have no events file.
+    spend_events_df = data_access.load_report(processing_date, period, "spend_events")
+    top_spend_events = spend_events_df.head(10) if spend_events_df is not None else pd.DataFrame()
     
     top_suppliers = pd.DataFrame()
     top_expense_types = pd.DataFrame()
@@ -44,7 +43,8 @@ def get_report_data(processing_date: datetime, period: str) -> dict:
         "top_10_deputies": top_10_deputies,
         "critical_expenses": critical_expenses_df,
         "top_suppliers": top_suppliers,
-        "top_expense_types": top_expense_types
+        "top_expense_types": top_expense_types,
+        "top_spend_events": top_spend_events
     }
 
 def generate_word_report(processing_date: datetime, period: str, report_data: dict) -> BytesIO:
@@ -66,6 +66,7 @@ def generate_word_report(processing_date: datetime, period: str, report_data: di
     _add_summary_table(doc, report_data["top_10_deputies"], f'Top 10 Deputados com Despesas Críticas ({period_title})')
     _add_summary_table(doc, report_data["top_suppliers"], 'Top 10 Fornecedores em Despesas Críticas')
     _add_summary_table(doc, report_data["top_expense_types"], 'Top 10 Tipos de Despesa em Despesas Críticas')
+    _add_summary_table(doc, report_data["top_spend_events"], 'Quebras e Meses Atípicos de Gasto no Período')
 
     # --- Individual Analysis ---
     doc.add_heading('Análise Individual dos Top Deputados', level=1)
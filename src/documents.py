@@ -0,0 +1,127 @@
+"""
+Documents Module
+
+This module normalizes and validates supplier documents (CNPJ and CPF) in bulk.
+The API returns `cnpjCpfFornecedor` in several shapes: formatted
+('11.222.333/0001-81'), digits only, or as a float when a month's CSV only has
+numeric documents (which also drops leading zeros). Using it raw as a key
+fragments suppliers.
+
+Distinct values are normalized on a character-code matrix with NumPy: digits
+are extracted, leading zeros restored and the check digits verified for whole
+columns at once, without per-row Python, so millions of rows can be processed.
+"""
+import numpy as np
+import pandas as pd
+
+# Longer values are truncated; no valid document needs more characters.
+MAX_DOCUMENT_CHARS = 24
+
+# Rows normalized per block, which bounds the size of the character matrix.
+BLOCK_ROWS = 500_000
+
+CNPJ_WEIGHTS_1 = np.array([5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2])
+CNPJ_WEIGHTS_2 = np.array([6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2])
+CPF_WEIGHTS_1 = np.arange(10, 1, -1)
+CPF_WEIGHTS_2 = np.arange(11, 1, -1)
+
+# --- Digit Extraction ---
+
+def _digit_matrix(values: pd.Series) -> tuple:
+    """
+    Returns the left-aligned digits of every value (as an int matrix), the
+    number of digits of each value and a mask of values that were floats.
+    """
+    text = np.asarray(values.fillna("").astype(str).to_numpy(), dtype=f"U{MAX_DOCUMENT_CHARS}")
+    codes = text.view(np.uint32).reshape(len(text), MAX_DOCUMENT_CHARS).copy()
+    length = (codes != 0).sum(axis=1)
+    rows = np.arange(len(codes))
+
+    # Documents parsed as floats end in '.0' and lost their leading zeros.
+    is_float = (
+        (length >= 2)
+        & (codes[rows, np.maximum(length - 2, 0)] == ord("."))
+        & (codes[rows, np.maximum(length - 1, 0)] == ord("0"))
+    )
+    codes[rows[is_float], length[is_float] - 2] = 0
+    codes[rows[is_float], length[is_float] - 1] = 0
+
+    is_digit = (codes >= ord("0")) & (codes <= ord("9"))
+    position = np.cumsum(is_digit, axis=1) - 1
+    keep = is_digit & (position < 14)
+    digits = np.zeros((len(codes), 14), dtype=np.int64)
+    digits[np.nonzero(keep)[0], position[keep]] = codes[keep].astype(np.int64) - ord("0")
+    return digits, is_digit.sum(axis=1), is_float
+
+def _right_align(digits: np.ndarray, n_digits: np.ndarray, width: int) -> np.ndarray:
+    """Right-aligns each row's digits in `width` columns, padding with leading zeros."""
+    source = np.arange(width)[None, :] - (width - n_digits)[:, None]
+    aligned = np.take_along_axis(digits, np.clip(source, 0, digits.shape[1] - 1), axis=1)
+    return np.where(source >= 0, aligned, 0)
+
+def _to_strings(digits: np.ndarray) -> np.ndarray:
+    """Converts a digit matrix back into an array of digit strings."""
+    codes = np.ascontiguousarray(digits + ord("0"), dtype=np.uint32)
+    return codes.view(f"U{digits.shape[1]}").ravel()
+
+# --- Check Digits ---
+
+def _check_digit(weighted_sum: np.ndarray) -> np.ndarray:
+    remainder = weighted_sum % 11
+    return np.where(remainder < 2, 0, 11 - remainder)
+
+def _valid_cnpj(digits: np.ndarray) -> np.ndarray:
+    """Validates 14-column CNPJ digit rows."""
+    dv1 = _check_digit(digits[:, :12] @ CNPJ_WEIGHTS_1)
+    dv2 = _check_digit(np.column_stack([digits[:, :12], dv1]) @ CNPJ_WEIGHTS_2)
+    repeated = (digits == digits[:, :1]).all(axis=1)
+    return (digits[:, 12] == dv1) & (digits[:, 13] == dv2) & ~repeated
+
+def _valid_cpf(digits: np.ndarray) -> np.ndarray:
+    """Validates 11-column CPF digit rows."""
+    dv1 = _check_digit(digits[:, :9] @ CPF_WEIGHTS_1)
+    dv2 = _check_digit(np.column_stack([digits[:, :9], dv1]) @ CPF_WEIGHTS_2)
+    repeated = (digits == digits[:, :1]).all(axis=1)
+    return (digits[:, 9] == dv1) & (digits[:, 10] == dv2) & ~repeated
+
+# --- Normalization ---
+
+def _normalize_block(values: pd.Series) -> pd.DataFrame:
+    digits, n_digits, is_float = _digit_matrix(values)
+    cnpj_digits = _right_align(digits, n_digits, 14)
+    cpf_digits = _right_align(digits, n_digits, 11)
+    cnpj_ok = _valid_cnpj(cnpj_digits)
+    cpf_ok = _valid_cpf(cpf_digits)
+
+    # Floats may have lost leading zeros: prefer a valid CNPJ, then a valid CPF.
+    is_cpf = np.where(is_float, (n_digits > 0) & (n_digits <= 11) & cpf_ok & ~cnpj_ok, n_digits == 11)
+    is_cnpj = np.where(is_float, (n_digits > 0) & (n_digits <= 14) & ~is_cpf, n_digits == 14)
+
+    return pd.DataFrame({
+        "supplier_key": np.where(is_cnpj, _to_strings(cnpj_digits), np.where(is_cpf, _to_strings(cpf_digits), "")),
+        "documento_tipo": np.select([is_cnpj, is_cpf], ["CNPJ", "CPF"], ""),
+        "documento_valido": (is_cnpj & cnpj_ok) | (is_cpf & cpf_ok),
+    }, index=values.index)
+
+def normalize_documents(values: pd.Series) -> pd.DataFrame:
+    """
+    Normalizes a column of supplier documents. Returns, aligned with `values`:
+    - supplier_key: the canonical digits (14 for a CNPJ, 11 for a CPF), or ''
+      when the value is not shaped like either;
+    - documento_tipo: 'CNPJ', 'CPF' or '';
+    - documento_valido: True only for a CNPJ/CPF with correct check digits.
+    """
+    # A CSV column without gaps is parsed as integers, which lost their leading
+    # zeros like floats; they are normalized as floats.
+    if pd.api.types.is_integer_dtype(values):
+        values = values.astype(float)
+    # Suppliers repeat a lot, so only the distinct values are normalized.
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    uniques = pd.Series(uniques, dtype=object)
+    blocks = [_normalize_block(uniques.iloc[start:start + BLOCK_ROWS])
+              for start in range(0, len(uniques), BLOCK_ROWS)]
+    if not blocks:
+        return pd.DataFrame({"supplier_key": [], "documento_tipo": [], "documento_valido": []},
+                            index=values.index).astype({"documento_valido": bool})
+    normalized = pd.concat(blocks) if len(blocks) > 1 else blocks[0]
+    return normalized.iloc[codes].set_index(values.index)
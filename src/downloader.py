@@ -9,7 +9,7 @@ import requests
 import pandas as pd
 import logging
 import time
-from src import config, summary_manager
+from src import config, progress, snapshots, summary_manager
 
 def _get_all_pages(url: str, params: dict) -> list:
     """
@@ -22,6 +22,7 @@ def _get_all_pages(url: str, params: dict) -> list:
     while next_url:
         try:
             response = requests.get(next_url, params=params, headers={"accept": "application/json"})
+            progress.count("download", "requests")
             response.raise_for_status()
             json_response = response.json()
             all_data.extend(json_response["dados"])
@@ -38,18 +39,23 @@ def _get_all_pages(url: str, params: dict) -> list:
 
         except requests.exceptions.RequestException as e:
             logging.error(f"Error downloading data from {next_url}: {e}")
+            progress.count("download", "errors")
             return None
         except KeyError:
             logging.error(f"Could not find 'dados' key in the response from {next_url}.")
+            progress.count("download", "errors")
             return None
             
     return all_data
 
-def download_deputies():
+def download_deputies(full_history: bool = False):
     """
-    Downloads the full list of deputies and saves it to a CSV file.
+    Downloads the full list of deputies and saves it to a CSV file. With
+    `full_history`, the list has every deputy of config.HISTORY_LEGISLATURES
+    (one row each, from their latest legislature) and is saved separately.
     """
-    filepath = config.RAW_DATA_DIR / "deputados.csv"
+    filename = "deputados_historico.csv" if full_history else "deputados.csv"
+    filepath = config.RAW_DATA_DIR / filename
     if filepath.exists():
         logging.info("Deputies list already exists. Skipping download.")
         return
@@ -57,19 +63,34 @@ def download_deputies():
     logging.info("Downloading deputies list...")
     endpoint = "/deputados"
     params = {"ordem": "ASC", "ordenarPor": "nome"}
+    if full_history:
+        params["idLegislatura"] = config.HISTORY_LEGISLATURES
     url = f"{config.BASE_URL}{endpoint}"
     data = _get_all_pages(url, params)
     
     if data is not None:
         df = pd.DataFrame(data)
+        if full_history:
+            df = df.sort_values('idLegislatura').drop_duplicates('id', keep='last').sort_values('nome')
         logging.info(f"Saving deputies list to {filepath}")
         df.to_csv(filepath, index=False)
         logging.info("Deputies list saved successfully.")
 
+def _store_removed_month(deputy_id: int, year: int, month: int) -> bool:
+    """
+    Stores an empty snapshot of a downloaded month that the API no longer
+    returns, i.e. whose expenses were all removed. Returns True if it changed.
+    """
+    path = snapshots.month_path(deputy_id, year, month)
+    if not path.exists():
+        return False
+    return snapshots.store_month(deputy_id, year, month, pd.read_csv(path, nrows=0))
+
 def download_deputy_expenses(deputy_id: int, year: int):
     """
     Downloads all expenses for a specific deputy for a given year.
-    The data is saved by month, and the summary is updated on success.
+    The data is saved by month as snapshots (see `src.snapshots`), so only the
+    months that changed are rewritten, and the summary is updated on success.
     """
     logging.info(f"Downloading expenses for deputy {deputy_id}, year {year}.")
     endpoint = f"/deputados/{deputy_id}/despesas"
@@ -84,17 +105,47 @@ def download_deputy_expenses(deputy_id: int, year: int):
 
     if not all_expenses:
         logging.warning(f"No expenses found for deputy {deputy_id} in {year}.")
+        for month in range(1, 13):
+            _store_removed_month(deputy_id, year, month)
         summary_manager.add_downloaded_year(deputy_id, year)
         return
 
     df = pd.DataFrame(all_expenses)
+    progress.count("download", "rows", len(df))
     
-    deputy_dir = config.RAW_DATA_DIR / "expenses" / str(deputy_id)
-    deputy_dir.mkdir(parents=True, exist_ok=True)
-
+    months = set()
     for month, month_df in df.groupby('mes'):
-        month_filepath = deputy_dir / f"{year}-{month:02d}.csv"
-        month_df.to_csv(month_filepath, index=False)
+        months.add(int(month))
+        snapshots.store_month(deputy_id, year, int(month), month_df)
+    # Months downloaded before that are no longer returned had all their expenses removed.
+    for month in range(1, 13):
+        if month not in months:
+            _store_removed_month(deputy_id, year, month)
 
     summary_manager.add_downloaded_year(deputy_id, year)
     logging.info(f"Finished downloading expenses for deputy {deputy_id}, year {year}.")
+
+def download_deputy_month(deputy_id: int, year: int, month: int) -> bool:
+    """
+    Re-downloads a single month of a deputy's expenses and stores it as a new
+    snapshot only if its content changed. Returns True if the month changed.
+    """
+    endpoint = f"/deputados/{deputy_id}/despesas"
+    params = {"ano": year, "mes": month, "ordem": "ASC", "ordenarPor": "mes"}
+    url = f"{config.BASE_URL}{endpoint}"
+
+    month_expenses = _get_all_pages(url, params)
+    if month_expenses is None:
+        logging.error(f"Failed to refresh expenses for deputy {deputy_id}, {year}-{month:02d}.")
+        return False
+
+    if month_expenses:
+        df = pd.DataFrame(month_expenses)
+        progress.count("download", "rows", len(df))
+        changed = snapshots.store_month(deputy_id, year, month, df)
+    else:
+        changed = _store_removed_month(deputy_id, year, month)
+    if not changed:
+        return False
+    logging.info(f"Expenses changed for deputy {deputy_id}, {year}-{month:02d}.")
+    return True
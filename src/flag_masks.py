@@ -0,0 +1,154 @@
+"""
+Flag Masks Module
+
+This module stores the flag results of every audited expense (not only the
+flagged ones) as a compact bitmask: bit i of `flag_mask` is set when flag
+FLAG_BITS[i] fired. Since the masks keep which flags fired rather than the
+score, scores and critical sets can be recomputed for any weight vector
+without re-running the audit. The comparative dashboard uses this to re-rank
+deputies under what-if weights.
+
+Masks are rescored with one dot product between the bits of the distinct
+masks and the weight vector; there are at most 2^len(FLAG_BITS) of them.
+"""
+import numpy as np
+import pandas as pd
+from src import config, datastore
+
+# Bit position of each flag. Positions are stored in the datastore, so new
+# flags must be appended at the end and existing ones never reordered.
+FLAG_BITS = [
+    "flag_fim_de_semana",
+    "flag_valor_redondo",
+    "flag_valor_atipico",
+    "flag_transacao_duplicada",
+    "flag_valor_alto_percentil",
+    "flag_documento_invalido",
+    "flag_empresa_recente",
+    "flag_situacao_irregular",
+    "flag_cnae_incompativel",
+    "flag_capital_incompativel",
+    "flag_duplicada_entre_deputados",
+    "flag_acima_dos_pares",
+    "flag_fornecedor_concentrado",
+    "flag_fornecedor_compartilhado",
+    "flag_quebra_de_gasto",
+    "flag_mes_atipico",
+    "flag_alterada_retroativamente",
+]
+MASK_DTYPE = np.uint32
+
+MASK_COLUMNS = ['codDocumento', 'dataDocumento', 'periodo', 'valorLiquido', 'flag_mask']
+
+# --- Encoding & Scoring ---
+
+def encode(df: pd.DataFrame) -> pd.Series:
+    """Packs the flag columns of `df` into one bitmask per row."""
+    mask = np.zeros(len(df), dtype=MASK_DTYPE)
+    for bit, flag_name in enumerate(FLAG_BITS):
+        if flag_name in df.columns:
+            mask |= df[flag_name].fillna(False).to_numpy(dtype=bool).astype(MASK_DTYPE) << MASK_DTYPE(bit)
+    return pd.Series(mask, index=df.index, name='flag_mask')
+
+def decode(masks: np.ndarray) -> np.ndarray:
+    """Unpacks masks into a (rows x FLAG_BITS) matrix of 0/1."""
+    masks = np.asarray(masks, dtype=MASK_DTYPE)
+    return (masks[:, None] >> np.arange(len(FLAG_BITS), dtype=MASK_DTYPE)) & 1
+
+def weight_vector(weights: dict) -> np.ndarray:
+    """Returns the weights in bit order (flags missing from `weights` weigh 0)."""
+    return np.array([weights.get(flag_name, 0) for flag_name in FLAG_BITS], dtype=float)
+
+def score_masks(masks: np.ndarray, weights: dict = None) -> np.ndarray:
+    """Scores every mask under `weights` (config.FLAG_WEIGHTS by default)."""
+    distinct, inverse = np.unique(np.asarray(masks, dtype=MASK_DTYPE), return_inverse=True)
+    scores = decode(distinct) @ weight_vector(weights or config.FLAG_WEIGHTS)
+    return scores[inverse.ravel()]
+
+# --- Storage ---
+
+def build_deputy_masks(scored_df: pd.DataFrame) -> pd.DataFrame:
+    """Returns the expense key, value and flag mask of every prepared and flagged expense."""
+    if scored_df.empty:
+        return pd.DataFrame(columns=MASK_COLUMNS)
+    dates = scored_df['dataDocumento']
+    return pd.DataFrame({
+        'codDocumento': scored_df['codDocumento'] if 'codDocumento' in scored_df.columns else None,
+        'dataDocumento': dates,
+        'periodo': dates.dt.year * 100 + dates.dt.month,
+        'valorLiquido': scored_df['valorLiquido'],
+        'flag_mask': encode(scored_df).astype(int),
+    }, columns=MASK_COLUMNS)
+
+def store_deputy_masks(deputy_id: int, scored_df: pd.DataFrame):
+    """Replaces the stored flag masks of a deputy."""
+    datastore.replace_deputy_rows(datastore.FLAG_MASKS_TABLE, deputy_id, build_deputy_masks(scored_df))
+
+def append_deputy_masks(deputy_id: int, scored_df: pd.DataFrame):
+    """Appends the flag masks of a chunk of a deputy's expenses (see `src.out_of_core`)."""
+    datastore.append_deputy_rows(datastore.FLAG_MASKS_TABLE, deputy_id, build_deputy_masks(scored_df))
+
+def load_masks(start_period: int, end_period: int) -> pd.DataFrame:
+    """Loads the deputy, value and flag mask of every expense in a month range."""
+    if not config.DATASTORE_FILE.exists():
+        return pd.DataFrame()
+    with datastore.connect() as conn:
+        if not datastore.get_table_columns(conn, datastore.FLAG_MASKS_TABLE):
+            return pd.DataFrame()
+        masks = pd.read_sql_query(
+            f'SELECT deputy_id, valorLiquido, flag_mask FROM "{datastore.FLAG_MASKS_TABLE}" '
+            f'WHERE periodo BETWEEN ? AND ?', conn, params=[start_period, end_period]
+        )
+    masks['flag_mask'] = masks['flag_mask'].astype(MASK_DTYPE)
+    return masks
+
+# --- What-If Ranking ---
+
+def rescore_ranking(masks_df: pd.DataFrame, deputies_df: pd.DataFrame, weights: dict,
+                    threshold: float = None, group_by: str = 'deputy') -> pd.DataFrame:
+    """
+    Ranks deputies, parties or states like `aggregates.ranking`, but with the
+    scores recomputed under `weights` and the critical `threshold`
+    (config.SCORE_THRESHOLD by default).
+    """
+    if masks_df.empty:
+        return pd.DataFrame()
+    threshold = config.SCORE_THRESHOLD if threshold is None else threshold
+    scores = score_masks(masks_df['flag_mask'].to_numpy(), weights)
+    is_flagged = masks_df['flag_mask'].to_numpy() != 0
+    is_critical = scores >= threshold
+    values = masks_df['valorLiquido'].to_numpy()
+    df = pd.DataFrame({
+        'deputy_id': masks_df['deputy_id'],
+        'is_flagged': is_flagged,
+        'is_critical': is_critical,
+        'flagged_value': np.where(is_flagged, values, 0),
+        'critical_value': np.where(is_critical, values, 0),
+        'flagged_score': np.where(is_flagged, scores, 0),
+        'score': scores,
+    })
+    per_deputy = df.groupby('deputy_id').agg(
+        critical_expense_count=('is_critical', 'sum'),
+        total_suspicious_expenses=('is_flagged', 'sum'),
+        total_suspicious_value=('flagged_value', 'sum'),
+        total_critical_value=('critical_value', 'sum'),
+        score_sum=('flagged_score', 'sum'),
+        max_suspicion_score=('score', 'max'),
+    ).reset_index()
+    per_deputy = per_deputy.merge(deputies_df, left_on='deputy_id', right_on='id')
+
+    group_columns = {'deputy': ['id', 'nome', 'siglaPartido', 'siglaUf'],
+                     'party': ['siglaPartido'], 'uf': ['siglaUf']}[group_by]
+    ranking = per_deputy.groupby(group_columns).agg(
+        n_deputies=('deputy_id', 'nunique'),
+        critical_expense_count=('critical_expense_count', 'sum'),
+        total_suspicious_expenses=('total_suspicious_expenses', 'sum'),
+        total_suspicious_value=('total_suspicious_value', 'sum'),
+        total_critical_value=('total_critical_value', 'sum'),
+        score_sum=('score_sum', 'sum'),
+        max_suspicion_score=('max_suspicion_score', 'max'),
+    ).reset_index()
+    ranking['average_suspicion_score'] = ranking['score_sum'] / ranking['total_suspicious_expenses'].replace(0, np.nan)
+    return ranking.drop(columns='score_sum').sort_values(
+        ['critical_expense_count', 'average_suspicion_score'], ascending=False
+    ).reset_index(drop=True)
@@ -0,0 +1,175 @@
+"""
+Month Tables Module
+
+This module maintains the Chamber-wide datastore tables that are computed
+month by month from the raw monthly files: the peer baselines, the supplier
+network spend, the spend series and the invoice keys. Each table remembers the
+signature of the raw files each month was computed from (count, total size,
+latest modification), so a refresh only recomputes the months that changed,
+such as a newly downloaded month.
+
+`refresh` reads the changed months of all the given tables in a single pass,
+BATCH_MONTHS at a time and with the columns every table needs, so the raw
+files are parsed once however many tables use them. Pipeline shards compute
+the tables from the inputs exported by every shard instead (see
+`MonthTable.refresh_from_files` and `src.sharding`).
+"""
+import logging
+import os
+import numpy as np
+import pandas as pd
+from src import config, datastore
+
+# Months read per pass, which bounds the rows held in memory.
+BATCH_MONTHS = 12
+
+# --- Raw Months ---
+
+def month_files() -> dict:
+    """Maps each YYYYMM period to the (deputy_id, entry) of its raw monthly files."""
+    months = {}
+    expenses_dir = config.RAW_DATA_DIR / "expenses"
+    if not expenses_dir.exists():
+        return months
+    for deputy_dir in os.scandir(expenses_dir):
+        if not deputy_dir.is_dir() or not deputy_dir.name.isdigit():
+            continue
+        for entry in os.scandir(deputy_dir.path):
+            name = entry.name.removesuffix(".csv")
+            if name == entry.name or len(name) != 7:
+                continue
+            period = int(name[:4]) * 100 + int(name[5:])
+            months.setdefault(period, []).append((int(deputy_dir.name), entry))
+    return months
+
+def _signature(entries: list) -> str:
+    stats = [entry.stat() for _, entry in entries]
+    return f"{len(stats)}:{sum(s.st_size for s in stats)}:{max(s.st_mtime_ns for s in stats)}"
+
+def load_months(files: dict, periods: list, columns: list, deputy_ids: set = None) -> pd.DataFrame:
+    """
+    Loads the given columns of the raw expenses of the given months (of the
+    given deputies only, if any), with the month ('periodo') and deputy
+    ('deputy_id') of each row. 'valorLiquido' is parsed as a number, NaN when
+    it is not one.
+    """
+    frames, keys = [], []
+    for period in periods:
+        for deputy_id, entry in files[period]:
+            if deputy_ids is not None and deputy_id not in deputy_ids:
+                continue
+            frames.append(pd.read_csv(entry.path, usecols=columns))
+            keys.append((period, deputy_id))
+    if not frames:
+        return pd.DataFrame(columns=['periodo', 'deputy_id'] + list(columns))
+    expenses = pd.concat(frames, ignore_index=True)
+    lengths = [len(frame) for frame in frames]
+    # Added once to the whole batch: inserting them file by file costs more than parsing.
+    expenses.insert(0, 'deputy_id', np.repeat([deputy_id for _, deputy_id in keys], lengths))
+    expenses.insert(0, 'periodo', np.repeat([period for period, _ in keys], lengths))
+    if 'valorLiquido' in expenses.columns:
+        expenses['valorLiquido'] = pd.to_numeric(expenses['valorLiquido'], errors='coerce')
+    return expenses
+
+# --- Tables ---
+
+class MonthTable:
+    """
+    A datastore table whose rows are computed month by month from the raw
+    expenses. `compute` turns the raw expenses of some months (`raw_columns`,
+    as returned by `load_months`) into rows of the table (`columns`, with the
+    'periodo' of each row); `ensure_tables` creates the table and its months
+    table. `analyze`, if given, recomputes what is derived from the whole
+    table whenever it changed or `analysis_table` does not exist yet.
+    """
+    def __init__(self, name: str, table: str, months_table: str, columns: list, raw_columns: list,
+                 compute, ensure_tables, analyze=None, analysis_table: str = None):
+        self.name = name
+        self.table = table
+        self.months_table = months_table
+        self.columns = columns
+        self.raw_columns = raw_columns
+        self.compute = compute
+        self.ensure_tables = ensure_tables
+        self.analyze = analyze
+        self.analysis_table = analysis_table
+
+    def _stored_signatures(self, conn) -> dict:
+        return dict(conn.execute(f'SELECT periodo, signature FROM "{self.months_table}"'))
+
+    def _needs_analysis(self, conn) -> bool:
+        return self.analysis_table is not None and not datastore.get_table_columns(conn, self.analysis_table)
+
+    def store_months(self, conn, rows: pd.DataFrame, signatures: dict):
+        """Replaces the rows of the given months and records their signatures."""
+        conn.executemany(f'DELETE FROM "{self.table}" WHERE periodo = ?', ((p,) for p in signatures))
+        placeholders = ", ".join("?" for _ in self.columns)
+        conn.executemany(
+            f'INSERT INTO "{self.table}" ({", ".join(self.columns)}) VALUES ({placeholders})',
+            rows[self.columns].astype(object).itertuples(index=False, name=None)
+        )
+        conn.executemany(
+            f'INSERT OR REPLACE INTO "{self.months_table}" (periodo, signature) VALUES (?, ?)', signatures.items()
+        )
+
+    def refresh_from_files(self, paths: list, read) -> int:
+        """
+        Replaces the whole table with `read(paths)` whenever one of the input
+        files of the pipeline shards changed. Returns the number of months stored.
+        """
+        stats = [os.stat(path) for path in paths]
+        signature = "files:" + ";".join(f"{path}:{st.st_size}:{st.st_mtime_ns}" for path, st in zip(paths, stats))
+        with datastore.connect() as conn:
+            self.ensure_tables(conn)
+            stored = set(self._stored_signatures(conn).values())
+            if stored == {signature} and not self._needs_analysis(conn):
+                return 0
+
+        rows = read(paths)
+        periods = sorted(rows['periodo'].unique().tolist())
+        with datastore.connect() as conn:
+            conn.execute(f'DELETE FROM "{self.months_table}"')
+            conn.execute(f'DELETE FROM "{self.table}"')
+            self.store_months(conn, rows, {period: signature for period in periods})
+        logging.info(f"{self.name} replaced for {len(periods)} months from {len(paths)} shard files.")
+        if self.analyze is not None:
+            self.analyze()
+        return len(periods)
+
+def refresh(tables: list) -> dict:
+    """
+    Recomputes the months of each table whose raw files changed since its last
+    refresh (all months the first time), reading each changed month once for
+    all tables, and analyses the tables that changed. Returns the number of
+    months recomputed per table name.
+    """
+    files = month_files()
+    signatures = {period: _signature(entries) for period, entries in files.items()}
+    changed, analyse = {}, {}
+    with datastore.connect() as conn:
+        for table in tables:
+            table.ensure_tables(conn)
+            stored = table._stored_signatures(conn)
+            changed[table.name] = {period for period, signature in signatures.items() if stored.get(period) != signature}
+            analyse[table.name] = table.analyze is not None and (bool(changed[table.name]) or table._needs_analysis(conn))
+
+    periods = sorted(set().union(*changed.values()))
+    columns = list(dict.fromkeys(column for table in tables for column in table.raw_columns))
+    for start in range(0, len(periods), BATCH_MONTHS):
+        batch = periods[start:start + BATCH_MONTHS]
+        expenses = load_months(files, batch, columns)
+        for table in tables:
+            table_batch = [period for period in batch if period in changed[table.name]]
+            if not table_batch:
+                continue
+            table_expenses = expenses if len(table_batch) == len(batch) else expenses[expenses['periodo'].isin(table_batch)]
+            rows = table.compute(table_expenses[['periodo', 'deputy_id'] + table.raw_columns])
+            with datastore.connect() as conn:
+                table.store_months(conn, rows, {period: signatures[period] for period in table_batch})
+
+    for table in tables:
+        if changed[table.name]:
+            logging.info(f"{table.name} refreshed for {len(changed[table.name])} months.")
+        if analyse[table.name]:
+            table.analyze()
+    return {table.name: len(changed[table.name]) for table in tables}
@@ -0,0 +1,165 @@
+"""
+Out-of-Core Audit Module
+
+This module audits deputies whose expense history does not fit comfortably in
+memory, such as the full multi-legislature history (--full-history). Instead
+of loading a deputy's whole history at once, the monthly CSVs are read in
+chunks sized from a memory ceiling and the audit runs in two passes:
+
+1. Statistics: each chunk contributes mergeable partial statistics. For every
+   deputy, the values of their expenses (for the exact IQR and 95th percentile
+   bounds) and the counts of their duplicate-transaction keys.
+2. Flagging: each chunk is flagged with the deputy-wide statistics, so every
+   flag gives the same result as auditing the whole history in memory. Flagged
+   rows are appended to the deputy's CSV and to the datastore chunk by chunk,
+   and the partial aggregates of the chunks are merged before being written.
+
+Only one chunk and one deputy's statistics are held in memory at a time.
+"""
+import logging
+import numpy as np
+import pandas as pd
+from src import aggregates, auditor, checkpoint, config, datastore, flag_masks, progress
+
+# Peak memory of auditing a chunk relative to the in-memory size of its raw
+# rows (prepared copy, flags, profile join and aggregates).
+WORKING_SET_FACTOR = 6
+
+# --- Chunked Reading ---
+
+def iter_expense_chunks(deputy_id: int, chunk_bytes: int):
+    """
+    Yields a deputy's raw expenses in chronological chunks of whole months,
+    each using about `chunk_bytes` of memory (a single month is never split).
+    """
+    deputy_expense_dir = config.RAW_DATA_DIR / "expenses" / str(deputy_id)
+    if not deputy_expense_dir.exists():
+        logging.warning(f"No expense directory found for deputy {deputy_id}.")
+        return
+
+    chunk, chunk_size = [], 0
+    for csv_file in sorted(deputy_expense_dir.glob("*.csv")):
+        month_df = pd.read_csv(csv_file)
+        chunk.append(month_df)
+        chunk_size += month_df.memory_usage(deep=True).sum()
+        if chunk_size >= chunk_bytes:
+            yield pd.concat(chunk, ignore_index=True)
+            chunk, chunk_size = [], 0
+    if chunk:
+        yield pd.concat(chunk, ignore_index=True)
+
+# --- Mergeable Statistics ---
+
+def _merge_counts(hashes_a, counts_a, hashes_b, counts_b) -> tuple:
+    """Merges two (distinct hashes, counts) pairs."""
+    hashes, inverse = np.unique(np.concatenate([hashes_a, hashes_b]), return_inverse=True)
+    counts = np.bincount(inverse, weights=np.concatenate([counts_a, counts_b]), minlength=len(hashes))
+    return hashes, counts.astype(np.int64)
+
+class DeputyStats:
+    """
+    Partial statistics of a deputy's expenses, built chunk by chunk. Two
+    partials over disjoint expenses merge into the partial of their union.
+    The values are kept in full so the quantiles are exact: a deputy has at
+    most tens of thousands of expenses, a few hundred kilobytes of floats.
+    """
+    def __init__(self):
+        self.values = np.empty(0, dtype=float)
+        self.key_hashes = np.empty(0, dtype=np.uint64)
+        self.key_counts = np.empty(0, dtype=np.int64)
+
+    def add_chunk(self, df: pd.DataFrame):
+        partial = DeputyStats()
+        partial.values = df['valorLiquido'].to_numpy(dtype=float)
+        partial.key_hashes, partial.key_counts = np.unique(auditor.duplicate_key_hashes(df), return_counts=True)
+        self.merge(partial)
+
+    def merge(self, other: "DeputyStats"):
+        self.values = np.concatenate([self.values, other.values])
+        self.key_hashes, self.key_counts = _merge_counts(
+            self.key_hashes, self.key_counts, other.key_hashes, other.key_counts
+        )
+
+    def finalize(self) -> dict:
+        """Returns the statistics the flags use (see `auditor.apply_flags`)."""
+        stats = auditor.compute_value_stats(pd.Series(self.values))
+        stats['duplicate_hashes'] = self.key_hashes[self.key_counts > 1]
+        return stats
+
+# --- Passes ---
+
+def collect_deputy_stats(deputy_id: int, chunk_bytes: int) -> dict:
+    """First pass over a deputy: returns their statistics (None without data)."""
+    deputy_stats = DeputyStats()
+    for raw_df in iter_expense_chunks(deputy_id, chunk_bytes):
+        df = auditor.prepare_expense_data(raw_df)
+        if df.empty:
+            continue
+        deputy_stats.add_chunk(df)
+    return deputy_stats.finalize() if len(deputy_stats.values) else None
+
+def audit_deputy(deputy_id: int, stats: dict, chunk_bytes: int) -> int:
+    """
+    Second pass over a deputy: flags and stores their expenses chunk by chunk.
+    Returns the number of flagged expenses.
+    """
+    logging.info(f"Running out-of-core audit for deputy ID: {deputy_id}")
+    for table in (datastore.RAW_TABLE, datastore.FLAGGED_TABLE, datastore.FLAG_MASKS_TABLE):
+        datastore.replace_deputy_rows(table, deputy_id, pd.DataFrame())
+    output_path = auditor.get_flagged_output_path(deputy_id)
+    output_path.unlink(missing_ok=True)
+
+    deputy_aggregates = aggregates.compute_deputy_aggregates(pd.DataFrame())
+    n_flagged = 0
+    for raw_df in iter_expense_chunks(deputy_id, chunk_bytes):
+        progress.count("audit", "rows", len(raw_df))
+        datastore.append_deputy_rows(datastore.RAW_TABLE, deputy_id, raw_df)
+        df = auditor.prepare_expense_data(raw_df)
+        if df.empty:
+            continue
+        df = auditor.apply_flags(df, deputy_id, stats)
+        deputy_aggregates = aggregates.merge_aggregates([deputy_aggregates, aggregates.compute_deputy_aggregates(df)])
+        flag_masks.append_deputy_masks(deputy_id, df)
+
+        flagged_df = auditor.select_flagged(df)
+        if flagged_df.empty:
+            continue
+        flagged_df.to_csv(output_path, mode="a", header=not output_path.exists(), index=False)
+        datastore.append_deputy_rows(datastore.FLAGGED_TABLE, deputy_id, flagged_df)
+        n_flagged += len(flagged_df)
+
+    aggregates.write_deputy_aggregates(deputy_id, deputy_aggregates)
+    logging.info(f"Finished out-of-core audit for deputy ID: {deputy_id}, found {n_flagged} flagged expenses.")
+    return n_flagged
+
+def run_out_of_core_audit(deputies_df: pd.DataFrame, run_checkpoint: checkpoint.RunCheckpoint,
+                          memory_limit_mb: int = None):
+    """
+    Audits every deputy in two passes under the memory ceiling (in MB,
+    config.OUT_OF_CORE_MEMORY_MB by default). The statistics pass is always
+    redone on resume; deputies already flagged are skipped in the second pass.
+    """
+    memory_limit_mb = memory_limit_mb or config.OUT_OF_CORE_MEMORY_MB
+    chunk_bytes = memory_limit_mb * 1024 * 1024 // WORKING_SET_FACTOR
+    logging.info(f"Out-of-core audit with a {memory_limit_mb} MB ceiling "
+                 f"(chunks of about {chunk_bytes / (1024 * 1024):.1f} MB of raw rows).")
+    done = run_checkpoint.completed("audit")
+    progress.start_stage("audit", 2 * len(deputies_df))
+
+    deputy_stats = {}
+    for deputy_id in deputies_df['id']:
+        checkpoint.check_pause()
+        deputy_stats[deputy_id] = collect_deputy_stats(deputy_id, chunk_bytes)
+        progress.advance("audit")
+
+    progress.advance("audit", len(done))
+    for deputy_id in deputies_df['id']:
+        if deputy_id in done:
+            continue
+        checkpoint.check_pause()
+        if deputy_stats[deputy_id] is None:
+            logging.warning(f"Skipping audit for deputy {deputy_id} due to no valid data.")
+        else:
+            audit_deputy(deputy_id, deputy_stats[deputy_id], chunk_bytes)
+        run_checkpoint.mark_done("audit", deputy_id)
+        progress.advance("audit")
@@ -0,0 +1,126 @@
+"""
+Peer Baselines Module
+
+This module keeps robust statistics of expense values per expense type and
+month across the whole Chamber (optionally also per UF): the number of
+expenses, median, MAD (median absolute deviation) and 95th percentile. The
+auditor joins them to flag expenses far above what the other deputies paid
+for the same kind of expense in the same month, which a deputy's own history
+cannot reveal when they always overspend.
+
+The statistics are computed from the raw monthly files in one grouped pass
+and stored in the datastore, refreshed incrementally: only the months whose
+raw files changed are recomputed, such as a newly downloaded month (see
+`src.month_tables`).
+"""
+import logging
+import pandas as pd
+from src import aggregates, config, datastore, month_tables
+
+BASELINE_COLUMNS = ['periodo', 'tipoDespesa', 'siglaUf', 'n', 'mediana', 'mad', 'p95']
+VALUE_COLUMNS = ['periodo', 'deputy_id', 'tipoDespesa', 'valorLiquido']
+BY_UF_KEY = "peer_baselines_by_uf"
+
+# --- Computation ---
+
+def _values(expenses: pd.DataFrame) -> pd.DataFrame:
+    """Keeps the month, deputy, type and value of the expenses with a type and a value."""
+    return expenses[VALUE_COLUMNS].dropna(subset=['tipoDespesa', 'valorLiquido'])
+
+def load_values(deputy_ids: list) -> pd.DataFrame:
+    """
+    Loads the inputs of the baselines (month, deputy, expense type and value)
+    of the given deputies' expenses, e.g. to combine the data of pipeline
+    shards (see `src.sharding`).
+    """
+    files = month_tables.month_files()
+    return _values(month_tables.load_months(
+        files, sorted(files), ['tipoDespesa', 'valorLiquido'], set(int(i) for i in deputy_ids)
+    ))
+
+def _assign_peer_group(expenses: pd.DataFrame) -> pd.DataFrame:
+    """Adds the UF used to group peers ('' when the whole Chamber is one group)."""
+    uf_by_deputy = {}
+    if config.PEER_BASELINE_BY_UF:
+        labels = aggregates.get_deputy_labels()
+        if not labels.empty:
+            uf_by_deputy = dict(zip(labels['id'], labels['siglaUf']))
+    return expenses.assign(siglaUf=expenses['deputy_id'].map(uf_by_deputy).fillna(''))
+
+def compute_baselines(expenses: pd.DataFrame) -> pd.DataFrame:
+    """Computes the peer statistics of every (month, expense type, UF) group at once."""
+    keys = ['periodo', 'tipoDespesa', 'siglaUf']
+    values = expenses.groupby(keys)['valorLiquido']
+    deviation = (expenses['valorLiquido'] - values.transform('median')).abs()
+    baselines = expenses.assign(desvio=deviation).groupby(keys).agg(
+        n=('valorLiquido', 'size'),
+        mediana=('valorLiquido', 'median'),
+        mad=('desvio', 'median'),
+    )
+    baselines['p95'] = values.quantile(0.95)
+    return baselines.reset_index()[BASELINE_COLUMNS]
+
+# --- Storage ---
+
+def _ensure_tables(conn, by_uf: bool):
+    """Creates the baseline tables, dropping them first if they were grouped differently."""
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (BY_UF_KEY,)).fetchone()
+    if row is not None and row[0] != str(int(by_uf)):
+        logging.info("Peer baseline grouping changed. Recomputing all months.")
+        conn.execute(f'DROP TABLE IF EXISTS "{datastore.PEER_BASELINES_TABLE}"')
+        conn.execute(f'DROP TABLE IF EXISTS "{datastore.PEER_BASELINE_MONTHS_TABLE}"')
+    conn.execute(
+        "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+        (BY_UF_KEY, str(int(by_uf)))
+    )
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS "{datastore.PEER_BASELINES_TABLE}" (
+            periodo INTEGER, tipoDespesa TEXT, siglaUf TEXT, n INTEGER,
+            mediana REAL, mad REAL, p95 REAL, PRIMARY KEY (periodo, tipoDespesa, siglaUf)
+        )""")
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS "{datastore.PEER_BASELINE_MONTHS_TABLE}" (
+            periodo INTEGER PRIMARY KEY, signature TEXT
+        )""")
+
+MONTH_TABLE = month_tables.MonthTable(
+    "Peer baselines", datastore.PEER_BASELINES_TABLE, datastore.PEER_BASELINE_MONTHS_TABLE,
+    BASELINE_COLUMNS, ['tipoDespesa', 'valorLiquido'],
+    compute=lambda expenses: compute_baselines(_assign_peer_group(_values(expenses))),
+    ensure_tables=lambda conn: _ensure_tables(conn, config.PEER_BASELINE_BY_UF),
+)
+
+def refresh(value_files: list = None) -> int:
+    """
+    Recomputes the baselines of the months whose raw files changed since the
+    last refresh (all months the first time). Returns the number of months
+    recomputed. With `value_files` (CSVs written by `load_values`, one per
+    pipeline shard), the baselines are computed from them instead of the raw
+    files, and all months are recomputed whenever one of them changes.
+    """
+    if value_files:
+        return MONTH_TABLE.refresh_from_files(value_files, lambda paths: MONTH_TABLE.compute(
+            pd.concat([pd.read_csv(path) for path in paths], ignore_index=True)
+        ))
+    return month_tables.refresh([MONTH_TABLE])[MONTH_TABLE.name]
+
+def get_baselines(periods: list, deputy_id: int) -> pd.DataFrame:
+    """
+    Returns the peer statistics of the given months for a deputy's peer group
+    (the whole Chamber, or the deputy's UF with config.PEER_BASELINE_BY_UF).
+    """
+    periods = [int(period) for period in pd.unique(pd.Series(periods).dropna())]
+    if not periods or not config.DATASTORE_FILE.exists():
+        return pd.DataFrame(columns=BASELINE_COLUMNS)
+    with datastore.connect() as conn:
+        if not datastore.get_table_columns(conn, datastore.PEER_BASELINES_TABLE):
+            return pd.DataFrame(columns=BASELINE_COLUMNS)
+        uf = ''
+        if config.PEER_BASELINE_BY_UF and datastore.get_table_columns(conn, datastore.DEPUTIES_TABLE):
+            row = conn.execute(f'SELECT siglaUf FROM "{datastore.DEPUTIES_TABLE}" WHERE id = ?', (int(deputy_id),)).fetchone()
+            uf = row[0] if row else ''
+        placeholders = ", ".join("?" for _ in periods)
+        return pd.read_sql_query(
+            f'SELECT {", ".join(BASELINE_COLUMNS)} FROM "{datastore.PEER_BASELINES_TABLE}" '
+            f'WHERE siglaUf = ? AND periodo IN ({placeholders})', conn, params=[uf] + periods
+        )
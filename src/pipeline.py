@@ -0,0 +1,259 @@
+"""
+Pipeline Module
+
+This module orchestrates the pipeline stages: downloading the deputies'
+expenses, auditing them and generating the period reports. The stages run one
+after the other, overlapped as a streaming producer/consumer pipeline, or for
+one shard of the deputies (see `src.sharding`). `main.py` imports it only for
+the commands that run the pipeline.
+"""
+import logging
+import queue
+import threading
+from datetime import datetime
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+from src import aggregates, auditor, checkpoint, config, downloader, month_tables, out_of_core, peer_baselines, progress, reporter, shared_invoices, sharding, spend_series, summary_manager, supplier_network
+
+PIPELINE_STAGES = ['download', 'audit', 'report']
+
+def get_deputies(limit: int = None, full_history: bool = False) -> pd.DataFrame:
+    """
+    Loads the deputies dataframe from the local CSV file. With `full_history`,
+    every deputy who served since config.HISTORY_START_YEAR is included.
+    """
+    downloader.download_deputies(full_history)
+    filename = "deputados_historico.csv" if full_history else "deputados.csv"
+    deputies_df = pd.read_csv(config.RAW_DATA_DIR / filename)
+    if limit:
+        return deputies_df.head(limit)
+    return deputies_df
+
+def get_years_to_check(processing_date: datetime, full_history: bool = False) -> list:
+    """
+    Returns the years covered by the configured months of history, or every
+    year since config.HISTORY_START_YEAR with `full_history`.
+    """
+    if full_history:
+        return list(range(config.HISTORY_START_YEAR, processing_date.year + 1))
+    return sorted(set(
+        (processing_date - relativedelta(months=i)).year
+        for i in range(config.MONTHS_OF_HISTORY)
+    ))
+
+def download_deputy(deputy_id: int, years: list, summary_data: dict):
+    """Downloads every year of a deputy's expenses that is not in the summary yet."""
+    for year in years:
+        if summary_manager.check_if_downloaded(summary_data, deputy_id, year):
+            continue
+        downloader.download_deputy_expenses(deputy_id, year)
+
+def run_download_pipeline(processing_date: datetime, deputies_df: pd.DataFrame,
+                          run_checkpoint: checkpoint.RunCheckpoint, full_history: bool = False):
+    """Runs the data download pipeline using the summary file for efficiency."""
+    logging.info("--- Starting Download Pipeline ---")
+    logging.info(f"Processing {len(deputies_df)} deputies.")
+    summary_data = summary_manager.load_summary()
+    years_to_check = get_years_to_check(processing_date, full_history)
+    done = run_checkpoint.completed("download")
+    progress.start_stage("download", len(deputies_df))
+    progress.advance("download", len(done))
+    for _, deputy in deputies_df.iterrows():
+        if deputy['id'] in done:
+            continue
+        checkpoint.check_pause()
+        download_deputy(deputy['id'], years_to_check, summary_data)
+        run_checkpoint.mark_done("download", deputy['id'])
+        progress.advance("download")
+    progress.finish_stage("download")
+    run_checkpoint.complete_stage("download")
+    logging.info("--- Download Pipeline Finished ---")
+
+def refresh_month_tables(peer_value_files: list = None, network_spend_files: list = None,
+                         series_spend_files: list = None, invoice_key_files: list = None):
+    """
+    Refreshes the peer baselines, the supplier network, the spend series and
+    the shared invoices: from the given files of the pipeline shards, or else
+    from the raw monthly files, read once for all of them (see `src.month_tables`).
+    """
+    sources = [
+        (peer_baselines, peer_value_files), (supplier_network, network_spend_files),
+        (spend_series, series_spend_files), (shared_invoices, invoice_key_files),
+    ]
+    for module, files in sources:
+        if files:
+            module.refresh(files)
+    month_tables.refresh([module.MONTH_TABLE for module, files in sources if not files])
+
+def run_audit_pipeline(deputies_df: pd.DataFrame, run_checkpoint: checkpoint.RunCheckpoint,
+                       out_of_core_limit_mb: int = None, full_history: bool = False,
+                       peer_value_files: list = None, network_spend_files: list = None,
+                       series_spend_files: list = None, invoice_key_files: list = None):
+    """
+    Runs the data auditing pipeline. With `out_of_core_limit_mb`, deputies are
+    audited in chunks under that memory ceiling (see `src.out_of_core`). The
+    peer baselines, the supplier network, the spend series and the shared
+    invoices come from `peer_value_files`, `network_spend_files`,
+    `series_spend_files` and `invoice_key_files` when given (sharded runs).
+    """
+    logging.info("--- Starting Audit Pipeline ---")
+    aggregates.refresh_deputies(get_deputies(full_history=full_history))
+    refresh_month_tables(peer_value_files, network_spend_files, series_spend_files, invoice_key_files)
+    if out_of_core_limit_mb:
+        out_of_core.run_out_of_core_audit(deputies_df, run_checkpoint, out_of_core_limit_mb)
+        progress.finish_stage("audit")
+        run_checkpoint.complete_stage("audit")
+        logging.info("--- Audit Pipeline Finished ---")
+        return
+    done = run_checkpoint.completed("audit")
+    progress.start_stage("audit", len(deputies_df))
+    progress.advance("audit", len(done))
+    for _, deputy in deputies_df.iterrows():
+        if deputy['id'] in done:
+            continue
+        checkpoint.check_pause()
+        auditor.run_deputy_audit(deputy['id'])
+        run_checkpoint.mark_done("audit", deputy['id'])
+        progress.advance("audit")
+    progress.finish_stage("audit")
+    run_checkpoint.complete_stage("audit")
+    logging.info("--- Audit Pipeline Finished ---")
+
+def run_report_pipeline(deputies_df: pd.DataFrame, processing_date: datetime, period: str):
+    """Runs the CSV report generation pipeline for the specified period."""
+    logging.info(f"--- Starting CSV Report Pipeline for period: {period} ---")
+    progress.start_stage("report", 1)
+    reporter.generate_period_reports(deputies_df, processing_date, period)
+    progress.advance("report")
+    progress.finish_stage("report")
+    logging.info("--- CSV Report Pipeline Finished ---")
+
+def run_shard_pipeline(stages: list, deputies_df: pd.DataFrame, processing_date: datetime, period: str,
+                       run_checkpoint: checkpoint.RunCheckpoint, shard: tuple, shard_dir: str = None,
+                       full_history: bool = False, out_of_core_limit_mb: int = None):
+    """
+    Runs the stages for one shard's deputies, one after the other, and exports
+    the shard's outputs to the shard directory (see `src.sharding`). The audit
+    needs the peer values, network spend, series spend and invoice keys of
+    every shard, so all shards must have finished their download stage before
+    any of them audits.
+    """
+    index, count = shard
+    if 'download' in stages:
+        run_download_pipeline(processing_date, deputies_df, run_checkpoint, full_history)
+        sharding.export_peer_values(deputies_df, index, count, shard_dir)
+        sharding.export_network_spend(deputies_df, index, count, shard_dir)
+        sharding.export_series_spend(deputies_df, index, count, shard_dir)
+        sharding.export_invoice_keys(deputies_df, index, count, shard_dir)
+    if 'audit' in stages:
+        run_audit_pipeline(deputies_df, run_checkpoint, out_of_core_limit_mb, full_history,
+                           peer_value_files=sharding.peer_value_files(count, shard_dir),
+                           network_spend_files=sharding.network_spend_files(count, shard_dir),
+                           series_spend_files=sharding.series_spend_files(count, shard_dir),
+                           invoice_key_files=sharding.invoice_key_files(count, shard_dir))
+        sharding.export_tables(deputies_df, index, count, shard_dir)
+    if 'report' in stages:
+        logging.info(f"--- Starting Shard Report Pipeline for period: {period} ---")
+        progress.start_stage("report", 1)
+        builder = reporter.build_period_report(deputies_df, processing_date, period)
+        sharding.save_partial_report(builder, index, count, shard_dir)
+        progress.advance("report")
+        progress.finish_stage("report")
+
+def run_streaming_pipeline(deputies_df: pd.DataFrame, processing_date: datetime,
+                           run_checkpoint: checkpoint.RunCheckpoint, period: str = None):
+    """
+    Runs download and audit as an overlapped producer/consumer pipeline: each
+    deputy is audited as soon as its downloads finish, while the next deputies
+    are still downloading. A bounded queue applies backpressure to the
+    downloader. If `period` is given, each audited deputy is folded into the
+    period report right away and the reports are saved at the end.
+    Deputies completed in a previous, interrupted run are not redone.
+    """
+    logging.info("--- Starting Streaming Download/Audit Pipeline ---")
+    aggregates.refresh_deputies(get_deputies())
+    # Months still being downloaded use the baselines, network, series and
+    # invoice keys of the previous run.
+    refresh_month_tables()
+    audit_queue = queue.Queue(maxsize=config.PIPELINE_QUEUE_SIZE)
+    report_builder = reporter.PeriodReportBuilder(processing_date, period) if period else None
+    report_lock = threading.Lock()
+    summary_data = summary_manager.load_summary()
+    years_to_check = get_years_to_check(processing_date)
+    downloaded = run_checkpoint.completed("download")
+    audited = run_checkpoint.completed("audit")
+    paused = threading.Event()
+    # Failures are re-raised once the workers stop, so the checkpoint keeps
+    # what is left to do and the run exits non-zero, like the sequential path.
+    failures = []
+
+    def produce():
+        try:
+            for position, deputy in deputies_df.iterrows():
+                if deputy['id'] not in downloaded:
+                    if checkpoint.pause_requested():
+                        paused.set()
+                        return
+                    download_deputy(deputy['id'], years_to_check, summary_data)
+                    run_checkpoint.mark_done("download", deputy['id'])
+                progress.advance("download")
+                # Blocks while the auditors are behind, bounding buffered work.
+                audit_queue.put((position, deputy['id'], deputy['nome']))
+        except Exception as e:
+            logging.exception("Download producer failed.")
+            progress.count("download", "errors")
+            failures.append(e)
+        finally:
+            for _ in range(config.AUDIT_WORKERS):
+                audit_queue.put(None)
+            progress.finish_stage("download")
+
+    def consume():
+        while True:
+            item = audit_queue.get()
+            if item is None:
+                return
+            position, deputy_id, deputy_name = item
+            try:
+                if deputy_id in audited:
+                    # Audited before the interruption: reuse the saved results.
+                    flagged_df = reporter.load_deputy_flagged_expenses(deputy_id)
+                elif checkpoint.pause_requested():
+                    paused.set()
+                    continue
+                else:
+                    flagged_df = auditor.run_deputy_audit(deputy_id)
+                    run_checkpoint.mark_done("audit", deputy_id)
+                if report_builder is not None:
+                    with report_lock:
+                        report_builder.add_deputy(position, deputy_id, deputy_name, flagged_df)
+            except Exception as e:
+                logging.exception(f"Audit failed for deputy {deputy_id}.")
+                progress.count("audit", "errors")
+                failures.append(e)
+            progress.advance("audit")
+
+    progress.start_stage("download", len(deputies_df))
+    progress.start_stage("audit", len(deputies_df))
+    workers = [threading.Thread(target=produce, name="download")]
+    workers += [threading.Thread(target=consume, name=f"audit-{i}") for i in range(config.AUDIT_WORKERS)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    progress.finish_stage("audit")
+    if failures:
+        raise RuntimeError(f"The streaming pipeline failed ({len(failures)} errors); "
+                           f"run the same command again to resume.") from failures[0]
+    if paused.is_set():
+        raise checkpoint.PipelinePaused()
+    run_checkpoint.complete_stage("download")
+    run_checkpoint.complete_stage("audit")
+    logging.info("--- Streaming Download/Audit Pipeline Finished ---")
+
+    if report_builder is not None:
+        logging.info(f"--- Saving CSV Reports for period: {period} ---")
+        progress.start_stage("report", 1)
+        report_builder.save()
+        progress.advance("report")
+        progress.finish_stage("report")
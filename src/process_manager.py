@@ -4,13 +4,30 @@ Process Manager
 This module handles the lifecycle of the background pipeline process, making it
 resilient to Streamlit page reloads. It uses a file-based approach to persist
 the process ID (PID) and status.
+
+Pipeline runs are submitted as jobs to a file-backed queue. A background
+scheduler process (tracked like any other managed process) splits each job into
+download -> audit -> report stages and runs ready stages side by side, up to a
+configurable concurrency.
+
+Pausing is cooperative: running stages stop at their next checkpoint and exit
+with checkpoint.PAUSED_EXIT_CODE, and resuming re-queues them so they continue
+from that checkpoint. Stages interrupted by a crash or reboot are re-queued the
+same way by recover_jobs().
 """
+import argparse
+import fcntl
 import json
 import logging
 import os
 import signal
 import subprocess
+import sys
+import time
+import uuid
+from contextlib import contextmanager
 from pathlib import Path
+from src import checkpoint, config
 
 PROCESS_FILE = Path("process_info.json")
 
@@ -116,6 +133,14 @@ def is_process_running(pid: int) -> bool:
     """Check if a process with the given PID is running."""
     if pid is None:
         return False
+    # If the process is our own child and has exited, reap it: a zombie would
+    # otherwise still answer to signal 0 below.
+    try:
+        reaped_pid, _ = os.waitpid(pid, os.WNOHANG)
+        if reaped_pid == pid:
+            return False
+    except ChildProcessError:
+        pass
     # In Unix-like systems, sending signal 0 to a process checks for its existence
     # without actually sending a signal. It raises an OSError if the PID does not exist.
     try:
@@ -124,3 +149,282 @@ def is_process_running(pid: int) -> bool:
         return False
     else:
         return True
+
+# --- Job Queue & Stage Scheduler ---
+
+JOBS_FILE = Path("jobs.json")
+JOBS_LOCK_FILE = Path("jobs.json.lock")
+JOB_LOGS_DIR = Path("logs")
+
+# Every job is split into these stages, in this order. A stage only waits for
+# the stages it depends on *within the same job*, so a report-only job does not
+# wait behind another job's long download.
+STAGES = ["download", "audit", "report"]
+STAGE_DEPENDENCIES = {
+    "download": [],
+    "audit": ["download"],
+    "report": ["audit"],
+}
+# Stages of the same kind never run at the same time: downloads share the API
+# rate limit and audits/reports write to the same output files.
+EXCLUSIVE_STAGES = set(STAGES)
+
+def _read_jobs() -> dict:
+    """
+    Reads the job state. A corrupt file (e.g. from an interrupted write by an
+    older version) is backed up before an empty queue replaces it.
+    """
+    if not JOBS_FILE.exists():
+        return {"jobs": []}
+    try:
+        with open(JOBS_FILE, "r") as f:
+            return json.load(f)
+    except (json.JSONDecodeError, IOError) as e:
+        backup = JOBS_FILE.with_name(f"{JOBS_FILE.name}.corrupt-{time.strftime('%Y%m%d-%H%M%S')}")
+        os.replace(JOBS_FILE, backup)
+        logging.warning(f"Could not read jobs file ({e}). Moved it to {backup} and started with an empty queue.")
+        return {"jobs": []}
+
+@contextmanager
+def _locked_jobs():
+    """Loads the job state under an exclusive file lock and saves it atomically on exit."""
+    with open(JOBS_LOCK_FILE, "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            state = _read_jobs()
+            yield state
+            tmp_path = JOBS_FILE.with_name(f"{JOBS_FILE.name}.tmp")
+            with open(tmp_path, "w") as f:
+                json.dump(state, f, indent=4)
+            os.replace(tmp_path, JOBS_FILE)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+def list_jobs() -> list:
+    """Returns all jobs (queued, running and finished), oldest first, without writing the state."""
+    if not JOBS_FILE.exists():
+        return []
+    with open(JOBS_LOCK_FILE, "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_SH)
+        try:
+            with open(JOBS_FILE, "r") as f:
+                return json.load(f)["jobs"]
+        except (json.JSONDecodeError, IOError) as e:
+            # Left for the next writer, which backs the file up.
+            logging.warning(f"Could not read jobs file ({e}).")
+            return []
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+def submit_job(date: str, period: str, limit: int = None, stages: list = None,
+               concurrency: int = None) -> dict:
+    """
+    Adds a job to the queue and makes sure the scheduler is running.
+    `stages` is any subset of STAGES (all of them by default); `concurrency` only
+    applies if the scheduler has to be started.
+    """
+    stages = [stage for stage in STAGES if stage in (stages or STAGES)]
+    job = {
+        "id": f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}",
+        "submitted_at": time.time(),
+        "params": {"date": date, "period": period, "limit": limit},
+        "status": "queued",
+        "stages": [
+            {"name": stage, "status": "pending", "pid": None,
+             "started_at": None, "finished_at": None, "returncode": None}
+            for stage in stages
+        ],
+    }
+    with _locked_jobs() as state:
+        state["jobs"].append(job)
+    logging.info(f"Job {job['id']} queued with stages {stages}.")
+    ensure_scheduler_running(concurrency)
+    return job
+
+def cancel_job(job_id: str):
+    """Cancels the pending stages of a job and terminates its running stage, if any."""
+    with _locked_jobs() as state:
+        for job in state["jobs"]:
+            if job["id"] != job_id:
+                continue
+            for stage in job["stages"]:
+                if stage["status"] == "pending":
+                    stage["status"] = "cancelled"
+                elif stage["status"] == "running" and is_process_running(stage["pid"]):
+                    os.kill(stage["pid"], signal.SIGTERM)
+            job["status"] = "cancelled"
+
+def get_running_stage_pids() -> list:
+    """Returns the PIDs of all stage processes currently running."""
+    return [
+        stage["pid"]
+        for job in list_jobs()
+        for stage in job["stages"]
+        if stage["status"] == "running" and stage["pid"]
+    ]
+
+def is_paused() -> bool:
+    """Returns True while a pause is requested or any job is paused."""
+    return checkpoint.pause_requested() or any(job["status"] == "paused" for job in list_jobs())
+
+def pause_jobs():
+    """
+    Asks running stages to stop at their next checkpoint. The scheduler stops
+    launching new stages and marks the interrupted ones as paused.
+    """
+    checkpoint.request_pause()
+    update_process_status("paused")
+    logging.info("Pause requested for all running jobs.")
+
+def resume_jobs(concurrency: int = None):
+    """Re-queues paused stages, which continue from their checkpoints."""
+    checkpoint.clear_pause_request()
+    with _locked_jobs() as state:
+        for job in state["jobs"]:
+            for stage in job["stages"]:
+                if stage["status"] == "paused":
+                    stage["status"] = "pending"
+            if job["status"] == "paused":
+                job["status"] = "running"
+    update_process_status("running")
+    logging.info("Resuming paused jobs.")
+    ensure_scheduler_running(concurrency)
+
+def recover_jobs():
+    """
+    Restarts the scheduler if it died (crash, reboot) while jobs still had work
+    to do. Stages that were running are re-queued by the scheduler and resume
+    from their checkpoints.
+    """
+    if get_process_info() or checkpoint.pause_requested():
+        return
+    unfinished = any(
+        stage["status"] in ("pending", "running")
+        for job in list_jobs() if job["status"] != "cancelled"
+        for stage in job["stages"]
+    )
+    if unfinished:
+        logging.info("Unfinished jobs found without a scheduler. Recovering.")
+        ensure_scheduler_running()
+
+def ensure_scheduler_running(concurrency: int = None):
+    """Starts the background scheduler process unless it is already running."""
+    if get_process_info():
+        return
+    concurrency = concurrency or config.JOB_CONCURRENCY
+    start_process([sys.executable, "-m", "src.process_manager", "--concurrency", str(concurrency)])
+
+def _stage_command(job: dict, stage_name: str) -> list:
+    """Builds the main.py command that runs a single stage of a job."""
+    params = job["params"]
+    command = [
+        sys.executable, "main.py", stage_name,
+        "--date", params["date"], "--period", params["period"], "--job-id", job["id"],
+        "--log-file", str(JOB_LOGS_DIR / f"{job['id']}_{stage_name}.log"),
+    ]
+    if params.get("limit"):
+        command.extend(["--limit", str(params["limit"])])
+    return command
+
+def _is_stage_ready(job: dict, stage: dict) -> bool:
+    """A stage is ready when every dependency present in the job has finished."""
+    statuses = {s["name"]: s["status"] for s in job["stages"]}
+    return all(statuses.get(dep, "done") == "done" for dep in STAGE_DEPENDENCIES[stage["name"]])
+
+def _update_job_status(job: dict):
+    """Derives the status of a job from the statuses of its stages."""
+    if job["status"] == "cancelled":
+        return
+    statuses = [stage["status"] for stage in job["stages"]]
+    if "paused" in statuses and "running" not in statuses:
+        job["status"] = "paused"
+    elif "failed" in statuses:
+        for stage in job["stages"]:
+            if stage["status"] == "pending":
+                stage["status"] = "skipped"
+        job["status"] = "failed" if "running" not in statuses else "running"
+    elif all(status == "done" for status in statuses):
+        job["status"] = "done"
+    elif "running" in statuses or "done" in statuses:
+        job["status"] = "running"
+
+def run_scheduler(concurrency: int):
+    """
+    Runs queued jobs stage by stage with at most `concurrency` stage processes at
+    a time, until the queue is empty or paused. Stage timings are recorded in the
+    jobs file.
+    """
+    JOB_LOGS_DIR.mkdir(exist_ok=True)
+    running = {}
+    logging.info(f"Scheduler started with concurrency {concurrency}.")
+    while True:
+        with _locked_jobs() as state:
+            busy_stages = set()
+            has_pending = False
+            orphaned = False
+            paused = checkpoint.pause_requested()
+            for job in state["jobs"]:
+                for stage in job["stages"]:
+                    key = (job["id"], stage["name"])
+                    if stage["status"] != "running":
+                        continue
+                    process = running.get(key)
+                    if process is None:
+                        # Left running by a previous scheduler that crashed.
+                        if is_process_running(stage["pid"]):
+                            busy_stages.add(stage["name"])
+                            orphaned = True
+                            continue
+                        stage["status"] = "pending"
+                        logging.info(f"Job {job['id']} stage '{stage['name']}' was interrupted. Re-queued to resume from its checkpoint.")
+                        continue
+                    returncode = process.poll()
+                    if returncode is None:
+                        busy_stages.add(stage["name"])
+                        continue
+                    running.pop(key, None)
+                    if returncode == checkpoint.PAUSED_EXIT_CODE:
+                        stage["status"] = "paused"
+                    else:
+                        stage["status"] = "done" if returncode == 0 else "failed"
+                    stage["returncode"] = returncode
+                    stage["finished_at"] = time.time()
+                    logging.info(f"Job {job['id']} stage '{stage['name']}' finished with code {returncode}.")
+                _update_job_status(job)
+
+            for job in state["jobs"]:
+                if paused:
+                    break
+                for stage in job["stages"]:
+                    if stage["status"] != "pending":
+                        continue
+                    has_pending = True
+                    if len(running) >= concurrency or not _is_stage_ready(job, stage):
+                        continue
+                    if stage["name"] in EXCLUSIVE_STAGES and stage["name"] in busy_stages:
+                        continue
+                    with open("pipeline.log", "a") as log:
+                        process = subprocess.Popen(
+                            _stage_command(job, stage["name"]), stdout=log, stderr=subprocess.STDOUT
+                        )
+                    running[(job["id"], stage["name"])] = process
+                    busy_stages.add(stage["name"])
+                    stage.update({"status": "running", "pid": process.pid, "started_at": time.time()})
+                    logging.info(f"Job {job['id']} stage '{stage['name']}' started with PID {process.pid}.")
+                _update_job_status(job)
+
+        if not running and not orphaned:
+            if paused:
+                logging.info("Jobs paused. Scheduler exiting until they are resumed.")
+                return
+            if not has_pending:
+                logging.info("Job queue is empty. Scheduler exiting.")
+                return
+        time.sleep(1)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Run the pipeline job scheduler.")
+    parser.add_argument("--concurrency", type=int, default=config.JOB_CONCURRENCY,
+                        help="Maximum number of stage processes running at the same time.")
+    run_scheduler(parser.parse_args().concurrency)
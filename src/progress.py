@@ -0,0 +1,120 @@
+"""
+Progress Module
+
+This module implements a cheap, append-only event channel between the pipeline
+process and the Streamlit dashboard. Every event is a single JSON line in
+`config.PROGRESS_FILE` describing a stage, how many deputies it has completed,
+its throughput (rows/s and requests/s), the number of errors and an ETA.
+The dashboard only reads the file, so no socket or shared state is required.
+"""
+import json
+import logging
+import threading
+import time
+from src import config
+
+_lock = threading.Lock()
+_stages = {}
+
+def reset():
+    """Clears the event file and the in-memory stage state for a new run."""
+    with _lock:
+        _stages.clear()
+        try:
+            config.PROGRESS_FILE.write_text("", encoding="utf-8")
+        except IOError as e:
+            logging.error(f"Could not reset progress file: {e}")
+
+def _new_stage_state(total: int) -> dict:
+    return {
+        "started_at": time.time(),
+        "total": total,
+        "completed": 0,
+        "rows": 0,
+        "requests": 0,
+        "errors": 0,
+    }
+
+def start_stage(stage: str, total: int):
+    """Registers the start of a stage with the number of units (deputies) it will process."""
+    with _lock:
+        _stages[stage] = _new_stage_state(total)
+    _emit(stage, "started")
+
+def count(stage: str, metric: str, amount: int = 1):
+    """
+    Increments a counter ('rows', 'requests' or 'errors') of a stage.
+    Counters of a stage that was not started are tracked without a total.
+    """
+    with _lock:
+        state = _stages.setdefault(stage, _new_stage_state(0))
+        state[metric] = state.get(metric, 0) + amount
+
+def advance(stage: str, amount: int = 1):
+    """Marks `amount` units of a stage as completed and emits a progress event."""
+    with _lock:
+        state = _stages.setdefault(stage, _new_stage_state(0))
+        state["completed"] += amount
+    _emit(stage, "running")
+
+def finish_stage(stage: str):
+    """Emits the final event of a stage."""
+    _emit(stage, "finished")
+
+def _build_event(stage: str, status: str, state: dict) -> dict:
+    """Derives throughput and ETA figures from the raw counters of a stage."""
+    now = time.time()
+    elapsed = max(now - state["started_at"], 1e-6)
+    completed, total = state["completed"], state["total"]
+    eta = None
+    if status != "finished" and completed and total:
+        eta = round(elapsed / completed * (total - completed), 1)
+    return {
+        "ts": round(now, 3),
+        "stage": stage,
+        "status": status,
+        "completed": completed,
+        "total": total,
+        "rows": state["rows"],
+        "requests": state["requests"],
+        "errors": state["errors"],
+        "elapsed_s": round(elapsed, 1),
+        "rows_per_s": round(state["rows"] / elapsed, 2),
+        "requests_per_s": round(state["requests"] / elapsed, 2),
+        "eta_s": eta,
+    }
+
+def _emit(stage: str, status: str):
+    """Appends one event line to the progress file."""
+    with _lock:
+        state = _stages.get(stage)
+        if state is None:
+            return
+        event = _build_event(stage, status, state)
+        try:
+            with open(config.PROGRESS_FILE, "a", encoding="utf-8") as f:
+                f.write(json.dumps(event) + "\n")
+        except IOError as e:
+            logging.error(f"Could not write progress event: {e}")
+
+# --- Reading (Dashboard side) ---
+
+def read_events() -> list:
+    """Reads all events from the progress file, skipping partially written lines."""
+    if not config.PROGRESS_FILE.exists():
+        return []
+    events = []
+    with open(config.PROGRESS_FILE, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                events.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return events
+
+def latest_by_stage(events: list) -> dict:
+    """Returns the most recent event of each stage, preserving the stage order."""
+    latest = {}
+    for event in events:
+        latest[event["stage"]] = event
+    return latest
@@ -7,97 +7,186 @@ for different time periods (daily, weekly, monthly).
 import pandas as pd
 import logging
 from datetime import datetime, timedelta
-from src import config
+from src import config, spend_series, supplier_network
 from dateutil.relativedelta import relativedelta
 
-def _load_all_flagged_expenses(deputies_df: pd.DataFrame) -> pd.DataFrame:
-    """Loads and concatenates all flagged expense files for the given deputies."""
-    all_flagged_dfs = []
-    for _, deputy in deputies_df.iterrows():
-        deputy_id = deputy['id']
-        processed_file = config.PROCESSED_DATA_DIR / "flags_and_scores" / str(deputy_id) / "flagged_expenses.csv"
-        if processed_file.exists():
-            df = pd.read_csv(processed_file, parse_dates=['dataDocumento'])
-            df['deputy_id'] = deputy_id
-            df['deputy_name'] = deputy['nome']
-            all_flagged_dfs.append(df)
-    if not all_flagged_dfs:
-        logging.warning("No flagged expense data found to generate reports.")
-        return pd.DataFrame()
-    return pd.concat(all_flagged_dfs, ignore_index=True)
+# Document columns are read as text: parsed as numbers they lose leading zeros,
+# and their type would depend on the other rows of the file.
+TEXT_COLUMNS = {'cnpjCpfFornecedor': str, 'supplier_key': str}
 
-def generate_period_reports(deputies_df: pd.DataFrame, ref_date: datetime, period: str):
-    """
-    Generates and saves summary reports for a specified period (diário, semanal, mensal).
-    """
-    logging.info(f"Generating reports for period '{period}' with reference date {ref_date.date()}.")
-    
-    all_expenses_df = _load_all_flagged_expenses(deputies_df)
-    if all_expenses_df.empty:
-        logging.info("No flagged data available. Skipping report generation.")
-        return
+def load_deputy_flagged_expenses(deputy_id: int) -> pd.DataFrame:
+    """Loads the flagged expenses file of a deputy as the reports read it, or returns None if there is none."""
+    processed_file = config.flagged_expenses_path(deputy_id)
+    if not processed_file.exists():
+        return None
+    return pd.read_csv(processed_file, parse_dates=['dataDocumento'], dtype=TEXT_COLUMNS)
 
-    # Determine the date range based on the period
-    ref_date_d = ref_date.date()
+def get_period_bounds(ref_date: datetime, period: str) -> tuple:
+    """Returns the (start, end) dates covered by a period (diário, semanal, mensal)."""
+    ref_date_d = ref_date.date() if isinstance(ref_date, datetime) else ref_date
     if period == 'diário':
-        start_date = ref_date_d
-        end_date = ref_date_d
-    elif period == 'semanal':
+        return ref_date_d, ref_date_d
+    if period == 'semanal':
         # The week starts on Sunday (6) and ends on Saturday (5).
         # We need to adjust Python's weekday() where Monday is 0 and Sunday is 6.
         # We consider Sunday the start of the week.
         days_since_sunday = (ref_date_d.weekday() + 1) % 7
         start_date = ref_date_d - timedelta(days=days_since_sunday)
-        end_date = start_date + timedelta(days=6)
-    elif period == 'mensal':
+        return start_date, start_date + timedelta(days=6)
+    if period == 'mensal':
         # The period is the entire month of the reference date.
         start_date = ref_date_d.replace(day=1)
-        end_date = start_date + relativedelta(months=1) - timedelta(days=1)
-    else:
-        logging.error(f"Invalid period specified: {period}")
-        return
-    
-    logging.info(f"Report period defined from {start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}.")
-    
-    period_expenses_df = all_expenses_df[
-        (all_expenses_df['dataDocumento'].dt.date >= start_date) &
-        (all_expenses_df['dataDocumento'].dt.date <= end_date)
-    ].copy()
-    
-    if period_expenses_df.empty:
-        logging.warning(f"No flagged expenses found for the period {start_date} to {end_date}. No reports will be generated.")
-        return
+        return start_date, start_date + relativedelta(months=1) - timedelta(days=1)
+    raise ValueError(f"Invalid period specified: {period}")
+
+def _add_network_metrics(deputy_scores: pd.DataFrame) -> pd.DataFrame:
+    """
+    Adds each deputy's supplier concentration (HHI over their whole history)
+    and supplier community (see `src.supplier_network`), empty when the
+    network has not been analysed or the deputy has no community.
+    """
+    network = supplier_network.get_deputy_metrics()
+    if network.empty:
+        return deputy_scores.assign(supplier_hhi=float('nan'), supplier_community=pd.NA)
+    network = network.set_index('deputy_id')
+    community = network['community'].where(network['community'] > 0)
+    return deputy_scores.assign(
+        supplier_hhi=deputy_scores['deputy_id'].map(network['hhi']),
+        supplier_community=deputy_scores['deputy_id'].map(community).astype('Int64'),
+    )
 
-    logging.info(f"Found {len(period_expenses_df)} flagged expenses to report on for the period.")
+def _period_number(day) -> int:
+    return day.year * 100 + day.month
 
-    # Report 1: Deputy Scores Summary
-    deputy_scores = period_expenses_df.groupby(['deputy_id', 'deputy_name']).agg(
-        critical_expense_count=('score_fraude', lambda x: (x >= config.SCORE_THRESHOLD).sum()),
-        total_suspicious_expenses=('score_fraude', 'count'),
-        total_suspicious_value=('valorLiquido', 'sum'),
-        max_suspicion_score=('score_fraude', 'max'),
-        average_suspicion_score=('score_fraude', 'mean')
-    ).reset_index()
+class PeriodReportBuilder:
+    """
+    Accumulates the flagged expenses of a report period one deputy at a time,
+    keeping only the rows that fall inside the period. This lets the streaming
+    pipeline fold each deputy into the report as soon as its audit completes.
+    """
 
-    deputy_scores = deputy_scores.sort_values(
-        by=['critical_expense_count', 'average_suspicion_score'], ascending=[False, False]
-    )
+    def __init__(self, ref_date: datetime, period: str):
+        self.ref_date = ref_date
+        self.period = period
+        self.start_date, self.end_date = get_period_bounds(ref_date, period)
+        self._parts = {}
+
+    def add_deputy(self, position: int, deputy_id: int, deputy_name: str, flagged_df: pd.DataFrame):
+        """
+        Folds a deputy's flagged expenses into the report. `position` is the
+        deputy's index in the deputies list, so the final report does not depend
+        on the order in which audits complete.
+        """
+        if flagged_df is None or flagged_df.empty:
+            return
+        dates = pd.to_datetime(flagged_df['dataDocumento']).dt.date
+        in_period = flagged_df[(dates >= self.start_date) & (dates <= self.end_date)].copy()
+        if in_period.empty:
+            return
+        in_period['dataDocumento'] = pd.to_datetime(in_period['dataDocumento'])
+        # Fresh audit results may hold the document columns as numbers; format
+        # them as they read back from the CSV, so every run mode writes the same report.
+        for col in TEXT_COLUMNS:
+            if col in in_period.columns and not pd.api.types.is_string_dtype(in_period[col]):
+                in_period[col] = in_period[col].astype(str).where(in_period[col].notna())
+        in_period['deputy_id'] = deputy_id
+        in_period['deputy_name'] = deputy_name
+        self._parts[position] = in_period
+
+    def partial_rows(self) -> pd.DataFrame:
+        """
+        Returns the rows folded so far, with the deputy's `position` as a
+        column, e.g. to merge the reports of pipeline shards.
+        """
+        parts = [part.assign(position=position) for position, part in self._parts.items()]
+        return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=['position'])
+
+    def add_partial_rows(self, partial: pd.DataFrame):
+        """Folds rows returned by `partial_rows` of a builder of the same period into the report."""
+        if partial.empty:
+            return
+        partial = partial.assign(dataDocumento=pd.to_datetime(partial['dataDocumento']))
+        for position, part in partial.groupby('position'):
+            self._parts[int(position)] = part.drop(columns='position').reset_index(drop=True)
+
+    def build(self) -> tuple:
+        """Returns the (deputy_scores, critical_expenses) report frames, or (None, None)."""
+        if not self._parts:
+            return None, None
+        period_expenses_df = pd.concat(
+            [self._parts[position] for position in sorted(self._parts)], ignore_index=True
+        )
+        logging.info(f"Found {len(period_expenses_df)} flagged expenses to report on for the period.")
+
+        # Report 1: Deputy Scores Summary
+        deputy_scores = period_expenses_df.groupby(['deputy_id', 'deputy_name']).agg(
+            critical_expense_count=('score_fraude', lambda x: (x >= config.SCORE_THRESHOLD).sum()),
+            total_suspicious_expenses=('score_fraude', 'count'),
+            total_suspicious_value=('valorLiquido', 'sum'),
+            max_suspicion_score=('score_fraude', 'max'),
+            average_suspicion_score=('score_fraude', 'mean')
+        ).reset_index()
+        deputy_scores = _add_network_metrics(deputy_scores)
 
-    # Report 2: Critical Expenses
-    critical_expenses = period_expenses_df[period_expenses_df['score_fraude'] >= config.SCORE_THRESHOLD].copy()
-    critical_expenses = critical_expenses.sort_values(by='score_fraude', ascending=False)
-    
-    # Save reports
-    date_str = ref_date.strftime('%Y-%m-%d')
-    config.REPORTS_DIR.mkdir(exist_ok=True)
-    
-    deputy_scores_path = config.REPORTS_DIR / f"{date_str}_{period}_deputy_scores.csv"
-    critical_expenses_path = config.REPORTS_DIR / f"{date_str}_{period}_critical_expenses.csv"
-    
-    logging.info(f"Saving deputy scores summary to {deputy_scores_path}")
-    deputy_scores.to_csv(deputy_scores_path, index=False, float_format='%.2f')
-    
-    logging.info(f"Saving critical expenses report to {critical_expenses_path}")
-    critical_expenses.to_csv(critical_expenses_path, index=False, float_format='%.2f')
-
-    logging.info(f"--- {period.capitalize()} reports generated successfully. ---")
+        deputy_scores = deputy_scores.sort_values(
+            by=['critical_expense_count', 'average_suspicion_score'], ascending=[False, False]
+        )
+
+        # Report 2: Critical Expenses
+        critical_expenses = period_expenses_df[period_expenses_df['score_fraude'] >= config.SCORE_THRESHOLD].copy()
+        critical_expenses = critical_expenses.sort_values(by='score_fraude', ascending=False)
+        return deputy_scores, critical_expenses
+
+    def save(self) -> bool:
+        """Builds and saves both report CSVs. Returns False if there was nothing to report."""
+        deputy_scores, critical_expenses = self.build()
+        if deputy_scores is None:
+            logging.warning(f"No flagged expenses found for the period {self.start_date} to {self.end_date}. No reports will be generated.")
+            return False
+
+        # Save reports
+        date_str = self.ref_date.strftime('%Y-%m-%d')
+        config.REPORTS_DIR.mkdir(exist_ok=True)
+
+        deputy_scores_path = config.REPORTS_DIR / f"{date_str}_{self.period}_deputy_scores.csv"
+        critical_expenses_path = config.REPORTS_DIR / f"{date_str}_{self.period}_critical_expenses.csv"
+
+        logging.info(f"Saving deputy scores summary to {deputy_scores_path}")
+        deputy_scores.to_csv(deputy_scores_path, index=False, float_format='%.2f')
+
+        logging.info(f"Saving critical expenses report to {critical_expenses_path}")
+        critical_expenses.to_csv(critical_expenses_path, index=False, float_format='%.2f')
+
+        # Report 3: Spend Events (change points and anomalous months of the period's months)
+        spend_events = spend_series.get_events(_period_number(self.start_date), _period_number(self.end_date))
+        spend_events_path = config.REPORTS_DIR / f"{date_str}_{self.period}_spend_events.csv"
+        logging.info(f"Saving spend events report to {spend_events_path}")
+        spend_events.to_csv(spend_events_path, index=False, float_format='%.2f')
+
+        logging.info(f"--- {self.period.capitalize()} reports generated successfully. ---")
+        return True
+
+def build_period_report(deputies_df: pd.DataFrame, ref_date: datetime, period: str) -> PeriodReportBuilder:
+    """
+    Folds the flagged expenses of the given deputies into a period report.
+    Each deputy's position is their index label in `deputies_df`, so a subset
+    of the deputies list (e.g. a pipeline shard) keeps the global order.
+    """
+    builder = PeriodReportBuilder(ref_date, period)
+    logging.info(f"Report period defined from {builder.start_date.strftime('%Y-%m-%d')} to {builder.end_date.strftime('%Y-%m-%d')}.")
+    for position, deputy in deputies_df.iterrows():
+        builder.add_deputy(position, deputy['id'], deputy['nome'], load_deputy_flagged_expenses(deputy['id']))
+    return builder
+
+def generate_period_reports(deputies_df: pd.DataFrame, ref_date: datetime, period: str):
+    """
+    Generates and saves summary reports for a specified period (diário, semanal, mensal).
+    """
+    logging.info(f"Generating reports for period '{period}' with reference date {ref_date.date()}.")
+
+    try:
+        builder = build_period_report(deputies_df, ref_date, period)
+    except ValueError as e:
+        logging.error(str(e))
+        return
+    builder.save()
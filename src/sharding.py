@@ -0,0 +1,193 @@
+"""
+Sharding Module
+
+This module splits a pipeline run across N machines or processes
+(`main.py --shard i/N`). Deputies are assigned to shards by a stable hash of
+their ID, so every shard downloads and audits a disjoint slice of the Chamber
+into its own data tree, with its own API rate limit and CPU.
+
+Shards exchange their results through a shard directory (config.SHARDS_DIR by
+default; on several machines, a shared or synced directory):
+
+    peer_values/shard-i-of-N.csv          inputs of the peer baselines, written
+                                          after the download stage
+    network_spend/shard-i-of-N.csv        inputs of the supplier network, idem
+    series_spend/shard-i-of-N.csv         inputs of the spend series, idem
+    invoice_keys/shard-i-of-N.csv         inputs of the shared invoices, idem
+    reports/{date}_{period}/shard-i-of-N.csv
+                                          the shard's share of the period report
+    tables/shard-i-of-N.sqlite            the shard's rows of the raw and flagged
+                                          expense, aggregate, flag mask and raw
+                                          change tables
+    flagged/shard-i-of-N/{deputy_id}.csv  the shard's flagged expenses files
+
+The peer baselines, the supplier network, the seasonal indexes of the spend
+series and the shared invoices are Chamber-wide, so the audit stage of every
+shard waits for the inputs of all shards and computes the same results from
+them. `merge_shards` then combines the partial reports, flagged expenses files and
+tables into the global ones and rebuilds the search indexes. Since each deputy
+is audited with the same inputs and the report rows are merged in the order of
+the deputies list, the result is identical to a single-node run.
+"""
+import logging
+import shutil
+import zlib
+from pathlib import Path
+import pandas as pd
+from src import config, datastore, peer_baselines, reporter, shared_invoices, spend_series, supplier_network
+
+# Datastore tables each shard exports for the merged dashboards and search.
+SHARED_TABLES = (datastore.RAW_TABLE, datastore.FLAGGED_TABLE) + datastore.AGGREGATE_TABLES + (
+    datastore.FLAG_MASKS_TABLE, datastore.RAW_CHANGES_TABLE
+)
+
+class ShardError(Exception):
+    """Raised when shard outputs are missing or inconsistent."""
+
+# --- Assignment ---
+
+def parse_shard(text: str) -> tuple:
+    """Parses 'i/N' (1 <= i <= N) into (i, N)."""
+    try:
+        index, count = (int(part) for part in text.split("/"))
+    except ValueError:
+        raise ShardError(f"Invalid shard '{text}'. Use i/N, e.g. 1/4.")
+    if not 1 <= index <= count:
+        raise ShardError(f"Invalid shard '{text}': i must be between 1 and N.")
+    return index, count
+
+def shard_of(deputy_id: int, count: int) -> int:
+    """Returns the shard (1..count) a deputy belongs to. Stable across machines and runs."""
+    return zlib.crc32(str(int(deputy_id)).encode()) % count + 1
+
+def select_deputies(deputies_df: pd.DataFrame, index: int, count: int) -> pd.DataFrame:
+    """
+    Returns the shard's deputies. The index of the full deputies list is kept,
+    since it orders the rows of the merged reports.
+    """
+    return deputies_df[deputies_df['id'].map(lambda deputy_id: shard_of(deputy_id, count)) == index]
+
+def shard_name(index: int, count: int) -> str:
+    return f"shard-{index}-of-{count}"
+
+def _shard_dir(shard_dir) -> Path:
+    return Path(shard_dir) if shard_dir else config.SHARDS_DIR
+
+# --- Shard Outputs ---
+
+def export_peer_values(deputies_df: pd.DataFrame, index: int, count: int, shard_dir=None):
+    """Writes the peer baseline inputs of the shard's deputies."""
+    path = _shard_dir(shard_dir) / "peer_values" / f"{shard_name(index, count)}.csv"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    values = peer_baselines.load_values(deputies_df['id'])
+    values.to_csv(path, index=False)
+    logging.info(f"Saved {len(values)} peer baseline values of {shard_name(index, count)} to {path}")
+
+def export_network_spend(deputies_df: pd.DataFrame, index: int, count: int, shard_dir=None):
+    """Writes the supplier network inputs of the shard's deputies."""
+    path = _shard_dir(shard_dir) / "network_spend" / f"{shard_name(index, count)}.csv"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    spend = supplier_network.load_spend(deputies_df['id'])
+    spend.to_csv(path, index=False)
+    logging.info(f"Saved {len(spend)} supplier network rows of {shard_name(index, count)} to {path}")
+
+def export_series_spend(deputies_df: pd.DataFrame, index: int, count: int, shard_dir=None):
+    """Writes the spend series inputs of the shard's deputies."""
+    path = _shard_dir(shard_dir) / "series_spend" / f"{shard_name(index, count)}.csv"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    spend = spend_series.load_spend(deputies_df['id'])
+    spend.to_csv(path, index=False)
+    logging.info(f"Saved {len(spend)} spend series rows of {shard_name(index, count)} to {path}")
+
+def export_invoice_keys(deputies_df: pd.DataFrame, index: int, count: int, shard_dir=None):
+    """Writes the shared invoice inputs of the shard's deputies."""
+    path = _shard_dir(shard_dir) / "invoice_keys" / f"{shard_name(index, count)}.csv"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    keys = shared_invoices.load_keys(deputies_df['id'])
+    keys.to_csv(path, index=False)
+    logging.info(f"Saved {len(keys)} invoice keys of {shard_name(index, count)} to {path}")
+
+def _input_files(kind: str, count: int, shard_dir=None) -> list:
+    """Returns the input files of a kind from all shards, or raises ShardError if some are missing."""
+    paths = [_shard_dir(shard_dir) / kind / f"{shard_name(i, count)}.csv" for i in range(1, count + 1)]
+    missing = [path.name for path in paths if not path.exists()]
+    if missing:
+        raise ShardError(f"Missing {kind} of {missing}. Run the download stage on every shard first.")
+    return paths
+
+def peer_value_files(count: int, shard_dir=None) -> list:
+    """Returns the peer value files of all shards."""
+    return _input_files("peer_values", count, shard_dir)
+
+def network_spend_files(count: int, shard_dir=None) -> list:
+    """Returns the supplier network spend files of all shards."""
+    return _input_files("network_spend", count, shard_dir)
+
+def series_spend_files(count: int, shard_dir=None) -> list:
+    """Returns the spend series files of all shards."""
+    return _input_files("series_spend", count, shard_dir)
+
+def invoice_key_files(count: int, shard_dir=None) -> list:
+    """Returns the invoice key files of all shards."""
+    return _input_files("invoice_keys", count, shard_dir)
+
+def save_partial_report(builder: reporter.PeriodReportBuilder, index: int, count: int, shard_dir=None):
+    """Saves the shard's rows of a period report, with their position in the deputies list."""
+    report_dir = _shard_dir(shard_dir) / "reports" / f"{builder.ref_date.strftime('%Y-%m-%d')}_{builder.period}"
+    report_dir.mkdir(parents=True, exist_ok=True)
+    partial = builder.partial_rows()
+    partial.to_csv(report_dir / f"{shard_name(index, count)}.csv", index=False)
+    logging.info(f"Saved {len(partial)} report rows of {shard_name(index, count)} to {report_dir}")
+
+def export_tables(deputies_df: pd.DataFrame, index: int, count: int, shard_dir=None):
+    """Writes the shard's datastore rows and flagged expenses files."""
+    name = shard_name(index, count)
+    table_path = _shard_dir(shard_dir) / "tables" / f"{name}.sqlite"
+    table_path.parent.mkdir(parents=True, exist_ok=True)
+    datastore.export_deputy_tables(table_path, SHARED_TABLES, deputies_df['id'])
+
+    flagged_dir = _shard_dir(shard_dir) / "flagged" / name
+    if flagged_dir.exists():
+        shutil.rmtree(flagged_dir)
+    flagged_dir.mkdir(parents=True)
+    n_files = 0
+    for deputy_id in deputies_df['id']:
+        source = config.flagged_expenses_path(deputy_id)
+        if source.exists():
+            shutil.copyfile(source, flagged_dir / f"{deputy_id}.csv")
+            n_files += 1
+    logging.info(f"Saved the datastore tables and {n_files} flagged expenses files of {name} to {shard_dir or config.SHARDS_DIR}")
+
+# --- Merge ---
+
+def merge_shards(count: int, ref_date, period: str, shard_dir=None):
+    """
+    Combines the outputs of all shards into the global period reports, the
+    flagged expenses files and the datastore tables of this machine.
+    """
+    shard_dir = _shard_dir(shard_dir)
+    names = [shard_name(i, count) for i in range(1, count + 1)]
+    report_dir = shard_dir / "reports" / f"{ref_date.strftime('%Y-%m-%d')}_{period}"
+    missing = [name for name in names if not (report_dir / f"{name}.csv").exists()]
+    missing += [name for name in names if not (shard_dir / "tables" / f"{name}.sqlite").exists()]
+    missing += [name for name in names if not (shard_dir / "flagged" / name).exists()]
+    if missing:
+        raise ShardError(f"Missing outputs of {sorted(set(missing))} in {shard_dir}.")
+
+    # The reports carry the supplier network metrics and the spend series
+    # events; the shared invoices complete the Chamber-wide tables.
+    supplier_network.refresh(network_spend_files(count, shard_dir))
+    spend_series.refresh(series_spend_files(count, shard_dir))
+    shared_invoices.refresh(invoice_key_files(count, shard_dir))
+    builder = reporter.PeriodReportBuilder(ref_date, period)
+    for name in names:
+        builder.add_partial_rows(pd.read_csv(report_dir / f"{name}.csv", dtype=reporter.TEXT_COLUMNS))
+    builder.save()
+
+    for name in names:
+        for path in (shard_dir / "flagged" / name).glob("*.csv"):
+            target = config.flagged_expenses_path(path.stem)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(path, target)
+    datastore.merge_tables(SHARED_TABLES, [shard_dir / "tables" / f"{name}.sqlite" for name in names])
+    logging.info(f"Merged the outputs of {count} shards.")
@@ -0,0 +1,205 @@
+"""
+Shared Dataset Module
+
+This module publishes the current dataset served by the dashboards (the
+deputies list, every deputy's flagged expenses and the period reports) as
+uncompressed Arrow IPC files, which readers memory-map instead of parsing the
+CSVs. The text, number and date columns of a mapped frame point straight into
+the operating system's page cache, so every Streamlit session, page, API
+thread and process reading the same version shares a single copy of them in
+RAM. The columns pandas cannot view in place (booleans, which Arrow packs into
+bits, and numbers with missing values) are converted in each process.
+
+Each publication is a new version directory with a manifest of its files:
+
+    data/processed/dataset/v{N}/manifest.json
+    data/processed/dataset/v{N}/<path of the source CSV>.arrow
+    data/processed/dataset/CURRENT          name of the current version
+
+Files whose source CSV did not change since the previous version are
+hard-linked instead of rewritten. The `CURRENT` pointer is swapped atomically
+once the version is complete, so readers never see a partial version, and
+frames mapped from an older version stay valid after it is removed.
+
+The manifest records the signature (mtime and size) of each source CSV. A
+file is only served while its source still has that signature, so a reader
+never gets older data than the CSV on disk; otherwise it falls back to
+parsing the CSV. Mapped frames are read-only: writing to them in place raises
+an error, while derived frames (filters, `assign`, `copy`) are ordinary ones.
+"""
+import json
+import logging
+import os
+import shutil
+import threading
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+from src import config, reporter
+
+MANIFEST_FILE = "manifest.json"
+CURRENT_FILE = "CURRENT"
+
+_lock = threading.Lock()
+_manifest = (None, {})  # (current version directory, its entries)
+
+# --- Sources ---
+
+def _signature(path) -> list:
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+def _source_key(path) -> str:
+    return path.relative_to(config.ROOT_DIR).as_posix()
+
+def _read_flagged_expenses(path) -> pd.DataFrame:
+    return pd.read_csv(path, parse_dates=['dataDocumento'], dtype=reporter.TEXT_COLUMNS)
+
+def _read_report(path) -> pd.DataFrame:
+    return pd.read_csv(path, dtype=reporter.TEXT_COLUMNS)
+
+def _sources() -> list:
+    """Returns the CSVs the pages read, as (path, parser) pairs."""
+    sources = [(config.RAW_DATA_DIR / "deputados.csv", pd.read_csv)]
+    flagged_files = config.FLAGGED_EXPENSES_DIR.glob("*/flagged_expenses.csv")
+    sources += [(path, _read_flagged_expenses) for path in sorted(flagged_files)]
+    if config.REPORTS_DIR.exists():
+        sources += [(path, _read_report) for path in sorted(config.REPORTS_DIR.glob("*.csv"))]
+    return [(path, parser) for path, parser in sources if path.exists()]
+
+# --- Publishing ---
+
+def _versions() -> list:
+    """Returns the version directories, oldest first."""
+    if not config.SHARED_DATASET_DIR.exists():
+        return []
+    versions = [path for path in config.SHARED_DATASET_DIR.glob("v*") if path.is_dir() and path.name[1:].isdigit()]
+    return sorted(versions, key=lambda path: int(path.name[1:]))
+
+def _current_dir():
+    try:
+        name = (config.SHARED_DATASET_DIR / CURRENT_FILE).read_text().strip()
+    except FileNotFoundError:
+        return None
+    return config.SHARED_DATASET_DIR / name
+
+def _read_manifest(version_dir) -> dict:
+    try:
+        return json.loads((version_dir / MANIFEST_FILE).read_text())
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def _write_table(df: pd.DataFrame, path):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    with ipc.new_file(path, table.schema) as writer:
+        writer.write_table(table)
+
+def publish() -> bool:
+    """
+    Publishes the current CSVs as a new version of the shared dataset and makes
+    it current. Returns False if nothing changed since the current version.
+    """
+    previous_dir = _current_dir()
+    previous = _read_manifest(previous_dir) if previous_dir else {}
+    sources = _sources()
+    signatures = {_source_key(path): _signature(path) for path, _ in sources}
+    if previous and {key: entry['signature'] for key, entry in previous.items()} == signatures:
+        logging.info(f"Shared dataset {previous_dir.name} is up to date.")
+        return False
+
+    config.SHARED_DATASET_DIR.mkdir(parents=True, exist_ok=True)
+    versions = _versions()
+    version_dir = config.SHARED_DATASET_DIR / f"v{int(versions[-1].name[1:]) + 1 if versions else 1}"
+    version_dir.mkdir()
+    manifest, linked = {}, 0
+    for path, parser in sources:
+        key = _source_key(path)
+        target = version_dir / f"{key}.arrow"
+        target.parent.mkdir(parents=True, exist_ok=True)
+        entry = previous.get(key)
+        if entry is not None and entry['signature'] == signatures[key]:
+            try:
+                os.link(previous_dir / entry['file'], target)
+            except OSError:
+                shutil.copyfile(previous_dir / entry['file'], target)
+            manifest[key] = entry
+            linked += 1
+            continue
+        try:
+            _write_table(parser(path), target)
+        except (pa.ArrowException, ValueError) as e:
+            # Readers fall back to the CSV for entries that are not published.
+            logging.warning(f"Could not publish {key} to the shared dataset: {e}")
+            target.unlink(missing_ok=True)
+            continue
+        # A source rewritten while it was parsed is left to the next publication.
+        if _signature(path) != signatures[key]:
+            target.unlink(missing_ok=True)
+            continue
+        manifest[key] = {'file': f"{key}.arrow", 'signature': signatures[key]}
+    (version_dir / MANIFEST_FILE).write_text(json.dumps(manifest))
+
+    tmp_path = config.SHARED_DATASET_DIR / f"{CURRENT_FILE}.tmp"
+    tmp_path.write_text(version_dir.name)
+    os.replace(tmp_path, config.SHARED_DATASET_DIR / CURRENT_FILE)
+    logging.info(f"Published shared dataset {version_dir.name}: {len(manifest)} files "
+                 f"({len(manifest) - linked} rewritten, {linked} unchanged).")
+
+    for old_dir in _versions()[:-config.SHARED_DATASET_KEEP_VERSIONS]:
+        shutil.rmtree(old_dir, ignore_errors=True)
+    return True
+
+# --- Reading ---
+
+def _current_manifest() -> tuple:
+    """Returns the (version directory, entries) of the current version, re-read only after a swap."""
+    global _manifest
+    version_dir = _current_dir()
+    with _lock:
+        if _manifest[0] == version_dir:
+            return _manifest
+    entries = _read_manifest(version_dir) if version_dir else {}
+    with _lock:
+        _manifest = (version_dir, entries)
+    return version_dir, entries
+
+def _text_type(arrow_type):
+    if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+        return pd.StringDtype("pyarrow", na_value=np.nan)
+    return None
+
+def _is_viewed(column: pa.ChunkedArray) -> bool:
+    """Whether the pandas column of an Arrow column is a view of its mapped buffers."""
+    arrow_type = column.type
+    if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+        return True
+    numeric = pa.types.is_integer(arrow_type) or pa.types.is_floating(arrow_type) or pa.types.is_timestamp(arrow_type)
+    return numeric and column.null_count == 0 and column.num_chunks <= 1
+
+def read(path) -> pd.DataFrame:
+    """
+    Returns the published, memory-mapped frame of a source CSV, or None if the
+    current version does not have it or the CSV changed since it was published.
+    """
+    version_dir, entries = _current_manifest()
+    entry = entries.get(_source_key(path)) if version_dir else None
+    if entry is None or entry['signature'] != _signature(path):
+        return None
+    try:
+        source = pa.memory_map(str(version_dir / entry['file']))
+        table = ipc.open_file(source).read_all()
+    except (FileNotFoundError, pa.ArrowException):
+        # The version was removed after the manifest was read.
+        return None
+    # split_blocks keeps each column a view of its mapped buffer instead of
+    # consolidating same-typed columns into new arrays, and text columns stay
+    # Arrow strings instead of becoming Python objects.
+    df = table.to_pandas(split_blocks=True, types_mapper=_text_type)
+    df.attrs['mapped_columns'] = [
+        name for name, column in zip(table.column_names, table.columns) if _is_viewed(column)
+    ]
+    return df
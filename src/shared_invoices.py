@@ -0,0 +1,117 @@
+"""
+Shared Invoices Module
+
+This module finds invoices (same supplier, number, date and value) submitted
+by more than one deputy, which no single deputy's data can reveal. A hash of
+the invoice key of every expense is kept per month and deputy in the
+datastore, read from the raw monthly files and refreshed incrementally like
+the other month tables (see `src.month_tables`). After each refresh, the hashes
+found for more than one deputy are stored on their own, and the auditor uses
+them for the cross-deputy duplicate flag in every audit mode.
+"""
+import logging
+import numpy as np
+import pandas as pd
+from src import config, datastore, documents, month_tables
+
+INVOICE_KEY_COLUMNS = ['supplier_key', 'numDocumento', 'dataDocumento', 'valorLiquido']
+KEY_COLUMNS = ['periodo', 'deputy_id', 'invoice_hash']
+RAW_COLUMNS = ['cnpjCpfFornecedor', 'numDocumento', 'dataDocumento', 'valorLiquido']
+
+# --- Invoice Keys ---
+
+def invoice_key_hashes(df: pd.DataFrame) -> tuple:
+    """
+    Hashes the invoice key of every prepared expense (see
+    `auditor.prepare_expense_data`). Returns the hashes and a mask of the rows
+    whose key is usable (a known supplier and a non-zero document number).
+    """
+    number = df['numDocumento'].astype(str).str.replace(r'\.0$', '', regex=True).str.strip()
+    keys = df[INVOICE_KEY_COLUMNS].assign(numDocumento=number).astype(
+        {'dataDocumento': 'datetime64[ns]', 'valorLiquido': float}
+    )
+    valid = (df['supplier_key'] != '') & number.str.contains(r'[1-9]', regex=True)
+    return pd.util.hash_pandas_object(keys, index=False).to_numpy(), valid.to_numpy()
+
+def compute_keys(expenses: pd.DataFrame) -> pd.DataFrame:
+    """Hashes the usable invoice keys of raw expenses (see `month_tables.load_months`)."""
+    # The same parsing as the auditor's, so the hashes match the audited rows.
+    expenses = expenses.assign(dataDocumento=pd.to_datetime(expenses['dataDocumento'], errors='coerce'))
+    expenses = expenses.dropna(subset=['dataDocumento', 'valorLiquido']).reset_index(drop=True)
+    expenses['supplier_key'] = documents.normalize_documents(expenses['cnpjCpfFornecedor'])['supplier_key']
+    hashes, valid = invoice_key_hashes(expenses)
+    # SQLite integers are signed.
+    keys = expenses[['periodo', 'deputy_id']].assign(invoice_hash=hashes.view(np.int64))
+    return keys[valid].drop_duplicates().reset_index(drop=True)
+
+def load_keys(deputy_ids: list) -> pd.DataFrame:
+    """
+    Loads the invoice key hashes of the given deputies' expenses, e.g. to
+    combine the data of pipeline shards (see `src.sharding`).
+    """
+    files = month_tables.month_files()
+    return compute_keys(month_tables.load_months(files, sorted(files), RAW_COLUMNS, set(int(i) for i in deputy_ids)))
+
+# --- Storage ---
+
+def _ensure_tables(conn):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS "{datastore.INVOICE_KEYS_TABLE}" (
+            periodo INTEGER, deputy_id INTEGER, invoice_hash INTEGER
+        )""")
+    conn.execute(
+        f'CREATE INDEX IF NOT EXISTS "idx_{datastore.INVOICE_KEYS_TABLE}_periodo" '
+        f'ON "{datastore.INVOICE_KEYS_TABLE}" (periodo)'
+    )
+    conn.execute(
+        f'CREATE INDEX IF NOT EXISTS "idx_{datastore.INVOICE_KEYS_TABLE}_invoice_hash" '
+        f'ON "{datastore.INVOICE_KEYS_TABLE}" (invoice_hash)'
+    )
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS "{datastore.INVOICE_KEY_MONTHS_TABLE}" (
+            periodo INTEGER PRIMARY KEY, signature TEXT
+        )""")
+
+def analyze():
+    """Stores the invoice hashes found for more than one deputy."""
+    with datastore.connect() as conn:
+        conn.execute(f'DROP TABLE IF EXISTS "{datastore.SHARED_INVOICES_TABLE}"')
+        conn.execute(
+            f'CREATE TABLE "{datastore.SHARED_INVOICES_TABLE}" AS '
+            f'SELECT invoice_hash FROM "{datastore.INVOICE_KEYS_TABLE}" '
+            f'GROUP BY invoice_hash HAVING COUNT(DISTINCT deputy_id) > 1'
+        )
+        n_shared = conn.execute(f'SELECT COUNT(*) FROM "{datastore.SHARED_INVOICES_TABLE}"').fetchone()[0]
+    logging.info(f"Found {n_shared} invoices submitted by more than one deputy.")
+
+MONTH_TABLE = month_tables.MonthTable(
+    "Invoice keys", datastore.INVOICE_KEYS_TABLE, datastore.INVOICE_KEY_MONTHS_TABLE,
+    KEY_COLUMNS, RAW_COLUMNS, compute=compute_keys, ensure_tables=_ensure_tables,
+    analyze=analyze, analysis_table=datastore.SHARED_INVOICES_TABLE,
+)
+
+def refresh(key_files: list = None) -> int:
+    """
+    Updates the invoice keys of the months whose raw files changed since the
+    last refresh and finds the shared invoices again when anything changed.
+    Returns the number of months updated. With `key_files` (CSVs written by
+    `load_keys`, one per pipeline shard), the keys are replaced by theirs
+    whenever one of them changes.
+    """
+    if key_files:
+        return MONTH_TABLE.refresh_from_files(key_files, lambda paths: pd.concat(
+            [pd.read_csv(path, dtype={'invoice_hash': np.int64}) for path in paths], ignore_index=True
+        ))
+    return month_tables.refresh([MONTH_TABLE])[MONTH_TABLE.name]
+
+# --- Querying ---
+
+def get_shared_hashes() -> np.ndarray:
+    """Returns the hashes of the invoices submitted by more than one deputy."""
+    if not config.DATASTORE_FILE.exists():
+        return np.empty(0, dtype=np.uint64)
+    with datastore.connect() as conn:
+        if not datastore.get_table_columns(conn, datastore.SHARED_INVOICES_TABLE):
+            return np.empty(0, dtype=np.uint64)
+        rows = conn.execute(f'SELECT invoice_hash FROM "{datastore.SHARED_INVOICES_TABLE}"').fetchall()
+    return np.array([row[0] for row in rows], dtype=np.int64).view(np.uint64)
@@ -0,0 +1,238 @@
+"""
+Raw Snapshots Module
+
+This module keeps every version of the raw monthly expense files. The Chamber
+edits and removes expenses retroactively, so a re-download may differ from
+what was published before; overwriting the month file would lose the
+previous version.
+
+Each version of a month file is stored once, gzip-compressed, under the
+SHA-256 of its content (data/raw/snapshots/objects/ab/cdef...csv.gz), so
+identical downloads are deduplicated. The manifest table of the datastore
+lists the versions of every (deputy, month) in order. When a download is
+identical to the latest version, nothing is written: the month file keeps
+its modification time and the incremental stages do not recompute it. When
+it differs, the new version is stored, the month file is replaced atomically
+and the rows are compared with the previous version by `codDocumento`:
+
+    added       rows that were not in the previous version
+    removed     rows of the previous version that are gone
+    modified    rows whose fields changed (the changed columns are recorded)
+
+Additions are expected while a month is still open; changes to rows that
+were already published are the retroactive edits the auditor flags
+(flag_alterada_retroativamente) and the query API lists.
+"""
+import gzip
+import hashlib
+import logging
+import os
+from datetime import datetime
+from io import BytesIO
+import pandas as pd
+from src import config, datastore
+
+CHANGE_COLUMNS = ['deputy_id', 'periodo', 'codDocumento', 'change', 'changed_columns',
+                  'valor_anterior', 'valor_atual', 'old_sha256', 'new_sha256', 'detected_at']
+
+# Changes that alter expenses already published.
+RETROACTIVE_CHANGES = ('removed', 'modified')
+
+# --- Objects ---
+
+def _object_path(digest: str):
+    return config.SNAPSHOTS_DIR / "objects" / digest[:2] / f"{digest[2:]}.csv.gz"
+
+def _write_object(digest: str, content: bytes):
+    """Stores a version's content, unless an identical version is already stored."""
+    path = _object_path(digest)
+    if path.exists():
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    # mtime=0 makes the compressed object depend only on the content.
+    with open(tmp_path, "wb") as f, gzip.GzipFile(fileobj=f, mode="wb", mtime=0) as gz:
+        gz.write(content)
+    os.replace(tmp_path, path)
+
+def read_object(digest: str) -> bytes:
+    """Returns the content of a stored version."""
+    with gzip.open(_object_path(digest), "rb") as f:
+        return f.read()
+
+# --- Manifest ---
+
+def _ensure_tables(conn):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS "{datastore.RAW_SNAPSHOTS_TABLE}" (
+            deputy_id INTEGER, periodo INTEGER, version INTEGER, sha256 TEXT,
+            n_rows INTEGER, taken_at TEXT, PRIMARY KEY (deputy_id, periodo, version)
+        )""")
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS "{datastore.RAW_CHANGES_TABLE}" (
+            deputy_id INTEGER, periodo INTEGER, codDocumento TEXT, change TEXT, changed_columns TEXT,
+            valor_anterior REAL, valor_atual REAL, old_sha256 TEXT, new_sha256 TEXT, detected_at TEXT
+        )""")
+    conn.execute(
+        f'CREATE INDEX IF NOT EXISTS "idx_{datastore.RAW_CHANGES_TABLE}_deputy_id" '
+        f'ON "{datastore.RAW_CHANGES_TABLE}" (deputy_id)'
+    )
+
+def _latest_version(conn, deputy_id: int, period: int) -> tuple:
+    """Returns the (version, sha256) of the latest version of a month, or None."""
+    return conn.execute(
+        f'SELECT version, sha256 FROM "{datastore.RAW_SNAPSHOTS_TABLE}" '
+        f'WHERE deputy_id = ? AND periodo = ? ORDER BY version DESC LIMIT 1', (int(deputy_id), int(period))
+    ).fetchone()
+
+def _record_version(conn, deputy_id: int, period: int, version: int, digest: str, n_rows: int):
+    conn.execute(
+        f'INSERT INTO "{datastore.RAW_SNAPSHOTS_TABLE}" (deputy_id, periodo, version, sha256, n_rows, taken_at) '
+        f'VALUES (?, ?, ?, ?, ?, ?)',
+        (int(deputy_id), int(period), version, digest, n_rows, datetime.now().isoformat(timespec='seconds'))
+    )
+
+# --- Row Diffs ---
+
+def _document_keys(df: pd.DataFrame) -> pd.Series:
+    """
+    Identifies each row by its `codDocumento` (as text, so versions parsed
+    with other dtypes match) and its occurrence among rows with the same code.
+    """
+    codes = df['codDocumento'].astype(str).str.replace(r'\.0$', '', regex=True)
+    return codes + "#" + codes.groupby(codes).cumcount().astype(str)
+
+def diff_versions(old_content: bytes, new_content: bytes) -> pd.DataFrame:
+    """
+    Compares two versions of a month file row by row. Returns one row per
+    added, removed or modified expense, with the changed columns and values.
+    """
+    old = pd.read_csv(BytesIO(old_content), dtype=str, keep_default_na=False)
+    new = pd.read_csv(BytesIO(new_content), dtype=str, keep_default_na=False)
+    columns = [col for col in new.columns if col in old.columns]
+    if 'codDocumento' not in columns:
+        return pd.DataFrame(columns=CHANGE_COLUMNS)
+    old = old.set_index(_document_keys(old))[columns]
+    new = new.set_index(_document_keys(new))[columns]
+
+    common = old.index.intersection(new.index)
+    old_common, new_common = old.loc[common], new.loc[common]
+    differs = old_common.ne(new_common)
+    modified = common[differs.any(axis=1).to_numpy()]
+    changed_columns = differs.loc[modified].dot(differs.columns + ",").str.rstrip(",")
+
+    def rows(keys, change, source):
+        return pd.DataFrame({
+            'codDocumento': source.loc[keys, 'codDocumento'].str.replace(r'\.0$', '', regex=True),
+            'change': change,
+            'valor_anterior': pd.to_numeric(old.loc[keys, 'valorLiquido'], errors='coerce') if change != 'added' else None,
+            'valor_atual': pd.to_numeric(new.loc[keys, 'valorLiquido'], errors='coerce') if change != 'removed' else None,
+        }, index=keys)
+
+    frames = [
+        rows(new.index.difference(old.index, sort=False), 'added', new),
+        rows(old.index.difference(new.index, sort=False), 'removed', old),
+        rows(modified, 'modified', new).assign(changed_columns=changed_columns),
+    ]
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame(columns=CHANGE_COLUMNS)
+    return pd.concat(frames).reset_index(drop=True)
+
+# --- Storing Downloads ---
+
+def month_path(deputy_id: int, year: int, month: int):
+    return config.RAW_DATA_DIR / "expenses" / str(deputy_id) / f"{year}-{month:02d}.csv"
+
+def store_month(deputy_id: int, year: int, month: int, month_df: pd.DataFrame) -> bool:
+    """
+    Stores a downloaded month of a deputy's expenses as a new version if it
+    differs from the latest one, and replaces the month file with it. Returns
+    True if the month changed. A month file downloaded before snapshots
+    existed becomes the first version.
+    """
+    content = month_df.to_csv(index=False).encode("utf-8")
+    digest = hashlib.sha256(content).hexdigest()
+    period = year * 100 + month
+    path = month_path(deputy_id, year, month)
+
+    with datastore.connect() as conn:
+        _ensure_tables(conn)
+        latest = _latest_version(conn, deputy_id, period)
+        if latest is None and path.exists():
+            previous = path.read_bytes()
+            previous_digest = hashlib.sha256(previous).hexdigest()
+            _write_object(previous_digest, previous)
+            _record_version(conn, deputy_id, period, 1, previous_digest, previous.count(b"\n") - 1)
+            latest = (1, previous_digest)
+        if latest is not None and latest[1] == digest:
+            return False
+
+        _write_object(digest, content)
+        version = latest[0] + 1 if latest else 1
+        _record_version(conn, deputy_id, period, version, digest, len(month_df))
+        if latest is not None:
+            changes = diff_versions(read_object(latest[1]), content)
+            if not changes.empty:
+                changes = changes.assign(
+                    deputy_id=int(deputy_id), periodo=period, old_sha256=latest[1], new_sha256=digest,
+                    detected_at=datetime.now().isoformat(timespec='seconds'),
+                ).reindex(columns=CHANGE_COLUMNS)
+                placeholders = ", ".join("?" for _ in CHANGE_COLUMNS)
+                conn.executemany(
+                    f'INSERT INTO "{datastore.RAW_CHANGES_TABLE}" ({", ".join(CHANGE_COLUMNS)}) VALUES ({placeholders})',
+                    changes.astype(object).where(changes.notna(), None).itertuples(index=False, name=None)
+                )
+                datastore.mark_data_changed(conn)
+                retroactive = changes['change'].isin(RETROACTIVE_CHANGES).sum()
+                if retroactive:
+                    logging.warning(f"{retroactive} published expenses of deputy {deputy_id} in "
+                                    f"{year}-{month:02d} were retroactively modified or removed.")
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_bytes(content)
+    os.replace(tmp_path, path)
+    return True
+
+# --- Querying ---
+
+def get_versions(deputy_id: int, year: int, month: int) -> pd.DataFrame:
+    """Returns the stored versions of a month of a deputy's expenses, oldest first."""
+    if not config.DATASTORE_FILE.exists():
+        return pd.DataFrame()
+    with datastore.connect() as conn:
+        if not datastore.get_table_columns(conn, datastore.RAW_SNAPSHOTS_TABLE):
+            return pd.DataFrame()
+        return pd.read_sql_query(
+            f'SELECT * FROM "{datastore.RAW_SNAPSHOTS_TABLE}" WHERE deputy_id = ? AND periodo = ? ORDER BY version',
+            conn, params=[int(deputy_id), year * 100 + month]
+        )
+
+def load_version(deputy_id: int, year: int, month: int, version: int) -> pd.DataFrame:
+    """Loads a past version of a month of a deputy's expenses, or None if it does not exist."""
+    versions = get_versions(deputy_id, year, month)
+    match = versions[versions['version'] == version] if not versions.empty else versions
+    if match.empty:
+        return None
+    return pd.read_csv(BytesIO(read_object(match['sha256'].iloc[0])))
+
+def get_retroactive_changes(deputy_id: int = None) -> pd.DataFrame:
+    """Returns the retroactive modifications and removals detected, newest first."""
+    if not config.DATASTORE_FILE.exists():
+        return pd.DataFrame(columns=CHANGE_COLUMNS)
+    with datastore.connect() as conn:
+        if not datastore.get_table_columns(conn, datastore.RAW_CHANGES_TABLE):
+            return pd.DataFrame(columns=CHANGE_COLUMNS)
+        where, params = f"change IN ({', '.join('?' for _ in RETROACTIVE_CHANGES)})", list(RETROACTIVE_CHANGES)
+        if deputy_id is not None:
+            where, params = where + " AND deputy_id = ?", params + [int(deputy_id)]
+        return pd.read_sql_query(
+            f'SELECT {", ".join(CHANGE_COLUMNS)} FROM "{datastore.RAW_CHANGES_TABLE}" '
+            f'WHERE {where} ORDER BY detected_at DESC, rowid DESC', conn, params=params
+        )
+
+def get_modified_documents(deputy_id: int) -> set:
+    """Returns the `codDocumento` of a deputy's expenses that were modified after publication."""
+    changes = get_retroactive_changes(deputy_id)
+    return set(changes.loc[changes['change'] == 'modified', 'codDocumento'].astype(str))
@@ -0,0 +1,359 @@
+"""
+Spend Series Module
+
+This module keeps the monthly spend of every deputy per expense type (plus
+their total, as the TOTAL series) and detects two kinds of temporal events in
+those series:
+
+- change points: months where the deputy's spend shifts to a different level
+  and stays there, compared over a window before and after the month;
+- anomalous months: spend far above the deputy's own trailing history.
+
+Both are measured on seasonally adjusted spend. The seasonal index of each
+expense type is estimated from the Chamber-wide series (spend in each calendar
+month relative to its centred 12-month moving average), so that, e.g., the
+January recess or the year-end rush are not taken for breaks.
+
+All series are laid out as one (series x months) matrix and analysed at once
+with cumulative sums and sliding windows, in blocks of rows that bound the
+memory used. The monthly spend is read from the raw monthly files and
+refreshed incrementally like the other month tables (see `src.month_tables`):
+only the months whose files changed are re-read before the matrix is
+analysed again. The auditor flags expenses in the months of upward change
+points and anomalies, and the period reports list the events of the period.
+"""
+import logging
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from src import config, datastore, month_tables
+
+TOTAL_SERIES = "TOTAL"
+SPEND_COLUMNS = ['periodo', 'deputy_id', 'tipoDespesa', 'n_expenses', 'total_value']
+SPEND_RAW_COLUMNS = ['tipoDespesa', 'valorLiquido']
+BREAK_COLUMNS = ['deputy_id', 'tipoDespesa', 'periodo', 'direction', 'mean_before', 'mean_after', 'ratio', 't_stat']
+ANOMALY_COLUMNS = ['deputy_id', 'tipoDespesa', 'periodo', 'value', 'expected', 'z']
+EVENT_COLUMNS = ['deputy_id', 'deputy_name', 'tipoDespesa', 'periodo', 'event', 'direction',
+                 'baseline_value', 'observed_value', 'ratio', 'score']
+
+# Series analysed per block, which bounds the size of the sliding windows.
+BLOCK_ROWS = 2048
+
+# Bounds of the seasonal indexes, so a month with almost no Chamber-wide spend
+# cannot inflate the adjusted spend of that month.
+SEASONAL_INDEX_BOUNDS = (0.25, 4.0)
+
+# Floors of the dispersion estimates, so series at a constant level (e.g. a
+# fixed rent) do not produce infinite statistics: the standard error of the
+# log spend, and the robust scale as a share of the trailing median (and never
+# below config.SERIES_MIN_EXCESS reais).
+MIN_LOG_SE = 0.05
+MIN_SCALE_SHARE = 0.25
+
+# --- Spend ---
+
+def compute_spend(expenses: pd.DataFrame) -> pd.DataFrame:
+    """Sums raw expenses (see `month_tables.load_months`) per month, deputy and expense type."""
+    expenses = expenses.dropna(subset=['tipoDespesa', 'valorLiquido'])
+    spend = expenses.groupby(['periodo', 'deputy_id', 'tipoDespesa'], sort=True).agg(
+        n_expenses=('valorLiquido', 'size'),
+        total_value=('valorLiquido', 'sum'),
+    )
+    return spend.reset_index()[SPEND_COLUMNS]
+
+def load_spend(deputy_ids: list) -> pd.DataFrame:
+    """
+    Loads the monthly spend of the given deputies per expense type, e.g. to
+    combine the data of pipeline shards (see `src.sharding`).
+    """
+    files = month_tables.month_files()
+    return compute_spend(month_tables.load_months(files, sorted(files), SPEND_RAW_COLUMNS, set(int(i) for i in deputy_ids)))
+
+def _ensure_tables(conn):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS "{datastore.SERIES_SPEND_TABLE}" (
+            periodo INTEGER, deputy_id INTEGER, tipoDespesa TEXT, n_expenses INTEGER, total_value REAL
+        )""")
+    conn.execute(
+        f'CREATE INDEX IF NOT EXISTS "idx_{datastore.SERIES_SPEND_TABLE}_periodo" '
+        f'ON "{datastore.SERIES_SPEND_TABLE}" (periodo)'
+    )
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS "{datastore.SERIES_SPEND_MONTHS_TABLE}" (
+            periodo INTEGER PRIMARY KEY, signature TEXT
+        )""")
+
+# --- Series Matrix ---
+
+def _month_number(periods) -> np.ndarray:
+    """Converts YYYYMM periods to consecutive month numbers."""
+    periods = np.asarray(periods, dtype=np.int64)
+    return periods // 100 * 12 + periods % 100 - 1
+
+def _period_of(month_numbers) -> np.ndarray:
+    month_numbers = np.asarray(month_numbers, dtype=np.int64)
+    return month_numbers // 12 * 100 + month_numbers % 12 + 1
+
+def build_series(spend: pd.DataFrame) -> tuple:
+    """
+    Lays out the (periodo, deputy_id, tipoDespesa, total_value) rows as a
+    (series x months) matrix over consecutive months, adding each deputy's
+    TOTAL series. Months outside a deputy's first and last month with expenses
+    are NaN; months inside it without expenses of a type are 0. Returns the
+    matrix, the (deputy_id, tipoDespesa) of its rows and the month number of
+    its first column.
+    """
+    spend = spend[['periodo', 'deputy_id', 'tipoDespesa', 'total_value']]
+    totals = spend.groupby(['periodo', 'deputy_id'], as_index=False)['total_value'].sum()
+    spend = pd.concat([spend, totals.assign(tipoDespesa=TOTAL_SERIES)], ignore_index=True)
+    spend = spend.groupby(['deputy_id', 'tipoDespesa', 'periodo'], as_index=False)['total_value'].sum()
+
+    # The rows are sorted by series, so the series keep the order of their first rows.
+    row_codes = spend.groupby(['deputy_id', 'tipoDespesa'], sort=True).ngroup().to_numpy()
+    keys = spend[['deputy_id', 'tipoDespesa']].drop_duplicates().reset_index(drop=True)
+    months = _month_number(spend['periodo'])
+    first_month = int(months.min())
+    columns = months - first_month
+    matrix = np.zeros((len(keys), int(columns.max()) + 1))
+    matrix[row_codes, columns] = spend['total_value'].to_numpy(dtype=float)
+
+    deputy_codes, _ = pd.factorize(keys['deputy_id'])
+    active_from = np.full(deputy_codes.max() + 1, matrix.shape[1])
+    active_to = np.full(deputy_codes.max() + 1, -1)
+    np.minimum.at(active_from, deputy_codes[row_codes], columns)
+    np.maximum.at(active_to, deputy_codes[row_codes], columns)
+    month_range = np.arange(matrix.shape[1])
+    active = ((month_range >= active_from[deputy_codes][:, None])
+              & (month_range <= active_to[deputy_codes][:, None]))
+    matrix[~active] = np.nan
+    return matrix, keys, first_month
+
+def seasonal_index(matrix: np.ndarray, expense_types: pd.Series, first_month: int) -> np.ndarray:
+    """
+    Estimates the seasonal index of every row's expense type in every column:
+    the median, over the years, of the Chamber-wide spend of the type in that
+    calendar month relative to its centred 12-month moving average.
+    """
+    type_codes, _ = pd.factorize(expense_types)
+    chamber = pd.DataFrame(matrix).groupby(type_codes).sum().T
+    trend = chamber.rolling(12, center=True, min_periods=12).mean()
+    ratio = (chamber / trend.where(trend > 0)).replace([np.inf, -np.inf], np.nan)
+    calendar_months = (first_month + np.arange(matrix.shape[1])) % 12
+    by_calendar_month = ratio.groupby(calendar_months).median().reindex(range(12))
+    by_calendar_month = by_calendar_month.fillna(1.0)
+    by_calendar_month = by_calendar_month / by_calendar_month.mean()
+    index = by_calendar_month.clip(*SEASONAL_INDEX_BOUNDS).to_numpy()
+    return index[calendar_months][:, type_codes].T
+
+def _nan_median(windows: np.ndarray) -> tuple:
+    """Medians along the last axis ignoring NaN, and the number of values they cover."""
+    ordered = np.sort(windows, axis=-1)
+    counts = np.isfinite(ordered).sum(axis=-1)
+    low = np.take_along_axis(ordered, np.maximum((counts - 1) // 2, 0)[..., None], axis=-1)[..., 0]
+    high = np.take_along_axis(ordered, np.maximum(counts // 2, 0)[..., None], axis=-1)[..., 0]
+    return np.where(counts > 0, (low + high) / 2, np.nan), counts
+
+# --- Detection ---
+
+def detect_breaks(adjusted: np.ndarray) -> tuple:
+    """
+    Finds the change points of every row: splits where the mean log spend of
+    the SERIES_BREAK_WINDOW months after differs from the months before by at
+    least SERIES_BREAK_T standard errors, the mean spend changed by
+    SERIES_BREAK_RATIO and SERIES_MIN_EXCESS, and the statistic peaks within a
+    window on each side. Returns the rows, the columns where the new level
+    starts, the mean spend before and after, and the t statistics.
+    """
+    window = config.SERIES_BREAK_WINDOW
+    n_splits = adjusted.shape[1] - 2 * window + 1
+    if n_splits <= 0:
+        empty = np.empty(0)
+        return empty.astype(int), empty.astype(int), empty, empty, empty
+    valid = np.isfinite(adjusted)
+    values = np.where(valid, np.clip(adjusted, 0, None), 0.0)
+    logs = np.log1p(values)
+
+    def window_sums(x):
+        cumulative = np.concatenate([np.zeros((len(x), 1)), np.cumsum(x, axis=1)], axis=1)
+        sums = cumulative[:, window:] - cumulative[:, :-window]
+        return sums[:, :n_splits], sums[:, window:window + n_splits]
+
+    count_before, count_after = window_sums(valid.astype(float))
+    log_before, log_after = window_sums(logs)
+    square_before, square_after = window_sums(logs ** 2)
+    value_before, value_after = window_sums(values)
+
+    variance_before = np.clip(square_before - log_before ** 2 / window, 0, None) / (window - 1)
+    variance_after = np.clip(square_after - log_after ** 2 / window, 0, None) / (window - 1)
+    standard_error = np.maximum(np.sqrt((variance_before + variance_after) / window), MIN_LOG_SE)
+    complete = (count_before == window) & (count_after == window)
+    t_stat = np.where(complete, (log_after - log_before) / window / standard_error, 0.0)
+
+    mean_before, mean_after = value_before / window, value_after / window
+    ratio = config.SERIES_BREAK_RATIO
+    changed = (mean_after >= ratio * mean_before) | (mean_before >= ratio * mean_after)
+    candidate = (
+        complete & changed
+        & (np.abs(t_stat) >= config.SERIES_BREAK_T)
+        & (np.abs(mean_after - mean_before) >= config.SERIES_MIN_EXCESS)
+    )
+
+    # Keep the peak of the statistic: above the splits before it, not below the splits after it.
+    strength = np.abs(t_stat)
+    padding = np.full((len(strength), window), -np.inf)
+    padded = np.concatenate([padding, strength, padding], axis=1)
+    neighbours = sliding_window_view(padded, window, axis=1)
+    peak = (strength > neighbours[:, :n_splits].max(axis=-1)) & (strength >= neighbours[:, window + 1:].max(axis=-1))
+
+    rows, splits = np.nonzero(candidate & peak)
+    return (rows, splits + window, mean_before[rows, splits], mean_after[rows, splits], t_stat[rows, splits])
+
+def detect_anomalies(adjusted: np.ndarray) -> tuple:
+    """
+    Finds the anomalous months of every row: spend above the median of the
+    SERIES_ANOMALY_WINDOW preceding months by SERIES_ANOMALY_Z robust
+    z-scores. Returns the rows, columns, trailing medians and z-scores.
+    """
+    window = config.SERIES_ANOMALY_WINDOW
+    padded = np.concatenate([np.full((len(adjusted), window), np.nan), adjusted], axis=1)
+    history = sliding_window_view(padded, window, axis=1)[:, :adjusted.shape[1]]
+    median, counts = _nan_median(history)
+    deviation, _ = _nan_median(np.abs(history - median[..., None]))
+    scale = np.maximum(1.4826 * deviation, MIN_SCALE_SHARE * np.abs(median))
+    scale = np.maximum(scale, config.SERIES_MIN_EXCESS)
+    with np.errstate(invalid='ignore'):
+        z = (adjusted - median) / scale
+        anomalous = (counts >= config.SERIES_ANOMALY_MIN_HISTORY) & (z >= config.SERIES_ANOMALY_Z)
+    rows, columns = np.nonzero(anomalous)
+    return rows, columns, median[rows, columns], z[rows, columns]
+
+def compute_events(spend: pd.DataFrame) -> tuple:
+    """Computes the (breaks, anomalies) tables of all series of the monthly spend rows."""
+    if spend.empty:
+        return pd.DataFrame(columns=BREAK_COLUMNS), pd.DataFrame(columns=ANOMALY_COLUMNS)
+    matrix, keys, first_month = build_series(spend)
+    index = seasonal_index(matrix, keys['tipoDespesa'], first_month)
+    adjusted = matrix / index
+
+    breaks, anomalies = [], []
+    for start in range(0, len(matrix), BLOCK_ROWS):
+        block = slice(start, start + BLOCK_ROWS)
+        rows, columns, before, after, t_stat = detect_breaks(adjusted[block])
+        breaks.append(pd.DataFrame({
+            'row': rows + start, 'column': columns,
+            'mean_before': before, 'mean_after': after, 't_stat': t_stat,
+        }))
+        rows, columns, median, z = detect_anomalies(adjusted[block])
+        rows = rows + start
+        expected = median * index[rows, columns]
+        anomalies.append(pd.DataFrame({
+            'row': rows, 'column': columns,
+            'value': matrix[rows, columns], 'expected': expected, 'z': z,
+        }))
+
+    breaks = pd.concat(breaks, ignore_index=True)
+    breaks['direction'] = np.where(breaks['t_stat'] > 0, 'up', 'down')
+    breaks['ratio'] = breaks['mean_after'] / breaks['mean_before'].where(breaks['mean_before'] > 0)
+    anomalies = pd.concat(anomalies, ignore_index=True)
+    # The seasonal adjustment can make a month stand out whose actual spend barely changed.
+    anomalies = anomalies[anomalies['value'] - anomalies['expected'] >= config.SERIES_MIN_EXCESS]
+
+    def label(events, columns):
+        events = events.join(keys, on='row')
+        events['periodo'] = _period_of(first_month + events['column'].to_numpy())
+        return events[columns].reset_index(drop=True)
+    return label(breaks, BREAK_COLUMNS), label(anomalies, ANOMALY_COLUMNS)
+
+def analyze():
+    """Recomputes the change points and anomalous months from the stored spend."""
+    with datastore.connect() as conn:
+        spend = pd.read_sql_query(
+            f'SELECT periodo, deputy_id, tipoDespesa, SUM(total_value) AS total_value '
+            f'FROM "{datastore.SERIES_SPEND_TABLE}" GROUP BY periodo, deputy_id, tipoDespesa', conn
+        )
+    breaks, anomalies = compute_events(spend)
+    datastore.replace_table(datastore.SERIES_BREAKS_TABLE, breaks)
+    datastore.replace_table(datastore.SERIES_ANOMALIES_TABLE, anomalies)
+    logging.info(f"Spend series analysed: {len(breaks)} change points "
+                 f"({int((breaks['direction'] == 'up').sum())} upward), {len(anomalies)} anomalous months.")
+
+MONTH_TABLE = month_tables.MonthTable(
+    "Spend series", datastore.SERIES_SPEND_TABLE, datastore.SERIES_SPEND_MONTHS_TABLE,
+    SPEND_COLUMNS, SPEND_RAW_COLUMNS, compute=compute_spend, ensure_tables=_ensure_tables,
+    analyze=analyze, analysis_table=datastore.SERIES_BREAKS_TABLE,
+)
+
+def refresh(spend_files: list = None) -> int:
+    """
+    Updates the spend of the months whose raw files changed since the last
+    refresh and re-analyses the series when anything changed. Returns the
+    number of months updated. With `spend_files` (CSVs written by
+    `load_spend`, one per pipeline shard), the spend is replaced by theirs
+    whenever one of them changes.
+    """
+    if spend_files:
+        return MONTH_TABLE.refresh_from_files(spend_files, lambda paths: pd.concat(
+            [pd.read_csv(path, float_precision='round_trip') for path in paths], ignore_index=True
+        ))
+    return month_tables.refresh([MONTH_TABLE])[MONTH_TABLE.name]
+
+# --- Querying ---
+
+def get_deputy_events(deputy_id: int) -> pd.DataFrame:
+    """
+    Returns the (periodo, tipoDespesa) months of a deputy's expense types that
+    follow an upward change point (within SERIES_BREAK_WINDOW months) or are
+    anomalous. The TOTAL series is not included.
+    """
+    columns = ['periodo', 'tipoDespesa', 'quebra', 'atipico']
+    if not config.DATASTORE_FILE.exists():
+        return pd.DataFrame(columns=columns)
+    with datastore.connect() as conn:
+        if not datastore.get_table_columns(conn, datastore.SERIES_BREAKS_TABLE):
+            return pd.DataFrame(columns=columns)
+        breaks = pd.read_sql_query(
+            f'SELECT periodo, tipoDespesa FROM "{datastore.SERIES_BREAKS_TABLE}" '
+            f"WHERE deputy_id = ? AND direction = 'up' AND tipoDespesa != ?", conn, params=[int(deputy_id), TOTAL_SERIES]
+        )
+        anomalies = pd.read_sql_query(
+            f'SELECT periodo, tipoDespesa FROM "{datastore.SERIES_ANOMALIES_TABLE}" '
+            f'WHERE deputy_id = ? AND tipoDespesa != ?', conn, params=[int(deputy_id), TOTAL_SERIES]
+        )
+    window = config.SERIES_BREAK_WINDOW
+    after_break = breaks.loc[breaks.index.repeat(window)]
+    after_break = after_break.assign(
+        periodo=_period_of(_month_number(after_break['periodo']) + np.tile(np.arange(window), len(breaks)))
+    )
+    events = pd.concat([after_break.assign(quebra=True), anomalies.assign(atipico=True)], ignore_index=True)
+    events = events.assign(quebra=events['quebra'].eq(True), atipico=events['atipico'].eq(True))
+    events = events.groupby(['periodo', 'tipoDespesa'], as_index=False)[['quebra', 'atipico']].any()
+    return events[columns]
+
+def get_events(start_period: int, end_period: int) -> pd.DataFrame:
+    """
+    Returns the change points and anomalous months of all deputies between two
+    YYYYMM periods, with the deputies' names, strongest first.
+    """
+    if not config.DATASTORE_FILE.exists():
+        return pd.DataFrame(columns=EVENT_COLUMNS)
+    with datastore.connect() as conn:
+        if not datastore.get_table_columns(conn, datastore.SERIES_BREAKS_TABLE):
+            return pd.DataFrame(columns=EVENT_COLUMNS)
+        has_names = bool(datastore.get_table_columns(conn, datastore.DEPUTIES_TABLE))
+        name_sql = "d.nome" if has_names else "NULL"
+        join_sql = f'LEFT JOIN "{datastore.DEPUTIES_TABLE}" d ON d.id = e.deputy_id' if has_names else ""
+        events = pd.read_sql_query(f"""
+            SELECT e.deputy_id, {name_sql} AS deputy_name, e.tipoDespesa, e.periodo,
+                   'change_point' AS event, e.direction, e.mean_before AS baseline_value,
+                   e.mean_after AS observed_value, e.ratio, e.t_stat AS score
+            FROM "{datastore.SERIES_BREAKS_TABLE}" e {join_sql}
+            WHERE e.periodo BETWEEN ? AND ?
+            UNION ALL
+            SELECT e.deputy_id, {name_sql} AS deputy_name, e.tipoDespesa, e.periodo,
+                   'anomaly' AS event, 'up' AS direction, e.expected AS baseline_value,
+                   e.value AS observed_value, e.value / NULLIF(e.expected, 0) AS ratio, e.z AS score
+            FROM "{datastore.SERIES_ANOMALIES_TABLE}" e {join_sql}
+            WHERE e.periodo BETWEEN ? AND ?
+        """, conn, params=[int(start_period), int(end_period)] * 2)
+    order = events['score'].abs().sort_values(ascending=False, kind='stable').index
+    return events.loc[order].reset_index(drop=True)[EVENT_COLUMNS]
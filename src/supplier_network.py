@@ -0,0 +1,250 @@
+"""
+Supplier Network Module
+
+This module analyses the network of payments between deputies and suppliers
+over the whole history. The spend of every deputy with every supplier is kept
+as a sparse deputy x supplier matrix, from which it computes:
+
+- supplier concentration per deputy: the Herfindahl-Hirschman index (HHI) of
+  the deputy's supplier shares, and their largest supplier;
+- suppliers shared by unusually many deputies, compared with the other
+  suppliers paid by more than one deputy;
+- co-occurrence communities: groups of deputies linked by paying the same
+  rare suppliers, which suppliers everybody uses (airlines) cannot link.
+
+Every metric is a handful of sparse matrix products, so the whole Chamber
+history is analysed in seconds. The matrix is built from the monthly spend of
+each deputy with each supplier, read from the raw monthly files and refreshed
+incrementally like the other month tables (see `src.month_tables`). The auditor
+uses the results for the concentrated and shared supplier flags, and the
+period reports add each deputy's HHI and community.
+"""
+import logging
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+from src import config, datastore, documents, month_tables
+
+SPEND_COLUMNS = ['periodo', 'deputy_id', 'supplier_key', 'nomeFornecedor', 'n_expenses', 'total_value']
+SPEND_RAW_COLUMNS = ['cnpjCpfFornecedor', 'nomeFornecedor', 'valorLiquido']
+
+# --- Spend ---
+
+def compute_spend(expenses: pd.DataFrame) -> pd.DataFrame:
+    """Sums raw expenses (see `month_tables.load_months`) per month, deputy and supplier (CNPJ/CPF)."""
+    expenses = expenses.dropna(subset=['valorLiquido'])
+    expenses = expenses.assign(supplier_key=documents.normalize_documents(expenses['cnpjCpfFornecedor'])['supplier_key'])
+    expenses = expenses[expenses['supplier_key'] != '']
+    spend = expenses.groupby(['periodo', 'deputy_id', 'supplier_key'], sort=True).agg(
+        nomeFornecedor=('nomeFornecedor', 'first'),
+        n_expenses=('valorLiquido', 'size'),
+        total_value=('valorLiquido', 'sum'),
+    )
+    return spend.reset_index()[SPEND_COLUMNS]
+
+def load_spend(deputy_ids: list) -> pd.DataFrame:
+    """
+    Loads the monthly spend of the given deputies with each supplier, e.g. to
+    combine the data of pipeline shards (see `src.sharding`).
+    """
+    files = month_tables.month_files()
+    return compute_spend(month_tables.load_months(files, sorted(files), SPEND_RAW_COLUMNS, set(int(i) for i in deputy_ids)))
+
+def _ensure_tables(conn):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS "{datastore.NETWORK_SPEND_TABLE}" (
+            periodo INTEGER, deputy_id INTEGER, supplier_key TEXT, nomeFornecedor TEXT,
+            n_expenses INTEGER, total_value REAL
+        )""")
+    conn.execute(
+        f'CREATE INDEX IF NOT EXISTS "idx_{datastore.NETWORK_SPEND_TABLE}_periodo" '
+        f'ON "{datastore.NETWORK_SPEND_TABLE}" (periodo)'
+    )
+    conn.execute(
+        f'CREATE INDEX IF NOT EXISTS "idx_{datastore.NETWORK_SPEND_TABLE}_deputy_id" '
+        f'ON "{datastore.NETWORK_SPEND_TABLE}" (deputy_id)'
+    )
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS "{datastore.NETWORK_SPEND_MONTHS_TABLE}" (
+            periodo INTEGER PRIMARY KEY, signature TEXT
+        )""")
+
+# --- Network Metrics ---
+
+def build_matrix(pairs: pd.DataFrame) -> tuple:
+    """
+    Builds the sparse deputy x supplier spend matrix from (deputy_id,
+    supplier_key, total_value) rows. Returns the CSR matrix and the deputy IDs
+    and supplier keys of its rows and columns. Net refunds count as no spend.
+    """
+    deputy_codes, deputy_ids = pd.factorize(pairs['deputy_id'], sort=True)
+    supplier_codes, supplier_keys = pd.factorize(pairs['supplier_key'], sort=True)
+    matrix = sparse.coo_matrix(
+        (pairs['total_value'].clip(lower=0).to_numpy(dtype=float), (deputy_codes, supplier_codes)),
+        shape=(len(deputy_ids), len(supplier_keys)),
+    ).tocsr()
+    matrix.eliminate_zeros()
+    return matrix, np.asarray(deputy_ids), np.asarray(supplier_keys)
+
+def _communities(matrix: sparse.csr_matrix) -> np.ndarray:
+    """
+    Labels the communities of deputies (rows) linked by common rare suppliers,
+    numbered from 1 by decreasing size. Deputies without a link get 0.
+    """
+    n_deputies = matrix.shape[0]
+    paid = (matrix > 0).astype(np.int32).tocsc()
+    n_paying = paid.getnnz(axis=0)
+    rare = np.flatnonzero((n_paying >= 2) & (n_paying <= config.NETWORK_COMMUNITY_MAX_DEPUTIES))
+    rare_paid = paid[:, rare].tocsr()
+
+    # Number of rare suppliers each pair of deputies has in common.
+    common = (rare_paid @ rare_paid.T).tocsr()
+    common.setdiag(0)
+    common.data[common.data < config.NETWORK_COMMUNITY_MIN_COMMON] = 0
+    common.eliminate_zeros()
+    _, labels = connected_components(common, directed=False)
+
+    sizes = np.bincount(labels)
+    # Deterministic numbering: largest first, ties by the first member's row.
+    first_row = np.full(len(sizes), n_deputies)
+    np.minimum.at(first_row, labels, np.arange(n_deputies))
+    order = np.lexsort((first_row, -sizes))
+    number = np.zeros(len(sizes), dtype=int)
+    number[order] = np.arange(1, len(sizes) + 1)
+    return np.where(sizes[labels] > 1, number[labels], 0)
+
+def compute_network(pairs: pd.DataFrame, supplier_names: pd.Series) -> tuple:
+    """Computes the (deputies, suppliers) metric tables from the deputy x supplier spend."""
+    matrix, deputy_ids, supplier_keys = build_matrix(pairs)
+    n_deputies = matrix.shape[0]
+
+    totals = np.asarray(matrix.sum(axis=1)).ravel()
+    squares = np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel()
+    safe_totals = np.where(totals > 0, totals, np.nan)
+    top = np.asarray(matrix.argmax(axis=1)).ravel()
+    communities = _communities(matrix)
+    community_sizes = np.bincount(communities)
+    deputies = pd.DataFrame({
+        'deputy_id': deputy_ids.astype(int),
+        'total_value': totals,
+        'n_suppliers': matrix.getnnz(axis=1),
+        'hhi': squares / safe_totals ** 2,
+        'top_supplier_key': np.where(totals > 0, supplier_keys[top], None),
+        'top_supplier_share': np.asarray(matrix.max(axis=1).todense()).ravel() / safe_totals,
+        'community': communities,
+        'community_size': np.where(communities > 0, community_sizes[communities], 1),
+    })
+
+    n_paying = matrix.getnnz(axis=0)
+    log_paying = np.log(n_paying)
+    multi = n_paying >= 2
+    median = np.median(log_paying[multi]) if multi.any() else 0.0
+    mad = np.median(np.abs(log_paying[multi] - median)) if multi.any() else 0.0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shared_z = np.where(multi, (log_paying - median) / (1.4826 * mad), np.nan)
+    suppliers = pd.DataFrame({
+        'supplier_key': supplier_keys,
+        'nomeFornecedor': supplier_names.reindex(supplier_keys).to_numpy(),
+        'n_deputies': n_paying,
+        'total_value': np.asarray(matrix.sum(axis=0)).ravel(),
+        'shared_z': shared_z,
+    })
+    suppliers['is_shared'] = (
+        (suppliers['shared_z'] > config.NETWORK_SHARED_Z)
+        & (suppliers['n_deputies'] >= config.NETWORK_MIN_SHARED_DEPUTIES)
+        & (suppliers['n_deputies'] <= config.NETWORK_UBIQUITOUS_SHARE * n_deputies)
+    )
+    # Infinite z-scores (every multi-deputy supplier paid by as many deputies) are not stored.
+    suppliers['shared_z'] = suppliers['shared_z'].replace([np.inf, -np.inf], np.nan)
+    return deputies, suppliers
+
+def analyze():
+    """Recomputes the network metrics from the stored spend."""
+    with datastore.connect() as conn:
+        pairs = pd.read_sql_query(
+            f'SELECT deputy_id, supplier_key, SUM(total_value) AS total_value '
+            f'FROM "{datastore.NETWORK_SPEND_TABLE}" GROUP BY deputy_id, supplier_key', conn
+        )
+        names = pd.read_sql_query(
+            f'SELECT supplier_key, MAX(nomeFornecedor) AS nomeFornecedor '
+            f'FROM "{datastore.NETWORK_SPEND_TABLE}" GROUP BY supplier_key', conn
+        )
+    if pairs.empty:
+        return
+    deputies, suppliers = compute_network(pairs, names.set_index('supplier_key')['nomeFornecedor'])
+    datastore.replace_table(datastore.NETWORK_DEPUTIES_TABLE, deputies)
+    datastore.replace_table(datastore.NETWORK_SUPPLIERS_TABLE, suppliers)
+    logging.info(f"Supplier network analysed: {len(deputies)} deputies, {len(suppliers)} suppliers, "
+                 f"{int(suppliers['is_shared'].sum())} shared suppliers, "
+                 f"{deputies.loc[deputies['community'] > 0, 'community'].nunique()} communities.")
+
+MONTH_TABLE = month_tables.MonthTable(
+    "Supplier network spend", datastore.NETWORK_SPEND_TABLE, datastore.NETWORK_SPEND_MONTHS_TABLE,
+    SPEND_COLUMNS, SPEND_RAW_COLUMNS, compute=compute_spend, ensure_tables=_ensure_tables,
+    analyze=analyze, analysis_table=datastore.NETWORK_DEPUTIES_TABLE,
+)
+
+def refresh(spend_files: list = None) -> int:
+    """
+    Updates the spend of the months whose raw files changed since the last
+    refresh and recomputes the network metrics when anything changed. Returns
+    the number of months updated. With `spend_files` (CSVs written by
+    `load_spend`, one per pipeline shard), the spend is replaced by theirs
+    whenever one of them changes.
+    """
+    if spend_files:
+        return MONTH_TABLE.refresh_from_files(spend_files, lambda paths: pd.concat(
+            [pd.read_csv(path, dtype={'supplier_key': str}, float_precision='round_trip') for path in paths],
+            ignore_index=True
+        ))
+    return month_tables.refresh([MONTH_TABLE])[MONTH_TABLE.name]
+
+# --- Querying ---
+
+def get_deputy_suppliers(deputy_id: int) -> pd.DataFrame:
+    """
+    Returns, for each supplier a deputy paid, its share of the deputy's spend,
+    the deputy's HHI and whether the supplier is shared by unusually many deputies.
+    """
+    columns = ['supplier_key', 'participacao', 'hhi', 'compartilhado']
+    if not config.DATASTORE_FILE.exists():
+        return pd.DataFrame(columns=columns)
+    with datastore.connect() as conn:
+        if not datastore.get_table_columns(conn, datastore.NETWORK_SUPPLIERS_TABLE):
+            return pd.DataFrame(columns=columns)
+        suppliers = pd.read_sql_query(
+            f'SELECT s.supplier_key, MAX(SUM(s.total_value), 0) AS valor, n.is_shared AS compartilhado '
+            f'FROM "{datastore.NETWORK_SPEND_TABLE}" s '
+            f'LEFT JOIN "{datastore.NETWORK_SUPPLIERS_TABLE}" n ON n.supplier_key = s.supplier_key '
+            f'WHERE s.deputy_id = ? GROUP BY s.supplier_key', conn, params=[int(deputy_id)]
+        )
+        row = conn.execute(
+            f'SELECT hhi FROM "{datastore.NETWORK_DEPUTIES_TABLE}" WHERE deputy_id = ?', (int(deputy_id),)
+        ).fetchone()
+    total = suppliers['valor'].sum()
+    suppliers['participacao'] = suppliers['valor'] / total if total > 0 else np.nan
+    suppliers['hhi'] = row[0] if row else np.nan
+    suppliers['compartilhado'] = suppliers['compartilhado'].fillna(0).astype(bool)
+    return suppliers[columns]
+
+def get_deputy_metrics() -> pd.DataFrame:
+    """Returns the HHI, largest supplier and community of every deputy."""
+    if not config.DATASTORE_FILE.exists():
+        return pd.DataFrame()
+    with datastore.connect() as conn:
+        if not datastore.get_table_columns(conn, datastore.NETWORK_DEPUTIES_TABLE):
+            return pd.DataFrame()
+        return pd.read_sql_query(f'SELECT * FROM "{datastore.NETWORK_DEPUTIES_TABLE}"', conn)
+
+def get_shared_suppliers() -> pd.DataFrame:
+    """Returns the suppliers shared by unusually many deputies, most shared first."""
+    if not config.DATASTORE_FILE.exists():
+        return pd.DataFrame()
+    with datastore.connect() as conn:
+        if not datastore.get_table_columns(conn, datastore.NETWORK_SUPPLIERS_TABLE):
+            return pd.DataFrame()
+        return pd.read_sql_query(
+            f'SELECT * FROM "{datastore.NETWORK_SUPPLIERS_TABLE}" WHERE is_shared = 1 '
+            f'ORDER BY n_deputies DESC, total_value DESC', conn
+        )
@@ -0,0 +1,91 @@
+"""
+Supplier Profiles Module
+
+This module keeps a table of supplier company profiles in the datastore, built
+from the local CNPJ registry (see `src.cnpj_registry`). The auditor joins every
+deputy's expenses against it in one batch to evaluate the company-level flags.
+
+Profiles are cached between runs: a supplier is only looked up in the registry
+the first time it is seen. The table remembers which registry snapshot it was
+built from and is discarded when a new snapshot is installed, so profiles are
+only recomputed when the registry data actually changes.
+"""
+import logging
+import pandas as pd
+from src import cnpj_registry, datastore
+
+SNAPSHOT_KEY = "supplier_profiles_snapshot"
+
+PROFILE_COLUMNS = [
+    "situacao_cadastral", "data_situacao_cadastral", "data_inicio_atividade",
+    "cnae_fiscal_principal", "capital_social",
+]
+
+def _empty_profiles() -> pd.DataFrame:
+    return pd.DataFrame(columns=["supplier_key"] + PROFILE_COLUMNS)
+
+def _ensure_profiles_table(conn, snapshot: str):
+    """Creates the profiles table, dropping it first if it was built from another snapshot."""
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (SNAPSHOT_KEY,)).fetchone()
+    if row is None or row[0] != snapshot:
+        if row is not None:
+            logging.info(f"CNPJ registry snapshot changed ({row[0]} -> {snapshot}). Discarding supplier profiles.")
+        conn.execute(f'DROP TABLE IF EXISTS "{datastore.SUPPLIER_PROFILES_TABLE}"')
+        conn.execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (SNAPSHOT_KEY, snapshot)
+        )
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS "{datastore.SUPPLIER_PROFILES_TABLE}" (
+            supplier_key TEXT PRIMARY KEY, found INTEGER, situacao_cadastral INTEGER,
+            data_situacao_cadastral TEXT, data_inicio_atividade TEXT,
+            cnae_fiscal_principal TEXT, capital_social REAL
+        )""")
+
+def _read_profiles(conn, keys: list) -> pd.DataFrame:
+    """Reads the stored profiles of `keys` with one join against a temporary key table."""
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS profile_keys (supplier_key TEXT PRIMARY KEY)")
+    conn.execute("DELETE FROM profile_keys")
+    conn.executemany("INSERT OR IGNORE INTO profile_keys (supplier_key) VALUES (?)", ((key,) for key in keys))
+    return pd.read_sql_query(f"""
+        SELECT p.supplier_key, p.found, {', '.join(f'p.{col}' for col in PROFILE_COLUMNS)}
+        FROM profile_keys k
+        JOIN "{datastore.SUPPLIER_PROFILES_TABLE}" p ON p.supplier_key = k.supplier_key
+    """, conn)
+
+def get_profiles(supplier_keys: pd.Series) -> pd.DataFrame:
+    """
+    Returns the company profile of every CNPJ among `supplier_keys` (canonical
+    14-digit keys; CPFs and blanks are ignored), one row per supplier found in
+    the registry. Suppliers not profiled yet are looked up in one batch and
+    stored for later runs.
+    """
+    if not cnpj_registry.registry_exists():
+        return _empty_profiles()
+    keys = [key for key in pd.unique(supplier_keys.dropna()) if len(key) == 14]
+    if not keys:
+        return _empty_profiles()
+
+    snapshot = cnpj_registry.get_snapshot_id()
+    with datastore.connect() as conn:
+        _ensure_profiles_table(conn, snapshot)
+        stored = _read_profiles(conn, keys)
+        missing = sorted(set(keys) - set(stored['supplier_key']))
+        if missing:
+            found = cnpj_registry.lookup_cnpjs(missing)
+            found['supplier_key'] = found['cnpj'].astype('int64').astype(str).str.zfill(14)
+            new_profiles = pd.DataFrame({'supplier_key': missing}).merge(
+                found[['supplier_key'] + PROFILE_COLUMNS], on='supplier_key', how='left'
+            )
+            new_profiles.insert(1, 'found', new_profiles['supplier_key'].isin(found['supplier_key']).astype(int))
+            columns_sql = ", ".join(new_profiles.columns)
+            placeholders = ", ".join("?" for _ in new_profiles.columns)
+            rows = new_profiles.astype(object).where(new_profiles.notna(), None).itertuples(index=False, name=None)
+            conn.executemany(
+                f'INSERT OR REPLACE INTO "{datastore.SUPPLIER_PROFILES_TABLE}" ({columns_sql}) VALUES ({placeholders})',
+                rows
+            )
+            logging.info(f"Profiled {len(missing)} new suppliers ({int(new_profiles['found'].sum())} found in the registry).")
+            stored = pd.concat([stored, new_profiles], ignore_index=True) if not stored.empty else new_profiles
+
+    return stored[stored['found'] == 1][['supplier_key'] + PROFILE_COLUMNS].reset_index(drop=True)
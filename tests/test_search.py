@@ -0,0 +1,31 @@
+"""
+Global search over the datastore (see `src.datastore.search_expenses`).
+"""
+import io
+import pandas as pd
+import pytest
+from src import config, datastore
+
+# A month file whose only documents are numbers: pandas parses them as
+# integers, and the CNPJ 03.597.751/0001-25 loses its leading zero.
+RAW_CSV = """ano,mes,tipoDespesa,codDocumento,dataDocumento,numDocumento,valorLiquido,nomeFornecedor,cnpjCpfFornecedor
+2024,3,COMBUSTÍVEIS E LUBRIFICANTES.,7001,2024-03-04,1201,250.0,POSTO ZERO LTDA,03597751000125
+2024,3,PASSAGEM AÉREA,7002,2024-03-05,1202,900.0,AÉREA SA,11222333000181
+"""
+
+@pytest.fixture
+def datastore_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "DATASTORE_FILE", tmp_path / "expenses.db")
+    return config.DATASTORE_FILE
+
+@pytest.mark.parametrize("table", [datastore.RAW_TABLE, datastore.FLAGGED_TABLE])
+@pytest.mark.parametrize("query", ["03597751000125", "03.597.751/0001-25", "035977", "posto 03597751000125"])
+def test_search_finds_cnpj_with_leading_zero(datastore_file, table, query):
+    expenses = pd.read_csv(io.StringIO(RAW_CSV))
+    assert expenses['cnpjCpfFornecedor'].dtype.kind == 'i'
+    datastore.replace_deputy_rows(table, 204554, expenses)
+
+    results = datastore.search_expenses(query, table)
+
+    assert results['nomeFornecedor'].tolist() == ["POSTO ZERO LTDA"]
+    assert results['supplier_key'].tolist() == ["03597751000125"]